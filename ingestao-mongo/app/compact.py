@@ -0,0 +1,55 @@
+import os
+
+from dotenv import load_dotenv
+
+from .logging_config import setup_logging
+from .services.compaction import compact_collection_run
+from .services.writer import ParquetLayout
+
+load_dotenv()
+
+
+def run():
+    """
+    Job de compactação avulso (ex.: agendado depois da ingestão):
+
+        COMPACT_RUN_ID=20240101T030000Z
+        COMPACT_PREFIXES=mongo/<db>/<colecao>,mongo/<db>/<outra>
+
+    Usa os mesmos COMPACTION_* da compactação no fim do app.main e o layout
+    dos PARQUET_* (sem o CLUSTER_BY do catálogo: vale o PARQUET_SORT_BY).
+    """
+    logger = setup_logging()
+
+    bucket_name = os.getenv("BUCKET_NAME")
+    run_id = os.getenv("COMPACT_RUN_ID")
+    prefixes = [p.strip().rstrip("/") for p in os.getenv("COMPACT_PREFIXES", "").split(",") if p.strip()]
+
+    if not run_id or not prefixes:
+        raise ValueError("COMPACT_RUN_ID e COMPACT_PREFIXES são obrigatórios")
+
+    logger.info("🗜 Compactando run_id=%s em %s prefixos", run_id, len(prefixes))
+
+    failed = []
+    for prefix in prefixes:
+        try:
+            compact_collection_run(
+                bucket_name=bucket_name,
+                collection_prefix=prefix,
+                run_id=run_id,
+                target_file_bytes=int(os.getenv("COMPACTION_TARGET_FILE_MB", "512")) * 1024 * 1024,
+                row_group_rows=int(os.getenv("COMPACTION_ROW_GROUP_ROWS", "250000")),
+                min_files=int(os.getenv("COMPACTION_MIN_FILES", "2")),
+                layout=ParquetLayout.from_env(),
+            )
+        except Exception:
+            failed.append(prefix)
+            logger.exception("❌ Falha ao compactar %s — continuando", prefix)
+
+    logger.info("🎯 Compactação finalizada. Prefixos=%s Falhas=%s", len(prefixes), len(failed))
+    if failed:
+        raise RuntimeError(f"Falha na compactação de: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,13 +1,36 @@
 import json
 import os
+import threading
 from google.cloud import secretmanager
 
+_secret_client = None
+_secret_cache = {}
+_secret_lock = threading.Lock()
+
+
+def _get_secret_client():
+    global _secret_client
+    if _secret_client is None:
+        _secret_client = secretmanager.SecretManagerServiceClient()
+    return _secret_client
+
+
 def load_mongo_secret(secret_name: str) -> dict:
-    client = secretmanager.SecretManagerServiceClient()
+    """
+    Lê o secret do Secret Manager uma única vez por execução; chamadas
+    seguintes (inclusive de outras threads) usam o cache.
+    """
+    with _secret_lock:
+        if secret_name not in _secret_cache:
+            _secret_cache[secret_name] = _fetch_secret(secret_name)
+        return _secret_cache[secret_name]
+
+
+def _fetch_secret(secret_name: str) -> dict:
+    client = _get_secret_client()
     project_id = os.getenv("GCP_PROJECT")
     secret_path = f"projects/{project_id}/secrets/{secret_name}/versions/latest"
 
     response = client.access_secret_version(request={"name": secret_path})
     payload = response.payload.data.decode("utf-8")
     return json.loads(payload)
-
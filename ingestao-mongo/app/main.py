@@ -1,4 +1,7 @@
-from datetime import datetime, timezone
+from contextlib import nullcontext
+from functools import partial
+import itertools
+from datetime import datetime, timedelta, timezone
 import importlib
 from dotenv import load_dotenv
 import pytz
@@ -9,44 +12,350 @@ from google.cloud import bigquery
 
 from .logging_config import setup_logging
 from .config.config import load_mongo_secret
-from .mongo_client import MongoRepository
-from .services.extractor import build_mongo_query, build_projection, get_max_date_from_bq_table
-from .services.transformer import normalize_documents
-from .services.writer import dataframe_to_parquet_gcs
-from .services.chunking import chunked_cursor
+from .mongo_client import MongoRepository, close_mongo_clients
+from .models import CollectionConfig
+from .services.extractor import (
+    build_mongo_query, build_projection, derive_projection_fields, get_max_date_from_bq_table,
+    get_table_columns, projection_match_ratio, summarize_winning_plan,
+)
+from .services.transformer import normalize_documents, normalize_documents_arrow, normalize_documents_typed
+from .services.writer import dataframe_to_parquet_gcs, arrow_table_to_parquet_gcs, parquet_bytes_to_gcs, ParquetLayout, StreamingParquetWriter, run_blob_dir
+from .services.chunking import ChunkStats, chunked_cursor, chunked_cursor_by_bytes
+from .services.pipeline import run_staged_pipeline
+from .services.dedupe import StreamDeduplicator, dedupe_batches
+from .services.compaction import compact_collection_run
+from .services.scheduling import AdaptiveConcurrency, DurationHistory, timed
+from .services.backfill import BackfillLedger, build_time_slices
+from .services.metrics import CollectionMetrics, RunMetrics, current_metrics, emit, record_stage, timed_batches
+from .services.offload import EncodedBatch, encode_batch, get_process_pool, pack_batch, process_pool_workers, shutdown_process_pool
+from .services.watermark import WatermarkStore
+from .services.checkpoint import CollectionCheckpoint, IdSplitPlan
+from .services.change_stream import ChangeStreamReader, ResumeTokenStore
+from .services.partitioning import apply_id_range, build_id_ranges, compute_id_boundaries
 
 import os
 import json
+import threading
+import time
 
 load_dotenv()
 
-def _process_collection(row, project_id, run_ts, run_id, db_secret, start_date, end_date, batch_size=20000):
+_bq_client = None
+_bq_lock = threading.Lock()
+
+
+def _get_bigquery_client():
+    """Client BigQuery único do processo (compartilhado entre as threads)."""
+    global _bq_client
+    with _bq_lock:
+        if _bq_client is None:
+            _bq_client = bigquery.Client()
+        return _bq_client
+
+def _plan_id_ranges(row, project_id, db_secret, run_id, start_date=None, end_date=None, watermarks=None):
+    """
+    Divide a coleção em faixas de _id quando o catálogo define
+    SPLIT_PARTITIONS > 1 (somente STANDARD). Retorna [None] para extração
+    em cursor único.
+
+    As fronteiras saem dos documentos da janela incremental (mesma query
+    de _process_collection; no backfill, START_DATE/END_DATE inteiros): com
+    a coleção inteira, elas seguiriam o histórico e a janela cairia quase
+    toda na última faixa.
+
+    Com CHECKPOINTS, as fronteiras ficam no GCS e uma reexecução do mesmo
+    run_id usa as mesmas faixas (a amostra muda a cada execução).
+    """
+    n_splits = int(row.get("SPLIT_PARTITIONS") or 1)
+    if n_splits <= 1 or row.PIPELINE_TYPE != "STANDARD":
+        return [None]
+
     logger = setup_logging()
-    bq = bigquery.Client()  # cria client por thread (mais seguro)
 
-    # 1) Ler secret do Mongo
     mongo_secret = load_mongo_secret(db_secret)['connections'][0]
+    repo = MongoRepository(
+        mongo_secret=mongo_secret,
+        collection_name=row.SOURCE_TABLE_NAME
+    )
+
+    strategy = os.getenv("SPLIT_STRATEGY", "sample")
+
+    query = None
+    if row.FILTER_COLUMN:
+        incremental_ts = start_date or _resolve_incremental_ts(_get_bigquery_client(), watermarks, row, project_id)
+        query = build_mongo_query(row.FILTER_COLUMN, incremental_ts, end_date, row.get("FILTER_TYPE"))
+
+    plan = None
+    boundaries = None
+    if os.getenv("CHECKPOINTS", "false").lower() == "true":
+        plan = IdSplitPlan(
+            bucket_name=os.getenv("BUCKET_NAME"),
+            blob_path=f'mongo/_state/checkpoints/{mongo_secret["database_name"]}/{row.SOURCE_TABLE_NAME}_split.json',
+        )
+        boundaries = plan.load(run_id, n_splits, strategy)
+        if boundaries is not None:
+            logger.info("↩ [%s] Reaproveitando as fronteiras de _id do run_id=%s", row.SOURCE_TABLE_NAME, run_id)
+
+    if boundaries is None:
+        boundaries = compute_id_boundaries(repo, n_splits, strategy=strategy, query=query)
+        if plan is not None:
+            plan.save(run_id, n_splits, strategy, boundaries)
+
+    id_ranges = build_id_ranges(boundaries)
+
+    logger.info(
+        "🔀 [%s] Split por _id — faixas=%s estratégia=%s",
+        row.SOURCE_TABLE_NAME, len(id_ranges), strategy
+    )
+    return id_ranges
+
+
+def _derive_projection(bq, repo, row, project_id, config, query=None):
+    """
+    Projeção a partir das colunas da tabela de destino (TARGET_DATASET.
+    TARGET_TABLE_NAME ou PROJECTION_SOURCE_TABLE do catálogo, ex.: a tabela
+    Dataform que consome a landing). Sem a tabela, busca o documento inteiro.
+
+    Campos novos no Mongo só passam a ser extraídos depois de entrarem na
+    tabela de referência.
+
+    As colunas são conferidas com AUTO_PROJECTION_SAMPLE documentos da query:
+    se menos de AUTO_PROJECTION_MIN_MATCH delas existirem como campos (tabela
+    com colunas renomeadas ou derivadas), a projeção buscaria só o _id e o
+    job extrai o documento inteiro.
+    """
+    logger = setup_logging()
+    table_id = row.get("PROJECTION_SOURCE_TABLE") or f"{row.TARGET_DATASET}.{row.TARGET_TABLE_NAME}"
+
+    columns = get_table_columns(bq, project_id, table_id)
+    if not columns:
+        logger.info("[%s] Tabela %s sem schema — extraindo documento inteiro", row.SOURCE_TABLE_NAME, table_id)
+        return None
+
+    fields = derive_projection_fields(
+        columns, [row.FILTER_COLUMN, config.sort_field, *config.dedupe_keys, *config.types]
+    )
+
+    sample_size = int(os.getenv("AUTO_PROJECTION_SAMPLE", "20"))
+    if sample_size > 0:
+        sample = list(repo.find(query, None, limit=sample_size))
+        table_fields = [f for f in derive_projection_fields(columns, []) if f != "_id"]
+        ratio = projection_match_ratio(table_fields, sample)
+        if ratio < float(os.getenv("AUTO_PROJECTION_MIN_MATCH", "0.5")):
+            seen = set().union(*(doc.keys() for doc in sample))
+            logger.warning(
+                "⚠ [%s] Só %.0f%% das colunas de %s existem nos documentos amostrados (ausentes: %s) — "
+                "extraindo documento inteiro",
+                row.SOURCE_TABLE_NAME, ratio * 100, table_id, [f for f in table_fields if f not in seen][:10]
+            )
+            return None
+
+    logger.info("🎯 [%s] Projeção derivada de %s — campos=%s", row.SOURCE_TABLE_NAME, table_id, len(fields))
+    return build_projection(fields)
+
+
+def _log_query_plan(repo, row, query, projection):
+    """Loga o winningPlan da query e alerta quando cai em COLLSCAN."""
+    logger = setup_logging()
 
-    # 2) Conectar no Mongo (client por thread)
+    try:
+        summary, has_collscan = summarize_winning_plan(repo.explain_find(query, projection))
+    except Exception:
+        logger.exception("Falha no explain da coleção %s — seguindo sem plano", row.SOURCE_TABLE_NAME)
+        return
+
+    if has_collscan:
+        logger.warning(
+            "⚠ [%s] Query sem índice (COLLSCAN) — plano=%s FILTER_COLUMN=%s FILTER_TYPE=%s",
+            row.SOURCE_TABLE_NAME, summary, row.FILTER_COLUMN, row.get("FILTER_TYPE") or "expr"
+        )
+    else:
+        logger.info("🔎 [%s] Plano da query: %s", row.SOURCE_TABLE_NAME, summary)
+
+
+def _collection_key(row):
+    """Chave da coleção nos manifestos de estado (watermarks, durações)."""
+    return f"{row.TARGET_DATASET}.{row.TARGET_TABLE_NAME}"
+
+
+def _estimate_collection_seconds(row, db_secret, history):
+    """
+    Custo estimado da coleção para o agendamento: a duração histórica ou,
+    sem histórico, o tamanho (collStats/estimated_document_count) dividido
+    pela vazão média do histórico (SCHEDULER_DOCS_PER_SECOND sem nenhum).
+    """
+    seconds = history.seconds(_collection_key(row))
+    if seconds is not None:
+        return seconds
+
+    try:
+        mongo_secret = load_mongo_secret(db_secret)['connections'][0]
+        repo = MongoRepository(mongo_secret=mongo_secret, collection_name=row.SOURCE_TABLE_NAME)
+        stats = repo.collection_stats()
+    except Exception:
+        setup_logging().warning("⚠ [%s] Sem estimativa de tamanho — agendada por último", row.SOURCE_TABLE_NAME, exc_info=True)
+        return 0.0
+
+    rate = history.docs_per_second() or float(os.getenv("SCHEDULER_DOCS_PER_SECOND", "5000"))
+    return stats["count"] / rate
+
+
+def _finish_slice(ledger, row, time_slice, docs, slice_pending, slice_docs, run_id):
+    """Registra a fatia no ledger quando todas as suas faixas de _id terminaram."""
+    slice_key = (row.SOURCE_TABLE_NAME, time_slice)
+    slice_pending[slice_key] -= 1
+    slice_docs[slice_key] = slice_docs.get(slice_key, 0) + docs
+
+    if slice_pending[slice_key] == 0:
+        try:
+            ledger.mark_done(_collection_key(row), time_slice, slice_docs[slice_key], run_id)
+        except Exception:
+            setup_logging().exception("❌ Falha ao registrar a fatia %s de %s", time_slice.label, row.SOURCE_TABLE_NAME)
+
+
+def _run_task(limiter, run_metrics, row, project_id, run_ts, run_id, db_secret,
+              start_date, end_date, batch_size, id_range, watermarks, time_slice):
+    """
+    _process_collection dentro de uma vaga do limitador, com as métricas
+    por estágio da tarefa ativas; devolve (docs, segundos, retomada), com
+    retomada=True quando a tarefa partiu de um checkpoint.
+    """
+    with limiter.slot() if limiter is not None else nullcontext():
+        labels = [x.label for x in (id_range, time_slice) if x is not None]
+        metrics = CollectionMetrics(row.SOURCE_TABLE_NAME, "/".join([row.SOURCE_TABLE_NAME, *labels]))
+
+        status, docs = "failed", 0
+        try:
+            with metrics.activate():
+                docs, seconds = timed(
+                    _process_collection, row, project_id, run_ts, run_id, db_secret,
+                    start_date, end_date, batch_size, id_range, watermarks, time_slice
+                )
+            status = "success"
+            return docs, seconds, metrics.resumed
+        finally:
+            record = metrics.to_record(run_id, status, docs)
+            emit(record)
+            run_metrics.add(record)
+
+
+def _resolve_incremental_ts(bq, watermarks, row, project_id):
+    """
+    Início da janela incremental: watermark do store (menos a sobreposição
+    WATERMARK_OVERLAP_HOURS) ou, sem store/sem valor, MAX(DT) no BigQuery.
+    """
+    if watermarks is not None:
+        watermark = watermarks.get(_collection_key(row))
+        if watermark is not None:
+            overlap = timedelta(hours=int(os.getenv("WATERMARK_OVERLAP_HOURS", "24")))
+            return watermark - overlap
+
+        setup_logging().info("[%s] Sem watermark no store — usando MAX(DT) do BigQuery", row.SOURCE_TABLE_NAME)
+
+    return get_max_date_from_bq_table(
+        bq=bq,
+        project_id=project_id,
+        target_dataset=row.TARGET_DATASET,
+        target_table=row.TARGET_TABLE_NAME
+    )
+
+
+def _normalize_typed(batch, config, bucket_name, prefix, part_name, run_ts, run_id, quarantine_seq, partition_date=None):
+    """normalize_documents_typed + gravação das linhas em quarentena."""
+    table, quarantine = normalize_documents_typed(batch, config.types, on_error=config.type_errors)
+
+    if quarantine is not None:
+        arrow_table_to_parquet_gcs(
+            quarantine,
+            bucket_name=bucket_name,
+            prefix=f"{prefix}/_quarantine",
+            file_prefix=f"{part_name}_quarantine_{next(quarantine_seq):05d}",
+            ingest_ts=run_ts,
+            run_id=run_id,
+            partition_date=partition_date
+        )
+
+    return table
+
+
+def _compact_run(collections, rows_by_name, db_secret, run_id, max_workers):
+    """Compacta os parts gravados nesta execução pelas coleções concluídas."""
+    logger = setup_logging()
+    database_name = load_mongo_secret(db_secret)["connections"][0]["database_name"]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_map = {
+            executor.submit(
+                compact_collection_run,
+                bucket_name=os.getenv("BUCKET_NAME"),
+                collection_prefix=f"mongo/{database_name}/{rows_by_name[collection].SOURCE_TABLE_NAME}",
+                run_id=run_id,
+                target_file_bytes=int(os.getenv("COMPACTION_TARGET_FILE_MB", "512")) * 1024 * 1024,
+                row_group_rows=int(os.getenv("COMPACTION_ROW_GROUP_ROWS", "250000")),
+                min_files=int(os.getenv("COMPACTION_MIN_FILES", "2")),
+                layout=ParquetLayout.from_env(
+                    CollectionConfig.from_catalog_row(rows_by_name[collection], database_name).cluster_by
+                ),
+            ): collection
+            for collection in collections
+        }
+        for future in as_completed(future_map):
+            try:
+                future.result()
+            except Exception:
+                # os parts originais continuam válidos: só a compactação falhou
+                logger.exception("❌ Falha ao compactar a coleção %s — continuando", future_map[future])
+
+
+def _process_collection(row, project_id, run_ts, run_id, db_secret, start_date, end_date, batch_size=20000, id_range=None, watermarks=None, time_slice=None):
+    logger = setup_logging()
+
+    # backfill: a fatia substitui a janela e define o dt= da saída
+    partition_date = None
+    if time_slice is not None:
+        start_date, end_date = time_slice.start, time_slice.end
+        partition_date = time_slice.partition_date
+    bq = _get_bigquery_client()
+
+    # 1) Ler secret do Mongo (cache da execução)
+    mongo_secret = load_mongo_secret(db_secret)['connections'][0]
+
+    # 2) Conectar no Mongo (MongoClient compartilhado por conexão)
     repo = MongoRepository(
         mongo_secret=mongo_secret,
         collection_name=row.SOURCE_TABLE_NAME
     )
 
-    # 3) Buscar dados (STANDARD/FREE)
+    prefix = f'mongo/{mongo_secret["database_name"]}/{row.SOURCE_TABLE_NAME}'
+
+    # faixas de _id gravam no mesmo dt=/run_id/, com o rótulo da faixa no nome
+    part_name = row.SOURCE_TABLE_NAME if id_range is None else f"{row.SOURCE_TABLE_NAME}_{id_range.label}"
+    if time_slice is not None:
+        part_name = f"{part_name}_{time_slice.label}"
+
+    config = CollectionConfig.from_catalog_row(
+        row, mongo_secret["database_name"], type_errors=os.getenv("TYPE_ERRORS", "coerce")
+    )
+
+    cdc_reader = None
+    checkpoint = None
+    start_index = 0
+
+    # thread (padrão) | process: normalização + Parquet em um pool de processos;
+    # o cursor entrega BSON cru e a decodificação também vai para o pool
+    offload = os.getenv("NORMALIZE_MODE", "thread").lower() == "process"
+
+    # 3) Buscar dados (STANDARD/FREE/CDC)
     if row.PIPELINE_TYPE == "STANDARD":
-        incremental_ts = start_date or get_max_date_from_bq_table(
-            bq=bq,
-            project_id=project_id,
-            target_dataset=row.TARGET_DATASET,
-            target_table=row.TARGET_TABLE_NAME
-        )
+        incremental_ts = start_date or _resolve_incremental_ts(bq, watermarks, row, project_id)
         #query = build_mongo_query(row.FILTER_COLUMN, incremental_ts)
 
         query = None
         
         if row.FILTER_COLUMN:
-            query = build_mongo_query(row.FILTER_COLUMN, incremental_ts, end_date)
+            query = build_mongo_query(row.FILTER_COLUMN, incremental_ts, end_date, row.get("FILTER_TYPE"))
+
+        query = apply_id_range(query, id_range)
         
         projection = None
 
@@ -55,11 +364,82 @@ def _process_collection(row, project_id, run_ts, run_id, db_secret, start_date,
             if projection_list:  # lista não vazia
                 projection = build_projection(projection_list)
 
-        cursor = repo.find(query, projection, no_cursor_timeout=True, batch_size=batch_size)
+        if projection is None and os.getenv("AUTO_PROJECTION", "false").lower() == "true":
+            projection = _derive_projection(bq, repo, row, project_id, config, query)
+
+        if os.getenv("CHECKPOINTS", "false").lower() == "true":
+            checkpoint = CollectionCheckpoint(
+                bucket_name=os.getenv("BUCKET_NAME"),
+                blob_path=f'mongo/_state/checkpoints/{mongo_secret["database_name"]}/{part_name}.json',
+            )
+            window = {
+                "start": incremental_ts.isoformat() if isinstance(incremental_ts, datetime) else incremental_ts,
+                "end": end_date.isoformat() if isinstance(end_date, datetime) else end_date,
+            }
+
+            # com DEDUPE_KEYS a saída não segue a ordem de _id: sem retomada
+            # parcial, a execução que caiu recomeça do zero (os parts dela
+            # ficam registrados e são apagados)
+            resumed = checkpoint.open(
+                run_id, run_ts, window, id_range.bounds if id_range is not None else None,
+                resumable=not config.dedupe_keys,
+            )
+            if checkpoint.done:
+                logger.info("⏭ [%s] Já concluída no checkpoint (run_id=%s) — pulando", part_name, checkpoint.run_id)
+            else:
+                # grava no dt=/run_id/ do checkpoint, sem o que a execução
+                # anterior deixou fora do registro
+                run_ts, run_id = checkpoint.ingest_ts, checkpoint.run_id
+                checkpoint.discard_untracked_parts(
+                    f"{run_blob_dir(prefix, run_ts, run_id, partition_date)}/{part_name}_part_"
+                )
+
+            if resumed:
+                # duração parcial: fica fora do histórico do agendador
+                metrics = current_metrics()
+                if metrics is not None:
+                    metrics.resumed = True
+
+                if checkpoint.done:
+                    return checkpoint.docs
+
+                # retoma a partir do último _id gravado
+                start_index = checkpoint.next_index
+                if checkpoint.last_id is not None:
+                    resume_filter = {"_id": {"$gt": checkpoint.last_id}}
+                    query = {"$and": [query, resume_filter]} if query else resume_filter
+                logger.info(
+                    "↩ [%s] Retomando do checkpoint — run_id=%s parts=%s docs=%s",
+                    part_name, run_id, start_index, checkpoint.docs
+                )
+
+        # pre-flight: loga o plano uma vez por coleção (não por faixa)
+        if os.getenv("EXPLAIN_QUERY", "true").lower() == "true" and (id_range is None or id_range.index == 0):
+            _log_query_plan(repo, row, query, projection)
+
+        cursor = repo.find(query, projection, raw=offload, no_cursor_timeout=True, batch_size=batch_size)
+
+        if checkpoint is not None:
+            # ordem determinística: o último _id gravado marca o ponto de retomada
+            cursor = cursor.sort("_id", 1).allow_disk_use(True)
 
     elif row.PIPELINE_TYPE == "FREE":
         pipeline = json.loads(row.MONGO_QUERY)
-        cursor = repo.aggregate(pipeline, batch_size=batch_size)
+        cursor = repo.aggregate(pipeline, raw=offload, batch_size=batch_size)
+
+    elif row.PIPELINE_TYPE == "CDC":
+        token_store = ResumeTokenStore(
+            bucket_name=os.getenv("BUCKET_NAME"),
+            blob_path=f'mongo/_state/cdc/{mongo_secret["database_name"]}/{row.SOURCE_TABLE_NAME}.json',
+        )
+        cdc_reader = ChangeStreamReader(
+            repo=repo,
+            token_store=token_store,
+            run_id=run_id,
+            batch_size=batch_size,
+            flush_seconds=int(os.getenv("CDC_FLUSH_SECONDS", "60")),
+            max_seconds=int(os.getenv("CDC_MAX_SECONDS", "300")),
+        )
 
     else:
         raise ValueError(f"pipeline_type inválido: {row.PIPELINE_TYPE}")
@@ -68,23 +448,220 @@ def _process_collection(row, project_id, run_ts, run_id, db_secret, start_date,
     chunk_size = batch_size
     total_docs = 0
 
-    prefix = f'mongo/{mongo_secret["database_name"]}/{row.SOURCE_TABLE_NAME}'
-
-    for i, batch in enumerate(chunked_cursor(cursor, chunk_size)):
-        total_docs += len(batch)
-
-        df = normalize_documents(batch)
-
-        dataframe_to_parquet_gcs(
-            df=df,
-            bucket_name=os.getenv("BUCKET_NAME"),
+    # pandas (padrão) | arrow (conversão colunar, mesma saída)
+    transform_engine = os.getenv("TRANSFORM_ENGINE", "pandas").lower()
+    # part (padrão: um arquivo por batch) | stream (row groups, rola por tamanho)
+    writer_mode = os.getenv("WRITER_MODE", "part").lower()
+    bucket_name = os.getenv("BUCKET_NAME")
+    # CLUSTER_BY no catálogo (ou PARQUET_SORT_BY) ordena cada arquivo para o
+    # BigQuery pular row groups pelo min/max
+    layout = ParquetLayout.from_env(config.cluster_by)
+
+    on_file_closed = None
+    if checkpoint is not None:
+        # cada arquivo finalizado pelo writer em stream é registrado com o
+        # último _id do último batch gravado nele
+        def on_file_closed(index, blob_path, rows, last_id):
+            checkpoint.mark_part(index, blob_path, last_id, rows)
+
+    if writer_mode == "stream":
+        batch_writer = StreamingParquetWriter(
+            bucket_name=bucket_name,
             prefix=prefix,
-            file_prefix=f"{row.SOURCE_TABLE_NAME}_part_{i:05d}",
+            file_prefix=f"{part_name}_part",
             ingest_ts=run_ts,
-            run_id=run_id
+            run_id=run_id,
+            target_file_bytes=int(os.getenv("PARQUET_TARGET_FILE_MB", "512")) * 1024 * 1024,
+            upload_chunk_bytes=int(os.getenv("UPLOAD_CHUNK_MB", "16")) * 1024 * 1024,
+            partition_date=partition_date,
+            layout=layout,
+            # com checkpoint, a numeração continua a dos arquivos registrados
+            first_file_index=start_index,
+            on_file_closed=on_file_closed,
+        )
+    else:
+        batch_writer = nullcontext()
+
+    use_arrow = transform_engine == "arrow"
+    normalize = normalize_documents_arrow if use_arrow else normalize_documents
+
+    # TYPES no catálogo liga a saída tipada (colunas fora do mapa seguem string)
+    quarantine_seq = itertools.count()
+    if config.types:
+        use_arrow = True
+        normalize = partial(
+            _normalize_typed,
+            config=config,
+            bucket_name=bucket_name,
+            prefix=prefix,
+            part_name=part_name,
+            run_ts=run_ts,
+            run_id=run_id,
+            quarantine_seq=quarantine_seq,
+            partition_date=partition_date,
+        )
+
+    if offload:
+        pool = get_process_pool()
+        encode = partial(
+            encode_batch,
+            engine=transform_engine,
+            types=config.types,
+            type_errors=config.type_errors,
+            ingest_ts=run_ts,
+            run_id=run_id,
+            to_parquet=writer_mode != "stream",
+            layout=layout,
+        )
+
+        # a thread só empacota o BSON e espera o processo (sem segurar o GIL)
+        def normalize(batch):
+            return pool.submit(encode, pack_batch(batch)).result()
+
+    def normalize_timed(batch, _normalize=normalize):
+        start = time.perf_counter()
+        data = _normalize(batch)
+        # no modo process é a espera pelo pool; os estágios internos vêm no EncodedBatch
+        record_stage("offload_wait" if offload else "normalize", time.perf_counter() - start, len(batch))
+        return data
+
+    normalize = normalize_timed
+
+    # CHUNK_MAX_MB liga o corte por orçamento de bytes (BSON) em vez de BATCH_SIZE docs
+    chunk_stats = ChunkStats()
+    chunk_max_mb = os.getenv("CHUNK_MAX_MB")
+    if chunk_max_mb:
+        batches = chunked_cursor_by_bytes(
+            cursor,
+            max_bytes=int(float(chunk_max_mb) * 1024 * 1024),
+            max_docs=int(os.getenv("CHUNK_MAX_DOCS", "500000")),
+            stats=chunk_stats,
         )
+    else:
+        batches = chunked_cursor(cursor, chunk_size, stats=chunk_stats)
+    batches = timed_batches(batches)
+
+    # DEDUPE_KEYS no catálogo: só a versão mais recente (SORT_FIELD) de cada
+    # chave da janela chega ao writer
+    dedupe = bool(config.dedupe_keys) and cdc_reader is None
+    if dedupe:
+        deduplicator = StreamDeduplicator(
+            keys=config.dedupe_keys,
+            sort_field=config.sort_field,
+            max_memory_bytes=int(os.getenv("DEDUPE_MEMORY_MB", "512")) * 1024 * 1024,
+            partitions=int(os.getenv("DEDUPE_PARTITIONS", "32")),
+            tmp_dir=os.getenv("DEDUPE_TMP_DIR"),
+        )
+        batches = dedupe_batches(batches, deduplicator, chunk_size, raw_output=offload)
+
+    with batch_writer as stream_writer:
+
+        def write_batch(i, data, last_id=None):
+            if isinstance(data, EncodedBatch):
+                metrics = current_metrics()
+                if metrics is not None and data.stages:
+                    metrics.merge(data.stages)
+                if data.quarantine is not None:
+                    parquet_bytes_to_gcs(
+                        data.quarantine,
+                        bucket_name=bucket_name,
+                        prefix=f"{prefix}/_quarantine",
+                        file_prefix=f"{part_name}_quarantine_{next(quarantine_seq):05d}",
+                        ingest_ts=run_ts,
+                        run_id=run_id,
+                        partition_date=partition_date
+                    )
+                if data.parquet is not None:
+                    return parquet_bytes_to_gcs(
+                        data.parquet,
+                        bucket_name=bucket_name,
+                        prefix=prefix,
+                        file_prefix=f"{part_name}_part_{i:05d}",
+                        ingest_ts=run_ts,
+                        run_id=run_id,
+                        partition_date=partition_date
+                    )
+                data = data.data
+
+            if stream_writer is not None:
+                if use_arrow:
+                    stream_writer.write_table(data, marker=last_id)
+                else:
+                    stream_writer.write_dataframe(data, marker=last_id)
+                return
+
+            write_fn = arrow_table_to_parquet_gcs if use_arrow else dataframe_to_parquet_gcs
+            return write_fn(
+                data,
+                bucket_name=bucket_name,
+                prefix=prefix,
+                file_prefix=f"{part_name}_part_{i:05d}",
+                ingest_ts=run_ts,
+                run_id=run_id,
+                partition_date=partition_date,
+                layout=layout
+            )
 
-    logger.info("✅ [%s] Finalizado — docs=%s", row.SOURCE_TABLE_NAME, total_docs)
+        if checkpoint is not None:
+            # cada part gravado é registrado com o último _id do batch (no
+            # writer em stream, cada arquivo no on_file_closed); com dedupe o
+            # _id não serve para retomar, mas o registro apaga os parts se a
+            # execução cair
+            def normalize_with_id(batch, _normalize=normalize):
+                return _normalize(batch), batch[-1].get("_id"), len(batch)
+
+            def write_with_checkpoint(i, item, _write=write_batch):
+                data, last_id, n_docs = item
+                blob_path = _write(start_index + i, data, last_id)
+                if stream_writer is None:
+                    checkpoint.mark_part(start_index + i, blob_path, last_id, n_docs)
+
+            normalize, write_batch = normalize_with_id, write_with_checkpoint
+
+        if cdc_reader is not None:
+            # serial: o token só avança depois que o batch está gravado
+            for i, batch in enumerate(timed_batches(cdc_reader.batches(), stage="mongo_change_stream")):
+                total_docs += len(batch)
+                write_batch(i, normalize(batch))
+                # no writer em stream o arquivo só é finalizado no close
+                if stream_writer is None:
+                    cdc_reader.commit()
+
+        elif offload or os.getenv("STAGED_PIPELINE", "false").lower() == "true":
+            # o writer em stream é sequencial: um único uploader
+            upload_workers = 1 if stream_writer is not None else int(os.getenv("UPLOAD_WORKERS", "2"))
+            # no modo process cada thread de normalize ocupa um processo do pool
+            default_normalize_workers = process_pool_workers() if offload else 2
+
+            total_docs = run_staged_pipeline(
+                batches,
+                normalize=normalize,
+                write=write_batch,
+                label=part_name,
+                normalize_workers=int(os.getenv("NORMALIZE_WORKERS", str(default_normalize_workers))),
+                upload_workers=upload_workers,
+                queue_size=int(os.getenv("STAGE_QUEUE_SIZE", "4")),
+            )
+        else:
+            for i, batch in enumerate(batches):
+                total_docs += len(batch)
+                write_batch(i, normalize(batch))
+
+    if cdc_reader is not None:
+        # writer fechado: todos os batches estão no GCS
+        cdc_reader.commit()
+    else:
+        logger.info("📦 [%s] %s", part_name, chunk_stats.summary())
+
+    if checkpoint is not None:
+        # os arquivos de execuções anteriores já estão na contagem
+        checkpoint.finish()
+        total_docs = checkpoint.docs
+
+    if id_range is None:
+        logger.info("✅ [%s] Finalizado — docs=%s", row.SOURCE_TABLE_NAME, total_docs)
+    else:
+        logger.info("✅ [%s] Faixa %s finalizada — docs=%s", row.SOURCE_TABLE_NAME, id_range.label, total_docs)
     return total_docs
 
 
@@ -109,7 +686,8 @@ def run():
         logger.info("📌 Processando todas as collections ativas")
 
     run_ts = datetime.now()
-    run_id = run_ts.strftime("%Y%m%dT%H%M%SZ")
+    # RUN_ID fixo permite reexecutar o job retomando os checkpoints da execução
+    run_id = os.getenv("RUN_ID") or run_ts.strftime("%Y%m%dT%H%M%SZ")
     logger.info("🧾 run_id=%s dt_ingestao=%s", run_id, run_ts.isoformat())
 
     mongo_config_secret = load_mongo_secret(config_table)
@@ -118,7 +696,7 @@ def run():
     migration_config_table = mongo_config_secret['migration_config_table']
 
     # 1) Buscar config no catálogo BigQuery
-    bq = bigquery.Client()
+    bq = _get_bigquery_client()
 
     base_sql = f"""
         SELECT *
@@ -157,27 +735,188 @@ def run():
         logger.warning("⚠ Nenhuma coleção ativa encontrada no catálogo para %s", collections_env)
         return
 
+    # bq (padrão: MAX(DT) por coleção) | gcs (manifesto lido uma vez aqui)
+    watermarks = None
+    if os.getenv("WATERMARK_STORE", "bq").lower() == "gcs":
+        watermarks = WatermarkStore(
+            bucket_name=os.getenv("BUCKET_NAME"),
+            blob_path=os.getenv("WATERMARK_BLOB", "mongo/_state/watermarks.json"),
+        )
+        watermarks.load()
+
+    # fim da janela extraída: vira o watermark das coleções concluídas
+    window_end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else run_ts
+
+    # BACKFILL: START_DATE/END_DATE em fatias (dia/hora) extraídas em paralelo;
+    # as fatias concluídas ficam registradas e são puladas na reexecução
+    time_slices = [None]
+    ledger = None
+    if os.getenv("BACKFILL", "false").lower() == "true":
+        if not start_date or not end_date:
+            raise ValueError("BACKFILL exige START_DATE e END_DATE")
+
+        granularity = os.getenv("BACKFILL_SLICE", "day").lower()
+        time_slices = build_time_slices(
+            datetime.strptime(start_date, "%Y-%m-%d"), window_end, granularity
+        )
+        ledger = BackfillLedger(
+            bucket_name=os.getenv("BUCKET_NAME"),
+            blob_path=f"mongo/_state/backfill/{start_date}_{end_date}_{granularity}.json",
+        )
+        ledger.load()
+        logger.info("🧩 Backfill %s → %s em %s fatias (%s)", start_date, end_date, len(time_slices), granularity)
+
     max_workers = int(os.getenv("MAX_WORKERS", "3"))
     logger.info("Executando %s coleções em paralelo (max_workers=%s)", len(rows), max_workers)
 
+    # catalog (padrão: ordem do catálogo) | size (maior custo estimado primeiro)
+    history = None
+    if os.getenv("SCHEDULER", "catalog").lower() == "size":
+        history = DurationHistory(
+            bucket_name=os.getenv("BUCKET_NAME"),
+            blob_path=os.getenv("DURATION_HISTORY_BLOB", "mongo/_state/durations.json"),
+        )
+        history.load()
+
+    # o pool vai até MAX_WORKERS_CEILING e o limitador decide, por CPU e
+    # memória do container, quantas coleções rodam ao mesmo tempo
+    limiter = None
+    pool_size = max_workers
+    if os.getenv("ADAPTIVE_CONCURRENCY", "false").lower() == "true":
+        pool_size = int(os.getenv("MAX_WORKERS_CEILING", str(max_workers * 2)))
+        limiter = AdaptiveConcurrency(
+            initial=max_workers,
+            maximum=pool_size,
+            interval=float(os.getenv("ADAPTIVE_INTERVAL_SECONDS", "15")),
+        )
+        limiter.start()
+
+    run_metrics = RunMetrics(run_id)
     results = {}
-    errors = 0
+    failed = set()
+    pending = {}
+    durations = {}
+    # coleções com duração parcial nesta execução (checkpoint ou fatias
+    # já concluídas): não entram no histórico do agendador
+    partial = set()
+    slice_pending = {}
+    slice_docs = {}
+    rows_by_name = {row.SOURCE_TABLE_NAME: row for row in rows}
+
+    tasks = []
+    for row in rows:
+        try:
+            id_ranges = _plan_id_ranges(row, project_id, db_secret, run_id, start_date, end_date, watermarks)
+        except Exception:
+            failed.add(row.SOURCE_TABLE_NAME)
+            logger.exception("❌ Falha ao dividir a coleção %s — continuando", row.SOURCE_TABLE_NAME)
+            continue
+
+        slices = [None]
+        if ledger is not None and row.PIPELINE_TYPE == "STANDARD" and row.FILTER_COLUMN:
+            slices = [s for s in time_slices if not ledger.is_done(_collection_key(row), s)]
+            if len(slices) < len(time_slices):
+                partial.add(row.SOURCE_TABLE_NAME)
+                logger.info(
+                    "⏭ [%s] %s de %s fatias já concluídas — pulando",
+                    row.SOURCE_TABLE_NAME, len(time_slices) - len(slices), len(time_slices)
+                )
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_map = {
-            executor.submit(_process_collection, row, project_id, run_ts, run_id, db_secret, start_date, end_date, batch_size): row.SOURCE_TABLE_NAME
-            for row in rows
-        }
+        cost = _estimate_collection_seconds(row, db_secret, history) if history is not None else 0.0
+        n_tasks = len(id_ranges) * len(slices)
+        tasks += [
+            (cost / n_tasks, row, id_range, time_slice)
+            for time_slice in slices
+            for id_range in id_ranges
+        ]
+
+    if history is not None:
+        # o pool atende na ordem de submissão: maiores primeiro
+        tasks.sort(key=lambda task: task[0], reverse=True)
+        logger.info(
+            "📋 Ordem por custo estimado: %s",
+            ", ".join(f"{row.SOURCE_TABLE_NAME}{'' if r is None else '/' + r.label}≈{cost:,.0f}s" for cost, row, r, _ in tasks[:10])
+        )
+
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        future_map = {}
+        for _, row, id_range, time_slice in tasks:
+            future = executor.submit(
+                _run_task, limiter, run_metrics, row, project_id, run_ts, run_id, db_secret,
+                start_date, end_date, batch_size, id_range, watermarks, time_slice
+            )
+            future_map[future] = (row.SOURCE_TABLE_NAME, time_slice)
+            pending[row.SOURCE_TABLE_NAME] = pending.get(row.SOURCE_TABLE_NAME, 0) + 1
+            if time_slice is not None:
+                slice_key = (row.SOURCE_TABLE_NAME, time_slice)
+                slice_pending[slice_key] = slice_pending.get(slice_key, 0) + 1
 
         for future in as_completed(future_map):
-            collection = future_map[future]
+            collection, time_slice = future_map[future]
+            pending[collection] -= 1
             try:
-                results[collection] = future.result()
+                docs, seconds, resumed = future.result()
+                results[collection] = results.get(collection, 0) + docs
+                durations[collection] = durations.get(collection, 0.0) + seconds
+                if resumed:
+                    partial.add(collection)
             except Exception:
-                errors += 1
+                failed.add(collection)
                 logger.exception("❌ Falha na coleção %s — continuando", collection)
+            else:
+                if time_slice is not None:
+                    _finish_slice(
+                        ledger, rows_by_name[collection], time_slice, docs,
+                        slice_pending, slice_docs, run_id
+                    )
+
+            if history is not None and pending[collection] == 0 and collection not in failed | partial:
+                history.record(_collection_key(rows_by_name[collection]), durations[collection], results[collection])
+
+            # watermark só avança quando todas as faixas da coleção concluíram
+            row = rows_by_name[collection]
+            if (
+                watermarks is not None
+                and pending[collection] == 0
+                and collection not in failed
+                and row.PIPELINE_TYPE == "STANDARD"
+                and row.FILTER_COLUMN
+            ):
+                try:
+                    watermarks.commit(_collection_key(row), window_end, run_id)
+                except Exception:
+                    logger.exception("❌ Falha ao gravar watermark da coleção %s", collection)
+
+    if limiter is not None:
+        limiter.stop()
+
+    if history is not None:
+        try:
+            history.save(run_id)
+        except Exception:
+            logger.exception("❌ Falha ao gravar o histórico de durações")
+
+    close_mongo_clients()
+    shutdown_process_pool()
+
+    success = [c for c in results if c not in failed]
+
+    if os.getenv("RUN_SUMMARY", "true").lower() == "true":
+        try:
+            summary = run_metrics.write_summary(
+                bucket_name=os.getenv("BUCKET_NAME"),
+                blob_path=f'{os.getenv("RUN_SUMMARY_PREFIX", "mongo/_state/runs")}/{run_id}.json',
+                failed=failed,
+            )
+            # no log vai só o agregado; o detalhe por tarefa já saiu em cada collection_metrics
+            emit({k: v for k, v in summary.items() if k != "tasks"})
+        except Exception:
+            logger.exception("❌ Falha ao gravar o resumo da execução")
+
+    if os.getenv("COMPACTION", "false").lower() == "true" and success:
+        _compact_run(success, rows_by_name, db_secret, run_id, max_workers)
 
-    logger.info("🎯 Execução finalizada. Sucesso=%s Falhas=%s run_id=%s", len(results), errors, run_id)
+    logger.info("🎯 Execução finalizada. Sucesso=%s Falhas=%s run_id=%s", len(success), len(failed), run_id)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Any
 
 
@@ -16,3 +17,33 @@ class CollectionConfig:
     incremental_field: Optional[str] = None      # Ex: 'updatedAt'
     incremental_start_ts: Optional[str] = None   # Ex: '2020-01-01T00:00:00Z'
     gcs_output_prefix: str = ""       # Prefixo no GCS (ex: 'mongo/customers/')
+    type_errors: str = "coerce"       # 'coerce' (vira null) | 'quarantine' (linha separada)
+    cluster_by: List[str] = field(default_factory=list)  # Ordenação dos Parquet (ex: ['updatedAt'])
+
+    @classmethod
+    def from_catalog_row(cls, row, db_name: str, type_errors: str = "coerce") -> "CollectionConfig":
+        """
+        Monta a config a partir da linha do catálogo BigQuery. Colunas JSON
+        opcionais: PROJECTION (lista), TYPES (objeto), DEDUPE_KEYS (lista),
+        CLUSTER_BY (lista); SORT_FIELD e TYPE_ERRORS são texto.
+        """
+        return cls(
+            name=row.SOURCE_TABLE_NAME,
+            db_name=db_name,
+            source_table_name=row.SOURCE_TABLE_NAME,
+            projection=_json_column(row, "PROJECTION", []),
+            types=_json_column(row, "TYPES", {}),
+            dedupe_keys=_json_column(row, "DEDUPE_KEYS", []),
+            sort_field=row.get("SORT_FIELD") or "",
+            incremental_field=row.get("FILTER_COLUMN"),
+            gcs_output_prefix=f"mongo/{db_name}/{row.SOURCE_TABLE_NAME}",
+            type_errors=row.get("TYPE_ERRORS") or type_errors,
+            cluster_by=_json_column(row, "CLUSTER_BY", []),
+        )
+
+
+def _json_column(row, column: str, default):
+    value = row.get(column)
+    if not value:
+        return default
+    return json.loads(value)
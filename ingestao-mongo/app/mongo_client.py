@@ -1,34 +1,109 @@
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from urllib.parse import quote_plus
 import logging
+import os
+import threading
 
 logger = logging.getLogger("mongo_to_gcs.mongo_client")
 
+# Um MongoClient (com seu pool) por conexão, compartilhado entre as threads
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_mongo_client(mongo_secret: dict) -> MongoClient:
+    """
+    Retorna o MongoClient do processo para a conexão do secret, criando-o
+    na primeira chamada. MongoClient é thread-safe e mantém o próprio pool.
+    """
+    key = (
+        mongo_secret["database_hostname"],
+        mongo_secret["database_port"],
+        mongo_secret["database_username"],
+        mongo_secret["database_name"],
+    )
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_client(mongo_secret)
+            _clients[key] = client
+        return client
+
+
+def close_mongo_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def _create_client(mongo_secret: dict) -> MongoClient:
+    user = quote_plus(mongo_secret["database_username"])
+    pwd = quote_plus(mongo_secret["database_password"])
+    host = mongo_secret["database_hostname"]
+    port = mongo_secret["database_port"]
+    auth_db = mongo_secret["database_name"]
+
+    uri = f"mongodb://{user}:{pwd}@{host}:{port}/?authSource={auth_db}"
+    client = MongoClient(
+        uri,
+        connect=True,
+        serverSelectionTimeoutMS=100_000,
+        socketTimeoutMS=600_000,
+        connectTimeoutMS=100_000,
+        maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    )
+    # único log de conexão: os MongoRepository reaproveitam este client
+    logger.info("Conectado ao MongoDB %s:%s DB=%s (MongoClient novo)", host, port, auth_db)
+    return client
+
+
 class MongoRepository:
     def __init__(self, mongo_secret: dict, collection_name: str):
-        user = quote_plus(mongo_secret["database_username"])
-        pwd = quote_plus(mongo_secret["database_password"])
-        host = mongo_secret["database_hostname"]
-        port = mongo_secret["database_port"]
         auth_db = mongo_secret["database_name"]
 
-        uri = f"mongodb://{user}:{pwd}@{host}:{port}/?authSource={auth_db}"
-        self._client = MongoClient(
-            uri,
-            connect=True,
-            serverSelectionTimeoutMS=100_000,
-            socketTimeoutMS=600_000,
-            connectTimeoutMS=100_000
-        )
+        self._client = get_mongo_client(mongo_secret)
         self._db = self._client[auth_db]
         self._collection = self._db[collection_name]
+        self._collection_name = collection_name
+
+    def find(self, query, projection, raw: bool = False, **kwargs):
+        """Extração para pipelines STANDARD (raw=True devolve RawBSONDocument)"""
+        return self._reader(raw).find(query, projection, **kwargs)
+
+    def aggregate(self, pipeline: list, raw: bool = False, **kwargs):
+        """Extração para pipelines FREE (raw=True devolve RawBSONDocument)"""
+        return self._reader(raw).aggregate(pipeline, allowDiskUse=True, **kwargs)
+
+    def _reader(self, raw: bool):
+        # RawBSONDocument adia a decodificação do BSON para quem consome
+        if not raw:
+            return self._collection
+        return self._collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
 
-        logger.info("Conectado ao MongoDB DB=%s Collection=%s", auth_db, collection_name)
+    def watch(self, pipeline: list, **kwargs):
+        """Change stream para pipelines CDC"""
+        return self._collection.watch(pipeline, **kwargs)
 
-    def find(self, query, projection, **kwargs):
-        """Extração para pipelines STANDARD"""
-        return self._collection.find(query, projection, **kwargs)
+    def collection_stats(self) -> dict:
+        """
+        Tamanho da coleção: count e size (bytes) do collStats ou, sem
+        permissão para ele, só o estimated_document_count (metadado).
+        """
+        try:
+            stats = self._db.command("collStats", self._collection_name)
+            return {"count": stats.get("count", 0), "size": stats.get("size")}
+        except OperationFailure:
+            return {"count": self._collection.estimated_document_count(), "size": None}
 
-    def aggregate(self, pipeline: list, **kwargs):
-        """Extração para pipelines FREE"""
-        return self._collection.aggregate(pipeline, allowDiskUse=True, **kwargs)
\ No newline at end of file
+    def explain_find(self, query, projection=None):
+        """Plano da query (verbosity queryPlanner: não executa a busca)"""
+        command = {"find": self._collection_name, "filter": query or {}}
+        if projection:
+            command["projection"] = projection
+        return self._db.command({"explain": command, "verbosity": "queryPlanner"})
@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+
+from google.api_core import exceptions as gexc
+
+from .writer import get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.backfill")
+
+_SLICE_STEPS = {
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+}
+
+
+@dataclass(frozen=True)
+class TimeSlice:
+    """Fatia [start, end) da janela de backfill."""
+    index: int
+    start: datetime
+    end: datetime
+
+    @property
+    def label(self) -> str:
+        if self.end - self.start >= timedelta(days=1) and self.start.hour == 0:
+            return f"s{self.start:%Y%m%d}"
+        return f"s{self.start:%Y%m%dT%H}"
+
+    @property
+    def partition_date(self) -> date:
+        """Data dos dados da fatia: vira o dt= da saída."""
+        return self.start.date()
+
+
+def build_time_slices(start: datetime, end: datetime, granularity: str = "day") -> List[TimeSlice]:
+    """Divide [start, end) em fatias de um dia ou uma hora (a última pode ser menor)."""
+    step = _SLICE_STEPS.get(granularity)
+    if step is None:
+        raise ValueError(f"granularidade de backfill inválida: {granularity}")
+    if end <= start:
+        raise ValueError(f"janela de backfill vazia: {start} → {end}")
+
+    slices = []
+    lower = start
+    while lower < end:
+        upper = min(lower + step, end)
+        slices.append(TimeSlice(index=len(slices), start=lower, end=upper))
+        lower = upper
+    return slices
+
+
+class BackfillLedger:
+    """
+    Fatias já concluídas de um backfill, em um JSON no GCS (um por janela):
+
+        {"<dataset>.<tabela>": {"s20240101": {"docs": 123, "run_id": "...", "updated_at": "<iso>"}}}
+
+    Um backfill interrompido e reexecutado com a mesma janela pula as fatias
+    registradas. Gravações condicionadas à generation do objeto, como no
+    WatermarkStore.
+    """
+
+    max_commit_attempts = 5
+
+    def __init__(self, bucket_name: str, blob_path: str):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        entries, _ = self._read()
+        with self._lock:
+            self._entries = entries
+        done = sum(len(slices) for slices in entries.values())
+        logger.info(f"Backfill: {done} fatias já concluídas em gs://{self.bucket_name}/{self.blob_path}")
+        return entries
+
+    def is_done(self, key: str, time_slice: TimeSlice) -> bool:
+        with self._lock:
+            return time_slice.label in self._entries.get(key, {})
+
+    def mark_done(self, key: str, time_slice: TimeSlice, docs: int, run_id: str):
+        with self._lock:
+            for attempt in range(1, self.max_commit_attempts + 1):
+                entries, generation = self._read()
+                entries.setdefault(key, {})[time_slice.label] = {
+                    "docs": docs,
+                    "run_id": run_id,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                }
+
+                try:
+                    self._write(entries, generation)
+                except gexc.PreconditionFailed:
+                    logger.warning(f"Registro de backfill alterado por outra execução (tentativa {attempt}), relendo")
+                    continue
+
+                self._entries = entries
+                return
+
+        raise RuntimeError(
+            f"Não foi possível registrar a fatia {time_slice.label} de {key} após {self.max_commit_attempts} tentativas"
+        )
+
+    def _read(self):
+        blob = get_storage_client().bucket(self.bucket_name).get_blob(self.blob_path)
+        if blob is None:
+            return {}, 0
+        text = blob.download_as_text(encoding="utf-8", if_generation_match=blob.generation)
+        return json.loads(text), blob.generation
+
+    def _write(self, entries: dict, generation: int):
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(
+            json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True),
+            content_type="application/json",
+            if_generation_match=generation,
+        )
@@ -0,0 +1,131 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import json_util
+
+from .writer import get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.change_stream")
+
+# Só eventos de dados; drop/rename/invalidate encerram o stream
+_CDC_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}
+]
+
+
+class ResumeTokenStore:
+    """Resume token do change stream de uma coleção, em um JSON no GCS."""
+
+    def __init__(self, bucket_name: str, blob_path: str):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+
+    def load(self) -> Optional[dict]:
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        if not blob.exists():
+            return None
+        state = json.loads(blob.download_as_text(encoding="utf-8"))
+        return json_util.loads(json.dumps(state["resume_token"]))
+
+    def save(self, token: dict, run_id: str):
+        state = {
+            "resume_token": json.loads(json_util.dumps(token)),
+            "run_id": run_id,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(json.dumps(state), content_type="application/json")
+
+
+def change_event_to_document(event: dict) -> dict:
+    """
+    Evento do change stream -> linha de landing: o documento completo (ou só
+    o _id em deletes) mais _cdc_op e _cdc_cluster_time.
+    """
+    op = event["operationType"]
+
+    doc = None
+    if op != "delete":
+        # updateLookup devolve None se o documento foi removido depois
+        doc = event.get("fullDocument")
+    if doc is None:
+        doc = {"_id": event["documentKey"]["_id"]}
+    else:
+        doc = dict(doc)
+
+    doc["_cdc_op"] = op
+    doc["_cdc_cluster_time"] = event["clusterTime"].as_datetime()
+    return doc
+
+
+class ChangeStreamReader:
+    """
+    Lê o change stream da coleção em micro-batches para o writer.
+
+    batches() devolve um batch quando chega a batch_size eventos ou quando
+    passam flush_seconds desde o último; termina após max_seconds
+    (0 = contínuo). O token só é persistido quando o consumidor chama
+    commit() depois de gravar o batch (at-least-once).
+    """
+
+    def __init__(self, repo, token_store: ResumeTokenStore, run_id: str,
+                 batch_size: int, flush_seconds: int = 60, max_seconds: int = 300):
+        self.repo = repo
+        self.token_store = token_store
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_seconds = max_seconds
+
+        self._ready_token = None
+        self._saved_token = None
+
+    def batches(self):
+        token = self.token_store.load()
+        self._saved_token = token
+
+        kwargs = {}
+        if token is not None:
+            kwargs["resume_after"] = token
+        else:
+            logger.warning(
+                f"Sem resume token em gs://{self.token_store.bucket_name}/{self.token_store.blob_path} "
+                "— o stream começa agora (faça uma carga STANDARD para o histórico)"
+            )
+
+        deadline = None if self.max_seconds <= 0 else time.monotonic() + self.max_seconds
+
+        with self.repo.watch(_CDC_PIPELINE, full_document="updateLookup", max_await_time_ms=1000, **kwargs) as stream:
+            batch = []
+            batch_token = None
+            last_flush = time.monotonic()
+
+            while stream.alive and (deadline is None or time.monotonic() < deadline):
+                event = stream.try_next()
+                if event is not None:
+                    batch.append(change_event_to_document(event))
+                    batch_token = stream.resume_token
+
+                if batch and (len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_seconds):
+                    self._ready_token = batch_token
+                    yield batch
+                    batch = []
+                    last_flush = time.monotonic()
+
+            if batch:
+                self._ready_token = batch_token
+                yield batch
+
+            # sem eventos pendentes: o token pós-batch evita reler o oplog ocioso
+            if stream.resume_token is not None:
+                self._ready_token = stream.resume_token
+
+    def commit(self):
+        """Persiste o token do último batch entregue (chamar após gravá-lo)."""
+        if self._ready_token is None or self._ready_token == self._saved_token:
+            return
+        self.token_store.save(self._ready_token, self.run_id)
+        self._saved_token = self._ready_token
@@ -0,0 +1,218 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from bson import ObjectId, json_util
+
+from .writer import get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.checkpoint")
+
+
+class CollectionCheckpoint:
+    """
+    Checkpoint de extração de uma coleção (ou faixa de _id) em um JSON no GCS.
+
+    Guarda a janela extraída, o run_id/dt_ingestao de saída, os parts gravados
+    e o último _id do maior prefixo contíguo de parts concluídos. Com a
+    leitura ordenada por _id, retomar a partir desse _id não duplica nem
+    perde documentos.
+
+    Em coleções divididas por _id, o checkpoint também guarda os limites da
+    faixa: o rótulo (r000, r001, ...) só identifica a mesma faixa se as
+    fronteiras forem as mesmas.
+    """
+
+    def __init__(self, bucket_name: str, blob_path: str):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+        self.state = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return bool(self.state) and self.state["status"] == "done"
+
+    @property
+    def next_index(self) -> int:
+        return self.state["next_index"] if self.state else 0
+
+    @property
+    def last_id(self):
+        if not self.state or self.state["last_id"] is None:
+            return None
+        return json_util.loads(self.state["last_id"])
+
+    @property
+    def run_id(self) -> str:
+        return self.state["run_id"]
+
+    @property
+    def ingest_ts(self) -> datetime:
+        return datetime.fromisoformat(self.state["ingest_ts"])
+
+    @property
+    def docs(self) -> int:
+        return self.state["docs"] if self.state else 0
+
+    def open(self, run_id: str, ingest_ts: datetime, window: dict, id_range: dict = None,
+             resumable: bool = True) -> bool:
+        """
+        Carrega o checkpoint existente se for da mesma execução (run_id) ou da
+        mesma janela fechada; senão começa um novo. Janela aberta (sem fim)
+        só casa pelo run_id: os dados dela mudam entre execuções.
+
+        id_range são os limites da faixa de _id (IdRange.bounds). Se o
+        checkpoint casar mas for de outra faixa, o progresso não vale: os
+        parts registrados são apagados e a faixa recomeça do zero. O mesmo
+        vale com resumable=False (saída fora da ordem de _id, ex.: dedupe):
+        só a coleção concluída é reaproveitada.
+
+        Ao recomeçar um checkpoint que casou, a saída continua no dt=/run_id/
+        dele (run_id e ingest_ts do checkpoint, não os do argumento), onde
+        discard_untracked_parts encontra o que a execução anterior deixou.
+
+        Retorna True quando há progresso a reaproveitar (coleção concluída ou
+        parcial).
+        """
+        previous = self._read()
+
+        same_window = previous is not None and window.get("end") is not None and previous["window"] == window
+        if previous and (previous["run_id"] == run_id or same_window):
+            self.state = previous
+            run_id, ingest_ts = self.run_id, self.ingest_ts
+            if previous.get("id_range") != id_range:
+                logger.warning(
+                    f"Faixa de _id mudou desde o checkpoint ({previous.get('id_range')} -> {id_range}), "
+                    f"descartando gs://{self.bucket_name}/{self.blob_path}"
+                )
+                self._discard_parts(0)
+            elif self.done:
+                return True
+            elif not resumable:
+                logger.info(f"Checkpoint sem retomada parcial, recomeçando gs://{self.bucket_name}/{self.blob_path}")
+                self._discard_parts(0)
+            else:
+                self._discard_parts(self.next_index)
+                if self.next_index > 0:
+                    self._write()
+                    return True
+
+        self.state = {
+            "run_id": run_id,
+            "ingest_ts": ingest_ts.isoformat(),
+            "window": window,
+            "id_range": id_range,
+            "status": "running",
+            "parts": {},
+            "next_index": 0,
+            "last_id": None,
+            "docs": 0,
+        }
+        self._write()
+        return False
+
+    def mark_part(self, index: int, blob_path: str, last_id, docs: int):
+        """Registra um part gravado e avança o prefixo contíguo (thread-safe)."""
+        with self._lock:
+            self.state["parts"][str(index)] = {
+                "path": blob_path,
+                "last_id": json_util.dumps(last_id),
+                "docs": docs,
+            }
+
+            parts = self.state["parts"]
+            while str(self.state["next_index"]) in parts:
+                part = parts[str(self.state["next_index"])]
+                self.state["last_id"] = part["last_id"]
+                self.state["docs"] += part["docs"]
+                self.state["next_index"] += 1
+
+            self._write()
+
+    def finish(self, docs: int = None):
+        """Marca a coleção como concluída (docs sobrescreve a soma dos parts registrados)."""
+        with self._lock:
+            self.state["status"] = "done"
+            if docs is not None:
+                self.state["docs"] = docs
+            self._write()
+
+    def discard_untracked_parts(self, blob_prefix: str):
+        """
+        Apaga os arquivos {blob_prefix}NNNNN.parquet com índice a partir de
+        next_index: gravados por uma execução que caiu antes de registrá-los
+        (ex.: arquivo do writer em stream finalizado na queda). Seriam
+        duplicados pela retomada ou, no writer em stream, bloqueariam a
+        regravação do mesmo nome (if_generation_match=0).
+        """
+        bucket = get_storage_client().bucket(self.bucket_name)
+
+        for blob in bucket.list_blobs(prefix=blob_prefix):
+            index = blob.name[len(blob_prefix):].removesuffix(".parquet")
+            if index.isdigit() and int(index) >= self.next_index:
+                blob.delete()
+                logger.info(f"Arquivo sem registro no checkpoint descartado: gs://{self.bucket_name}/{blob.name}")
+
+    def _discard_parts(self, from_index: int):
+        """
+        Apaga os parts a partir de from_index. Na retomada são os gravados
+        depois de um buraco (pipeline em estágios), que não entram no prefixo
+        retomado e são regravados a partir do _id; com a faixa alterada, todos.
+        """
+        bucket = get_storage_client().bucket(self.bucket_name)
+        parts = self.state["parts"]
+
+        for index in [i for i in parts if int(i) >= from_index]:
+            path = parts.pop(index)["path"]
+            blob = bucket.blob(path)
+            if blob.exists():
+                blob.delete()
+            logger.info(f"Part descartado para retomada: gs://{self.bucket_name}/{path}")
+
+    def _read(self) -> Optional[dict]:
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text(encoding="utf-8"))
+
+    def _write(self):
+        self.state["updated_at"] = datetime.now(timezone.utc).isoformat()
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(json.dumps(self.state), content_type="application/json")
+
+
+class IdSplitPlan:
+    """
+    Fronteiras de _id do split de uma coleção, em um JSON no GCS. Uma
+    reexecução com o mesmo run_id (RUN_ID fixo) reaproveita as fronteiras em
+    vez de amostrar de novo, para os checkpoints das faixas continuarem
+    valendo.
+    """
+
+    def __init__(self, bucket_name: str, blob_path: str):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+
+    def load(self, run_id: str, n_splits: int, strategy: str) -> Optional[List[ObjectId]]:
+        """Fronteiras gravadas pela mesma execução com o mesmo split; None se não houver."""
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        if not blob.exists():
+            return None
+        plan = json.loads(blob.download_as_text(encoding="utf-8"))
+        if (plan["run_id"], plan["n_splits"], plan["strategy"]) != (run_id, n_splits, strategy):
+            return None
+        return [ObjectId(b) for b in plan["boundaries"]]
+
+    def save(self, run_id: str, n_splits: int, strategy: str, boundaries: List[ObjectId]):
+        plan = {
+            "run_id": run_id,
+            "n_splits": n_splits,
+            "strategy": strategy,
+            "boundaries": [str(b) for b in boundaries],
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(json.dumps(plan), content_type="application/json")
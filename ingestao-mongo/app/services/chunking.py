@@ -1,9 +1,92 @@
-def chunked_cursor(cursor, chunk_size: int):
+import os
+import resource
+
+import bson
+
+
+def chunked_cursor(cursor, chunk_size: int, stats: "ChunkStats" = None):
     batch = []
     for doc in cursor:
         batch.append(doc)
         if len(batch) >= chunk_size:
+            if stats is not None:
+                stats.observe(len(batch), 0)
             yield batch
             batch = []
     if batch:
-        yield batch
\ No newline at end of file
+        if stats is not None:
+            stats.observe(len(batch), 0)
+        yield batch
+
+
+class ChunkStats:
+    """
+    Resumo dos chunks de uma coleção: tamanho e pico de RSS do processo
+    durante a leitura. O RSS é do processo inteiro (inclui as coleções que
+    rodam ao mesmo tempo), não só desta coleção.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.docs = 0
+        self.bson_bytes = 0
+        self.peak_process_rss = 0
+
+    def observe(self, docs: int, bson_bytes: int):
+        self.chunks += 1
+        self.docs += docs
+        self.bson_bytes += bson_bytes
+        self.peak_process_rss = max(self.peak_process_rss, current_rss_bytes())
+
+    def summary(self) -> str:
+        avg_docs = self.docs / self.chunks if self.chunks else 0
+        text = f"chunks={self.chunks} docs/chunk={avg_docs:,.0f} "
+        if self.bson_bytes:
+            text += f"bson/chunk={self.bson_bytes / self.chunks / 1e6:.1f}MB "
+        return text + f"pico_rss_processo={self.peak_process_rss / 1e6:,.0f}MB"
+
+
+def chunked_cursor_by_bytes(cursor, max_bytes: int, max_docs: int = None, stats: ChunkStats = None):
+    """
+    Corta os batches por orçamento de bytes (tamanho BSON) em vez de contagem
+    fixa: documentos grandes geram chunks com menos documentos e documentos
+    pequenos, chunks maiores (até max_docs).
+
+    O tamanho é exato por documento: len(doc.raw) no cursor raw
+    (RawBSONDocument, sem custo extra) ou bson.encode nos demais.
+    """
+    batch = []
+    batch_bytes = 0
+
+    for doc in cursor:
+        batch.append(doc)
+        batch_bytes += bson_size(doc)
+
+        if batch_bytes >= max_bytes or (max_docs and len(batch) >= max_docs):
+            if stats is not None:
+                stats.observe(len(batch), batch_bytes)
+            yield batch
+            batch = []
+            batch_bytes = 0
+
+    if batch:
+        if stats is not None:
+            stats.observe(len(batch), batch_bytes)
+        yield batch
+
+
+def bson_size(doc) -> int:
+    """Tamanho BSON do documento."""
+    raw = getattr(doc, "raw", None)
+    if raw is not None:
+        return len(raw)
+    return len(bson.encode(doc))
+
+
+def current_rss_bytes() -> int:
+    """RSS atual do processo (Linux); fora dele, o pico do getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
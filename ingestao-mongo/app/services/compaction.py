@@ -0,0 +1,195 @@
+import json
+import logging
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .writer import ParquetLayout, StreamingParquetWriter, get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.compaction")
+
+
+def compact_collection_run(bucket_name: str, collection_prefix: str, run_id: str,
+                           target_file_bytes: int = 512 * 1024 * 1024,
+                           row_group_rows: int = 250_000, min_files: int = 2,
+                           layout: ParquetLayout = None) -> list:
+    """
+    Compacta todos os prefixos {collection_prefix}/dt=*/{run_id}/ da execução
+    (uma execução pode gravar mais de uma partição dt=). Retorna as
+    estatísticas dos prefixos compactados.
+    """
+    bucket = get_storage_client().bucket(bucket_name)
+    blobs = bucket.list_blobs(
+        prefix=f"{collection_prefix}/dt=",
+        match_glob=f"{collection_prefix}/dt=*/{run_id}/*.parquet",
+    )
+    run_prefixes = sorted({blob.name.rsplit("/", 1)[0] for blob in blobs})
+
+    results = []
+    for run_prefix in run_prefixes:
+        stats = compact_run_prefix(bucket_name, run_prefix, target_file_bytes, row_group_rows, min_files, layout)
+        if stats:
+            results.append(stats)
+    return results
+
+
+def compact_run_prefix(bucket_name: str, run_prefix: str,
+                       target_file_bytes: int = 512 * 1024 * 1024,
+                       row_group_rows: int = 250_000, min_files: int = 2,
+                       layout: ParquetLayout = None) -> Optional[dict]:
+    """
+    Junta os parts de um prefixo dt=/run_id/ em arquivos de ~target_file_bytes
+    com row groups de row_group_rows linhas (ordenados por layout.sort_by,
+    se houver).
+
+    Os arquivos novos são montados fora da tabela (mongo/_staging/compaction/)
+    e só então copiados para o prefixo; em seguida os originais são apagados.
+    O GCS não troca vários objetos de forma atômica, então entre a cópia e a
+    remoção os leitores podem ver linhas em dobro por alguns segundos. O
+    estado (mongo/_state/compaction/) registra cada fase: se o job cair no
+    meio, a próxima compactação do prefixo conclui a troca em vez de refazer.
+    """
+    compaction = _Compaction(bucket_name, run_prefix)
+    state = compaction.read_state()
+
+    if state is None or state["status"] == "running":
+        if state is not None:
+            # queda durante a montagem: descarta o que foi montado e recomeça
+            compaction.delete(compaction.list_staging())
+
+        originals = compaction.list_parts()
+        if len(originals) < min_files:
+            return None
+
+        state = {
+            "status": "running",
+            "file_prefix": f"{run_prefix.rsplit('/', 3)[-3]}_compacted_{datetime.now(timezone.utc):%Y%m%dT%H%M%S}",
+            "originals": originals,
+        }
+        compaction.write_state(state)
+
+        state["staged"], state["rows"] = compaction.stage(
+            originals, state["file_prefix"], target_file_bytes, row_group_rows, layout
+        )
+        state["status"] = "staged"
+        compaction.write_state(state)
+
+    if state["status"] == "staged":
+        state["final"] = compaction.publish(state["staged"])
+        state["status"] = "swapped"
+        compaction.write_state(state)
+
+    compaction.delete(state["originals"])
+    compaction.delete(state["staged"])
+    compaction.delete([compaction.state_path])
+
+    stats = {
+        "run_prefix": run_prefix,
+        "files_in": len(state["originals"]),
+        "files_out": len(state["final"]),
+        "rows": state["rows"],
+    }
+    logger.info(
+        f"🗜 Compactado gs://{bucket_name}/{run_prefix}: "
+        f"{stats['files_in']} → {stats['files_out']} arquivos, linhas={stats['rows']}"
+    )
+    return stats
+
+
+class _Compaction:
+    """Operações de GCS de uma compactação (um prefixo dt=/run_id/)."""
+
+    def __init__(self, bucket_name: str, run_prefix: str):
+        self.bucket_name = bucket_name
+        self.run_prefix = run_prefix
+        self.bucket = get_storage_client().bucket(bucket_name)
+
+        relative = run_prefix.split("/", 1)[1] if run_prefix.startswith("mongo/") else run_prefix
+        self.staging_dir = f"mongo/_staging/compaction/{relative}"
+        self.state_path = f"mongo/_state/compaction/{relative}.json"
+
+    def list_parts(self) -> list:
+        blobs = self.bucket.list_blobs(prefix=f"{self.run_prefix}/", match_glob=f"{self.run_prefix}/*.parquet")
+        return sorted(blob.name for blob in blobs)
+
+    def list_staging(self) -> list:
+        return [blob.name for blob in self.bucket.list_blobs(prefix=f"{self.staging_dir}/")]
+
+    def stage(self, originals: list, file_prefix: str, target_file_bytes: int, row_group_rows: int,
+              layout: ParquetLayout = None):
+        """Regrava os parts no staging com row groups uniformes; retorna (arquivos, linhas)."""
+        writer = None
+        pending = []
+        pending_rows = 0
+        total_rows = 0
+
+        try:
+            for path in originals:
+                table = pq.read_table(BytesIO(self.bucket.blob(path).download_as_bytes()))
+                total_rows += table.num_rows
+
+                if writer is None:
+                    # as colunas técnicas são as mesmas em todo o prefixo
+                    writer = StreamingParquetWriter(
+                        bucket_name=self.bucket_name,
+                        prefix=self.run_prefix,
+                        file_prefix=file_prefix,
+                        ingest_ts=table.column("dt_ingestao")[0].as_py(),
+                        run_id=table.column("id_execucao")[0].as_py(),
+                        target_file_bytes=target_file_bytes,
+                        blob_dir=self.staging_dir,
+                        row_group_rows=row_group_rows,
+                        layout=layout,
+                    )
+
+                pending.append(table)
+                pending_rows += table.num_rows
+                if pending_rows >= row_group_rows:
+                    pending = self._write_full_groups(writer, pending, row_group_rows)
+                    pending_rows = sum(t.num_rows for t in pending)
+
+            if pending:
+                writer.write_table(pa.concat_tables(pending, promote_options="default"))
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
+
+        if writer is None:
+            return [], 0
+        return writer.close(), total_rows
+
+    @staticmethod
+    def _write_full_groups(writer: StreamingParquetWriter, pending: list, row_group_rows: int) -> list:
+        # colunas ausentes em algum part viram null
+        table = pa.concat_tables(pending, promote_options="default")
+        full = table.num_rows - table.num_rows % row_group_rows
+        writer.write_table(table.slice(0, full))
+        return [table.slice(full)] if full < table.num_rows else []
+
+    def publish(self, staged: list) -> list:
+        final = []
+        for path in staged:
+            target = f"{self.run_prefix}/{path.rsplit('/', 1)[1]}"
+            self.bucket.copy_blob(self.bucket.blob(path), self.bucket, target)
+            final.append(target)
+        return final
+
+    def delete(self, paths: list):
+        for path in paths:
+            blob = self.bucket.blob(path)
+            if blob.exists():
+                blob.delete()
+
+    def read_state(self) -> Optional[dict]:
+        blob = self.bucket.blob(self.state_path)
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text(encoding="utf-8"))
+
+    def write_state(self, state: dict):
+        state["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.bucket.blob(self.state_path).upload_from_string(json.dumps(state), content_type="application/json")
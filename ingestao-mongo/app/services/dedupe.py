@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Iterable, List, Optional
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+logger = logging.getLogger("mongo_to_gcs.dedupe")
+
+_RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+class StreamDeduplicator:
+    """
+    Mantém só a versão mais recente de cada chave (dedupe_keys) entre todos
+    os chunks de uma execução, antes de qualquer gravação.
+
+    O índice guarda, por digest de 16 bytes da chave, o maior sort_field
+    visto e o BSON cru do documento vencedor (empate ou sem sort_field: vale
+    o último lido). Passando de max_memory_bytes, o índice e os documentos
+    seguintes são espalhados em `partitions` arquivos por hash da chave e
+    cada arquivo é deduplicado sozinho no final: a memória fica limitada a
+    ~1/partitions dos dados.
+
+    Documentos sem alguma das chaves não são deduplicados.
+
+    No Cloud Run o /tmp é memória: para o spill aliviar de fato, aponte
+    tmp_dir (DEDUPE_TMP_DIR) para um volume montado.
+    """
+
+    def __init__(self, keys: List[str], sort_field: Optional[str] = None,
+                 max_memory_bytes: int = 512 * 1024 * 1024, partitions: int = 32,
+                 tmp_dir: Optional[str] = None):
+        self.keys = keys
+        self.sort_field = sort_field or None
+        self.max_memory_bytes = max_memory_bytes
+        self.partitions = partitions
+        self.tmp_dir = tmp_dir
+
+        self.seen = 0
+        self.kept = 0
+
+        self._index = {}
+        self._memory_bytes = 0
+        self._seq = 0
+        self._spill_dir = None
+        self._spill_files = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill_dir is not None
+
+    def add(self, doc):
+        self.seen += 1
+        raw = doc.raw if isinstance(doc, RawBSONDocument) else bson.encode(doc)
+
+        if self.spilled:
+            self._spill(doc, raw)
+            return
+
+        self._offer(self._index, doc, raw)
+        if self._memory_bytes > self.max_memory_bytes:
+            self._start_spill()
+
+    def batches(self, batch_size: int, raw_output: bool = False):
+        """
+        Devolve os documentos mantidos em lotes de batch_size. raw_output
+        devolve RawBSONDocument (para o modo em processos); senão, dicts.
+        """
+        try:
+            if not self.spilled:
+                yield from self._emit(self._index, batch_size, raw_output)
+                self._index = {}
+                return
+
+            for f in self._spill_files:
+                f.close()
+
+            for path in self._spill_paths():
+                index = {}
+                with open(path, "rb") as f:
+                    for doc in bson.decode_file_iter(f, codec_options=_RAW_OPTIONS):
+                        self._offer(index, doc, doc.raw)
+                yield from self._emit(index, batch_size, raw_output)
+        finally:
+            self.close()
+
+    def summary(self) -> str:
+        dropped = self.seen - self.kept
+        return f"dedupe: lidos={self.seen} mantidos={self.kept} descartados={dropped} spill={self.spilled}"
+
+    def close(self):
+        if self._spill_files:
+            for f in self._spill_files:
+                f.close()
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._spill_files = None
+
+    def _offer(self, index: dict, doc, raw: bytes):
+        self._seq += 1
+        digest = self._digest(doc)
+        if digest is None:
+            # sem chave: entra como única
+            digest = ("sem_chave", self._seq)
+
+        sort_key = self._sort_key(doc)
+        current = index.get(digest)
+        if current is not None and _newer(current[0], sort_key):
+            return
+
+        if current is not None:
+            self._memory_bytes -= len(current[1])
+        index[digest] = (sort_key, raw)
+        self._memory_bytes += len(raw)
+
+    def _emit(self, index: dict, batch_size: int, raw_output: bool):
+        batch = []
+        for _, raw in index.values():
+            batch.append(RawBSONDocument(raw) if raw_output else bson.decode(raw))
+            if len(batch) >= batch_size:
+                self.kept += len(batch)
+                yield batch
+                batch = []
+        if batch:
+            self.kept += len(batch)
+            yield batch
+        self._memory_bytes = 0
+
+    def _digest(self, doc) -> Optional[bytes]:
+        values = []
+        for key in self.keys:
+            value = _lookup(doc, key)
+            if value is None:
+                return None
+            values.append(value)
+        encoded = bson.encode({"k": values})
+        return hashlib.blake2b(encoded, digest_size=16).digest()
+
+    def _sort_key(self, doc):
+        if self.sort_field is None:
+            return None
+        value = _lookup(doc, self.sort_field)
+        if isinstance(value, RawBSONDocument):
+            value = value.raw
+        return value
+
+    def _start_spill(self):
+        self._spill_dir = tempfile.mkdtemp(prefix="dedupe_", dir=self.tmp_dir)
+        self._spill_files = [open(path, "wb") for path in self._spill_paths()]
+        logger.info(
+            f"Dedupe passou de {self.max_memory_bytes / 1e6:,.0f}MB — "
+            f"spill em {self.partitions} partições em {self._spill_dir}"
+        )
+
+        index = self._index
+        self._index = {}
+        self._memory_bytes = 0
+        for _, raw in index.values():
+            self._spill(RawBSONDocument(raw), raw)
+
+    def _spill(self, doc, raw: bytes):
+        digest = self._digest(doc)
+        partition = 0 if digest is None else int.from_bytes(digest[:4], "little") % self.partitions
+        self._spill_files[partition].write(raw)
+
+    def _spill_paths(self):
+        return [os.path.join(self._spill_dir, f"part_{n:03d}.bson") for n in range(self.partitions)]
+
+
+def dedupe_batches(batches: Iterable[list], dedup: StreamDeduplicator, batch_size: int,
+                   raw_output: bool = False):
+    """Consome todos os batches no deduplicador e devolve os lotes deduplicados."""
+    for batch in batches:
+        for doc in batch:
+            dedup.add(doc)
+    yield from dedup.batches(batch_size, raw_output=raw_output)
+    logger.info(dedup.summary())
+
+
+def _lookup(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if not hasattr(value, "get"):
+            return None
+        value = value.get(part)
+        if value is None:
+            return None
+    return value
+
+
+def _newer(current, candidate) -> bool:
+    """True se a versão atual deve ser mantida frente à candidata."""
+    if current is None or candidate is None:
+        # sem sort_field (ou valor ausente na candidata): vale a ordem de leitura
+        return candidate is None and current is not None
+    try:
+        return current > candidate
+    except TypeError:
+        # tipos misturados no sort_field: compara pela representação
+        return str(current) > str(candidate)
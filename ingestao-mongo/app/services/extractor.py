@@ -1,11 +1,19 @@
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from ..config.constants import DEFAULT_WATERMARK
 
 logger = logging.getLogger("mongo_to_gcs.extractor")
 
+# Colunas das tabelas BigQuery lidas nesta execução (None = tabela inexistente)
+_table_columns = {}
+_table_columns_lock = threading.Lock()
+
+# Colunas criadas pelo job, que não existem no Mongo
+_TECHNICAL_COLUMNS = {"dt_ingestao", "id_execucao"}
+
 def _ensure_datetime(value):
     """
     Garante que o valor seja datetime.
@@ -69,7 +77,8 @@ def get_max_date_from_bq_table(
 def build_mongo_query(
     incremental_field: str,
     start_date,
-    end_date=None
+    end_date=None,
+    filter_type=None
 ):
     """
     Constrói query incremental para MongoDB com suporte a janela de datas.
@@ -78,6 +87,15 @@ def build_mongo_query(
     - datetime
     - string no formato 'YYYY-MM-DD'
 
+    filter_type (FILTER_TYPE no catálogo) define como o campo é comparado:
+    - None / 'expr': $expr + $toDate (aceita qualquer tipo, mas não usa índice)
+    - 'date': campo é Date nativo
+    - 'iso_string': campo é string ISO 8601 (comparação lexicográfica)
+    - 'epoch_ms' / 'epoch_s': campo é número (epoch em ms ou s)
+
+    Os modos tipados comparam o campo cru, então o índice em
+    incremental_field pode ser usado.
+
     Regras:
     - field >= start_date
     - field < end_date (se informado)
@@ -87,6 +105,16 @@ def build_mongo_query(
     start_date = _ensure_datetime(start_date)
     end_date = _ensure_datetime(end_date)
 
+    if filter_type and filter_type != "expr":
+        date_range = {"$gte": _typed_bound(start_date, filter_type)}
+        if end_date:
+            date_range["$lt"] = _typed_bound(end_date, filter_type)
+
+        return {
+            incremental_field: date_range,
+            "deleted": False
+        }
+
     date_conditions = [
         {
             "$gte": [
@@ -113,6 +141,109 @@ def build_mongo_query(
         "deleted": False
     }
 
+
+def _typed_bound(value: datetime, filter_type: str):
+    """Converte o limite da janela para o tipo armazenado no campo."""
+    # Datas ingênuas são tratadas como UTC (mesmo comportamento do $toDate)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value_utc = value.astimezone(timezone.utc)
+
+    if filter_type == "date":
+        return value_utc
+
+    if filter_type == "iso_string":
+        naive = value_utc.replace(tzinfo=None)
+        # meia-noite vira só a data: 'YYYY-MM-DD' <= qualquer string do dia
+        if naive.time() == datetime.min.time():
+            return naive.date().isoformat()
+        return naive.isoformat()
+
+    if filter_type == "epoch_ms":
+        return int(value_utc.timestamp() * 1000)
+
+    if filter_type == "epoch_s":
+        return int(value_utc.timestamp())
+
+    raise ValueError(f"filter_type inválido: {filter_type}")
+
+
+def summarize_winning_plan(explain_result: dict):
+    """
+    Resume o winningPlan de um explain('queryPlanner').
+
+    Retorna (resumo, usa_collscan), ex: ('FETCH > IXSCAN(updatedAt_1)', False).
+    """
+    planner = explain_result.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    # Engine SBE (5.x+) aninha o plano em queryPlan
+    plan = plan.get("queryPlan", plan)
+
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            plan = plan["inputStages"][0]
+        else:
+            plan = None
+
+    has_collscan = any(s.startswith("COLLSCAN") for s in stages)
+    return " > ".join(stages), has_collscan
+
+
+def get_table_columns(bq: bigquery.Client, project_id: str, table_id: str):
+    """
+    Colunas de primeiro nível de `dataset.tabela` no BigQuery, lidas uma vez
+    por execução. Retorna None se a tabela não existe.
+    """
+    with _table_columns_lock:
+        if table_id in _table_columns:
+            return _table_columns[table_id]
+
+        try:
+            table = bq.get_table(f"{project_id}.{table_id}")
+            columns = [field.name for field in table.schema]
+        except NotFound:
+            columns = None
+
+        _table_columns[table_id] = columns
+        return columns
+
+
+def derive_projection_fields(columns: list, required_fields: list) -> list:
+    """
+    Campos de primeiro nível do Mongo a buscar: as colunas da tabela de
+    destino (sem as técnicas do job e as _cdc_*) mais os campos exigidos pelo
+    próprio job (filtro, dedupe, tipos). Campos aninhados entram pela raiz,
+    para que a coluna JSON chegue inteira.
+    """
+    fields = dict.fromkeys(
+        column for column in columns
+        if column not in _TECHNICAL_COLUMNS and not column.startswith("_cdc_")
+    )
+    for field in required_fields:
+        if field:
+            fields.setdefault(field.split(".", 1)[0])
+    return list(fields)
+
+
+def projection_match_ratio(fields: list, documents: list) -> float:
+    """
+    Fração dos campos presentes no primeiro nível de ao menos um dos
+    documentos da amostra (1.0 sem amostra ou sem campos).
+    """
+    if not fields or not documents:
+        return 1.0
+    seen = set().union(*(doc.keys() for doc in documents))
+    return sum(field in seen for field in fields) / len(fields)
+
+
 def build_projection(projection_list: list):
     """Converte lista ['a','b','c'] → {'a':1,'b':1,'c':1} para Mongo."""
     return {field: 1 for field in projection_list}
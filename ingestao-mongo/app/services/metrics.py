@@ -0,0 +1,200 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from bson.raw_bson import RawBSONDocument
+
+from .chunking import current_rss_bytes
+
+logger = logging.getLogger("mongo_to_gcs.metrics")
+
+# Registros JSON puros (uma linha por registro): o Cloud Logging os lê como
+# jsonPayload, sem o prefixo de data/nível do formato padrão
+_json_logger = logging.getLogger("mongo_to_gcs.metrics.json")
+if not _json_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _json_logger.addHandler(_handler)
+    _json_logger.setLevel(logging.INFO)
+    _json_logger.propagate = False
+
+# Métricas da tarefa em execução na thread (ou no contexto copiado para ela)
+_current = contextvars.ContextVar("collection_metrics", default=None)
+
+
+class CollectionMetrics:
+    """
+    Tempo, documentos e bytes por estágio de uma tarefa (coleção, faixa de
+    _id ou fatia de backfill). Os estágios registram via record_stage sem
+    receber o objeto: ele é achado pelo contextvar ativo.
+
+    Com METRICS_TRACK_RSS=true cada registro também guarda o maior RSS
+    lido ao fim das chamadas do estágio (uma leitura de /proc por chamada).
+
+    resumed marca a tarefa que reaproveitou um checkpoint (retomada ou já
+    concluída): a duração dela não representa a coleção inteira.
+    """
+
+    def __init__(self, collection: str, task: str):
+        self.collection = collection
+        self.task = task
+        self.track_rss = os.getenv("METRICS_TRACK_RSS", "false").lower() == "true"
+        self.stages = {}
+        self.retries = {}
+        self.resumed = False
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def add(self, stage: str, seconds: float, docs: int = 0, nbytes: int = 0):
+        peak_rss = current_rss_bytes() if self.track_rss else 0
+        self._accumulate(stage, seconds, docs, nbytes, 1, peak_rss)
+
+    def _accumulate(self, stage: str, seconds: float, docs: int, nbytes: int, calls: int, peak_rss: int):
+        with self._lock:
+            current = self.stages.get(stage)
+            if current is None:
+                current = self.stages[stage] = {"seconds": 0.0, "docs": 0, "bytes": 0, "calls": 0}
+            current["seconds"] += seconds
+            current["docs"] += docs
+            current["bytes"] += nbytes
+            current["calls"] += calls
+            if peak_rss:
+                current["peak_rss"] = max(current.get("peak_rss", 0), peak_rss)
+
+    def add_retry(self, stage: str):
+        with self._lock:
+            self.retries[stage] = self.retries.get(stage, 0) + 1
+
+    def merge(self, stages: dict):
+        """Soma estágios medidos em outro lugar (ex.: no processo do pool)."""
+        for stage, values in stages.items():
+            self._accumulate(
+                stage, values["seconds"], values["docs"], values["bytes"], values["calls"], values.get("peak_rss", 0)
+            )
+
+    def to_record(self, run_id: str, status: str, docs: int) -> dict:
+        wall = time.perf_counter() - self._start
+        with self._lock:
+            stages = {
+                name: {**values, "seconds": round(values["seconds"], 3)}
+                for name, values in self.stages.items()
+            }
+            retries = dict(self.retries)
+        return {
+            "event": "collection_metrics",
+            "run_id": run_id,
+            "collection": self.collection,
+            "task": self.task,
+            "status": status,
+            "resumed": self.resumed,
+            "docs": docs,
+            "wall_seconds": round(wall, 3),
+            "docs_per_second": round(docs / wall, 1) if wall else 0.0,
+            "stages": stages,
+            "retries": retries,
+        }
+
+
+def current_metrics() -> Optional[CollectionMetrics]:
+    return _current.get()
+
+
+def record_stage(stage: str, seconds: float, docs: int = 0, nbytes: int = 0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(stage, seconds, docs, nbytes)
+
+
+def record_retry(stage: str):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_retry(stage)
+
+
+def timed_batches(batches: Iterable[list], stage: str = "mongo_fetch"):
+    """
+    Mede o tempo gasto dentro do iterador de batches (leitura do cursor).
+    Bytes só são contados quando os documentos chegam como BSON cru.
+    """
+    iterator = iter(batches)
+    while True:
+        start = time.perf_counter()
+        batch = next(iterator, None)
+        seconds = time.perf_counter() - start
+        if batch is None:
+            return
+        nbytes = sum(len(doc.raw) for doc in batch) if batch and isinstance(batch[0], RawBSONDocument) else 0
+        record_stage(stage, seconds, len(batch), nbytes)
+        yield batch
+
+
+def emit(record: dict):
+    _json_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class RunMetrics:
+    """Agrega os registros das tarefas e grava o resumo da execução no GCS."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = datetime.now(timezone.utc)
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self, failed) -> dict:
+        with self._lock:
+            records = list(self.records)
+
+        totals = {}
+        for record in records:
+            for stage, values in record["stages"].items():
+                total = totals.setdefault(stage, {"seconds": 0.0, "docs": 0, "bytes": 0, "calls": 0})
+                for field in ("seconds", "docs", "bytes", "calls"):
+                    total[field] += values[field]
+        for total in totals.values():
+            total["seconds"] = round(total["seconds"], 3)
+
+        finished_at = datetime.now(timezone.utc)
+        return {
+            "event": "run_summary",
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "wall_seconds": round((finished_at - self.started_at).total_seconds(), 3),
+            "docs": sum(r["docs"] for r in records),
+            "failed": sorted(failed),
+            "stages": totals,
+            # mais lentas primeiro
+            "tasks": sorted(records, key=lambda r: r["wall_seconds"], reverse=True),
+        }
+
+    def write_summary(self, bucket_name: str, blob_path: str, failed) -> dict:
+        # import local: o writer importa este módulo
+        from .writer import get_storage_client
+
+        summary = self.summary(failed)
+        blob = get_storage_client().bucket(bucket_name).blob(blob_path)
+        blob.upload_from_string(
+            json.dumps(summary, ensure_ascii=False, indent=2, default=str),
+            content_type="application/json",
+        )
+        logger.info(f"Resumo da execução salvo em: gs://{bucket_name}/{blob_path}")
+        return summary
@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from .metrics import CollectionMetrics, record_stage
+from .transformer import normalize_documents, normalize_documents_arrow, normalize_documents_typed
+from .writer import ParquetLayout, dataframe_to_parquet_bytes, arrow_table_to_parquet_bytes
+
+logger = logging.getLogger("mongo_to_gcs.offload")
+
+# Um pool de processos por job, compartilhado entre as coleções
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+@dataclass
+class EncodedBatch:
+    """Resultado de um batch processado no pool."""
+    docs: int
+    parquet: Optional[bytes] = None     # part pronto para upload (WRITER_MODE=part)
+    data: Any = None                    # tabela/DataFrame normalizado (WRITER_MODE=stream)
+    quarantine: Optional[bytes] = None  # linhas em quarentena (saída tipada)
+    stages: Optional[dict] = None       # métricas por estágio medidas no processo
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Retorna o pool do processo, criando-o na primeira chamada com
+    PROCESS_WORKERS processos (padrão: nº de CPUs). Usa spawn: o processo
+    pai tem threads e clientes com sockets abertos, que não sobrevivem a fork.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = int(os.getenv("PROCESS_WORKERS", "0")) or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Pool de processos criado — workers=%s", _pool_workers)
+        return _pool
+
+
+def process_pool_workers() -> int:
+    get_process_pool()
+    return _pool_workers
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def pack_batch(batch: list) -> bytes:
+    """
+    Junta o batch em um único buffer BSON para enviar ao pool. Documentos
+    lidos como RawBSONDocument já estão em BSON: só os bytes são copiados,
+    sem decodificar na thread de I/O.
+    """
+    return b"".join(doc.raw if isinstance(doc, RawBSONDocument) else bson.encode(doc) for doc in batch)
+
+
+def encode_batch(
+    packed: bytes,
+    engine: str,
+    types: Dict[str, str],
+    type_errors: str,
+    ingest_ts,
+    run_id: str,
+    to_parquet: bool = True,
+    layout: ParquetLayout = None,
+) -> EncodedBatch:
+    """
+    Executado no processo do pool: decodifica o BSON, normaliza (mesmas
+    funções do modo em threads) e, com to_parquet, já serializa o Parquet.
+    """
+    metrics = CollectionMetrics("pool", "encode_batch")
+
+    with metrics.activate():
+        start = time.perf_counter()
+        documents = bson.decode_all(packed)
+        record_stage("bson_decode", time.perf_counter() - start, len(documents), len(packed))
+
+        quarantine = None
+        start = time.perf_counter()
+        if types:
+            data, quarantine_table = normalize_documents_typed(documents, types, on_error=type_errors)
+        elif engine == "arrow":
+            data = normalize_documents_arrow(documents)
+        else:
+            data = normalize_documents(documents)
+        record_stage("normalize", time.perf_counter() - start, len(documents))
+
+        if types and quarantine_table is not None:
+            quarantine = arrow_table_to_parquet_bytes(quarantine_table, ingest_ts, run_id)
+
+        if not to_parquet:
+            return EncodedBatch(docs=len(documents), data=data, quarantine=quarantine, stages=metrics.stages)
+
+        if types or engine == "arrow":
+            parquet = arrow_table_to_parquet_bytes(data, ingest_ts, run_id, layout)
+        else:
+            parquet = dataframe_to_parquet_bytes(data, ingest_ts, run_id, layout)
+
+    return EncodedBatch(docs=len(documents), parquet=parquet, quarantine=quarantine, stages=metrics.stages)
@@ -0,0 +1,105 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger("mongo_to_gcs.partitioning")
+
+
+@dataclass(frozen=True)
+class IdRange:
+    """Faixa [lower, upper) de _id de uma coleção. None = sem limite."""
+    index: int
+    lower: Optional[ObjectId] = None
+    upper: Optional[ObjectId] = None
+
+    @property
+    def label(self) -> str:
+        return f"r{self.index:03d}"
+
+    @property
+    def bounds(self) -> dict:
+        """Limites serializáveis (checkpoint): fronteiras de amostra mudam entre execuções."""
+        return {
+            "lower": str(self.lower) if self.lower is not None else None,
+            "upper": str(self.upper) if self.upper is not None else None,
+        }
+
+
+def compute_id_boundaries(repo, n_splits: int, strategy: str = "sample", sample_per_split: int = 100,
+                          query: Optional[dict] = None) -> List[ObjectId]:
+    """
+    Calcula até n_splits - 1 fronteiras de _id (ObjectId) ordenadas, sobre
+    os documentos de query (a janela incremental; None = coleção inteira).
+
+    Estratégias:
+    - sample: $sample de n_splits * sample_per_split _ids e corte por quantis
+      (sem query usa o random cursor do WiredTiger; com query, lê os
+      documentos da janela pelo índice do filtro)
+    - bucketAuto: $bucketAuto sobre _id (fronteiras exatas, mas lê todos os
+      documentos da query)
+    """
+    if n_splits <= 1:
+        return []
+
+    if strategy == "bucketAuto":
+        object_ids = {"_id": {"$type": "objectId"}}
+        pipeline = [
+            {"$match": {"$and": [query, object_ids]} if query else object_ids},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": n_splits}},
+        ]
+        buckets = list(repo.aggregate(pipeline))
+        boundaries = [b["_id"]["min"] for b in buckets[1:]]
+
+    elif strategy == "sample":
+        pipeline = ([{"$match": query}] if query else []) + [
+            {"$sample": {"size": n_splits * sample_per_split}},
+            {"$project": {"_id": 1}},
+        ]
+        ids = sorted(doc["_id"] for doc in repo.aggregate(pipeline) if isinstance(doc["_id"], ObjectId))
+        if not ids:
+            return []
+        step = len(ids) / n_splits
+        boundaries = [ids[int(step * k)] for k in range(1, n_splits)]
+
+    else:
+        raise ValueError(f"split strategy inválida: {strategy}")
+
+    return sorted(set(boundaries))
+
+
+def build_id_ranges(boundaries: List[ObjectId]) -> List[IdRange]:
+    """[b1, b2] -> [(None, b1), (b1, b2), (b2, None)]"""
+    edges = [None] + list(boundaries) + [None]
+    return [
+        IdRange(index=i, lower=edges[i], upper=edges[i + 1])
+        for i in range(len(edges) - 1)
+    ]
+
+
+def apply_id_range(query: Optional[dict], id_range: Optional[IdRange]) -> Optional[dict]:
+    """
+    Restringe a query à faixa de _id. A primeira faixa também leva os
+    documentos cujo _id não é ObjectId (que nenhuma comparação de faixa pega).
+    """
+    if id_range is None:
+        return query
+
+    bounds: dict = {}
+    if id_range.lower is not None:
+        bounds["$gte"] = id_range.lower
+    if id_range.upper is not None:
+        bounds["$lt"] = id_range.upper
+
+    if not bounds:
+        return query
+
+    range_filter: Any = {"_id": bounds}
+    if id_range.lower is None:
+        range_filter = {"$or": [range_filter, {"_id": {"$not": {"$type": "objectId"}}}]}
+
+    if not query:
+        return range_filter
+
+    return {"$and": [query, range_filter]}
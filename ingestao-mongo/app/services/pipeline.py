@@ -0,0 +1,193 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger("mongo_to_gcs.pipeline")
+
+# Fim de stream entre estágios
+_DONE = object()
+
+
+class StageStats:
+    """Contadores de um estágio (thread-safe)."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.docs = 0
+        self.busy_seconds = 0.0     # tempo fazendo trabalho útil
+        self.blocked_seconds = 0.0  # tempo esperando vaga na fila seguinte
+        self._lock = threading.Lock()
+
+    def add(self, docs: int, busy: float, blocked: float = 0.0):
+        with self._lock:
+            self.items += 1
+            self.docs += docs
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+
+    def summary(self) -> str:
+        rate = self.docs / self.busy_seconds if self.busy_seconds else 0.0
+        return (
+            f"{self.name}: workers={self.workers} batches={self.items} docs={self.docs} "
+            f"busy={self.busy_seconds:.1f}s blocked={self.blocked_seconds:.1f}s "
+            f"docs/s/worker={rate:,.0f}"
+        )
+
+
+class _Aborted(Exception):
+    """Outro estágio falhou; encerra o estágio atual sem processar mais."""
+
+
+def run_staged_pipeline(
+    batches: Iterable[list],
+    normalize: Callable[[list], Any],
+    write: Callable[[int, Any], Any],
+    label: str,
+    normalize_workers: int = 2,
+    upload_workers: int = 2,
+    queue_size: int = 4,
+) -> int:
+    """
+    Executa fetch -> normalize -> upload em estágios paralelos ligados por
+    filas limitadas (queue_size batches cada), sobrepondo leitura do cursor,
+    CPU e escrita no GCS. Fila cheia bloqueia o estágio anterior
+    (backpressure), então a memória fica limitada a ~2 * queue_size batches
+    em voo.
+
+    write(i, data) recebe o índice do batch na ordem do cursor. Com
+    upload_workers > 1 as chamadas são concorrentes.
+
+    Ao final loga as estatísticas por estágio: o estágio com mais 'busy' e o
+    anterior a ele com mais 'blocked' indicam o gargalo. Retorna o total de
+    documentos gravados; a primeira exceção de qualquer estágio é relançada.
+    """
+    to_normalize: queue.Queue = queue.Queue(maxsize=queue_size)
+    to_upload: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    abort = threading.Event()
+    errors = []
+
+    fetch_stats = StageStats("fetch", 1)
+    normalize_stats = StageStats("normalize", normalize_workers)
+    upload_stats = StageStats("upload", upload_workers)
+
+    pending_normalizers = [normalize_workers]
+    pending_lock = threading.Lock()
+
+    def put(q, item) -> float:
+        start = time.perf_counter()
+        while True:
+            if abort.is_set():
+                raise _Aborted()
+            try:
+                q.put(item, timeout=0.5)
+                return time.perf_counter() - start
+            except queue.Full:
+                continue
+
+    def get(q):
+        while True:
+            if abort.is_set():
+                raise _Aborted()
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def fail(exc):
+        errors.append(exc)
+        abort.set()
+
+    def fetch_stage():
+        try:
+            iterator = iter(batches)
+            i = 0
+            while True:
+                start = time.perf_counter()
+                batch = next(iterator, _DONE)
+                busy = time.perf_counter() - start
+                if batch is _DONE:
+                    break
+                blocked = put(to_normalize, (i, batch))
+                fetch_stats.add(len(batch), busy, blocked)
+                i += 1
+
+            for _ in range(normalize_workers):
+                put(to_normalize, _DONE)
+        except _Aborted:
+            pass
+        except Exception as e:
+            fail(e)
+
+    def normalize_stage():
+        try:
+            while True:
+                item = get(to_normalize)
+                if item is _DONE:
+                    break
+                i, batch = item
+                start = time.perf_counter()
+                data = normalize(batch)
+                busy = time.perf_counter() - start
+                blocked = put(to_upload, (i, len(batch), data))
+                normalize_stats.add(len(batch), busy, blocked)
+
+            # o último normalizador a terminar encerra os uploaders
+            with pending_lock:
+                pending_normalizers[0] -= 1
+                last = pending_normalizers[0] == 0
+            if last:
+                for _ in range(upload_workers):
+                    put(to_upload, _DONE)
+        except _Aborted:
+            pass
+        except Exception as e:
+            fail(e)
+
+    def upload_stage():
+        try:
+            while True:
+                item = get(to_upload)
+                if item is _DONE:
+                    break
+                i, n_docs, data = item
+                start = time.perf_counter()
+                write(i, data)
+                upload_stats.add(n_docs, time.perf_counter() - start)
+        except _Aborted:
+            pass
+        except Exception as e:
+            fail(e)
+
+    def thread(target, name):
+        # cada thread herda uma cópia do contexto (métricas da coleção)
+        context = contextvars.copy_context()
+        return threading.Thread(target=context.run, args=(target,), name=name, daemon=True)
+
+    threads = [thread(fetch_stage, f"{label}-fetch")]
+    threads += [thread(normalize_stage, f"{label}-normalize-{n}") for n in range(normalize_workers)]
+    threads += [thread(upload_stage, f"{label}-upload-{n}") for n in range(upload_workers)]
+
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+
+    for stats in (fetch_stats, normalize_stats, upload_stats):
+        logger.info(f"⏱ [{label}] {stats.summary()}")
+    logger.info(
+        f"⏱ [{label}] pipeline wall={wall:.1f}s docs={upload_stats.docs} "
+        f"docs/s={upload_stats.docs / wall if wall else 0:,.0f}"
+    )
+
+    if errors:
+        raise errors[0]
+
+    return upload_stats.docs
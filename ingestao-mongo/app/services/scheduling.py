@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.api_core import exceptions as gexc
+
+from .chunking import current_rss_bytes
+from .writer import get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.scheduling")
+
+
+class DurationHistory:
+    """
+    Duração (s) e documentos por coleção nas execuções anteriores, em um
+    manifesto JSON no GCS:
+
+        {"<dataset>.<tabela>": {"seconds": 812.4, "docs": 1500000, "run_id": "...", "updated_at": "<iso>"}}
+
+    O valor guardado é uma média móvel (peso `alpha` para a execução nova).
+    A gravação, uma vez no fim do job, é condicionada à generation do objeto.
+    """
+
+    max_save_attempts = 5
+
+    def __init__(self, bucket_name: str, blob_path: str, alpha: float = 0.5):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+        self.alpha = alpha
+        self._entries = {}
+        self._observed = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        entries, _ = self._read()
+        self._entries = entries
+        logger.info(f"Histórico de durações carregado — coleções={len(entries)}")
+        return entries
+
+    def seconds(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry["seconds"] if entry else None
+
+    def docs_per_second(self) -> Optional[float]:
+        """Vazão média do histórico (usada para estimar coleções sem histórico)."""
+        seconds = sum(e["seconds"] for e in self._entries.values())
+        docs = sum(e["docs"] for e in self._entries.values())
+        return docs / seconds if seconds and docs else None
+
+    def record(self, key: str, seconds: float, docs: int):
+        """Acumula a duração observada nesta execução (soma das faixas de _id)."""
+        with self._lock:
+            current = self._observed.setdefault(key, {"seconds": 0.0, "docs": 0})
+            current["seconds"] += seconds
+            current["docs"] += docs
+
+    def save(self, run_id: str):
+        if not self._observed:
+            return
+
+        for attempt in range(1, self.max_save_attempts + 1):
+            entries, generation = self._read()
+            now = datetime.now(timezone.utc).isoformat()
+
+            for key, observed in self._observed.items():
+                previous = entries.get(key)
+                seconds, docs = observed["seconds"], observed["docs"]
+                if previous:
+                    seconds = self.alpha * seconds + (1 - self.alpha) * previous["seconds"]
+                    docs = int(self.alpha * docs + (1 - self.alpha) * previous["docs"])
+                entries[key] = {"seconds": round(seconds, 1), "docs": docs, "run_id": run_id, "updated_at": now}
+
+            try:
+                self._write(entries, generation)
+            except gexc.PreconditionFailed:
+                logger.warning(f"Histórico de durações alterado por outra execução (tentativa {attempt}), relendo")
+                continue
+
+            logger.info(f"Histórico de durações atualizado — coleções={len(self._observed)}")
+            return
+
+        raise RuntimeError(f"Não foi possível gravar o histórico de durações após {self.max_save_attempts} tentativas")
+
+    def _read(self):
+        blob = get_storage_client().bucket(self.bucket_name).get_blob(self.blob_path)
+        if blob is None:
+            return {}, 0
+        text = blob.download_as_text(encoding="utf-8", if_generation_match=blob.generation)
+        return json.loads(text), blob.generation
+
+    def _write(self, entries: dict, generation: int):
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(
+            json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True),
+            content_type="application/json",
+            if_generation_match=generation,
+        )
+
+
+class AdaptiveConcurrency:
+    """
+    Limite ajustável de coleções em execução simultânea.
+
+    A cada `interval` segundos compara uso de CPU e de memória do container:
+    memória acima de `memory_high` reduz o limite em 1; CPU abaixo de
+    `cpu_low` com memória abaixo de `memory_low` aumenta em 1. O limite nunca
+    sai de [minimum, maximum] e a redução não interrompe quem já começou:
+    só atrasa o próximo início.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = None, interval: float = 15.0,
+                 cpu_low: float = 0.6, memory_low: float = 0.6, memory_high: float = 0.85):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = max(minimum, min(initial, self.maximum))
+        self.interval = interval
+        self.cpu_low = cpu_low
+        self.memory_low = memory_low
+        self.memory_high = memory_high
+
+        self._running = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self._running >= self.limit:
+                self._condition.wait()
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def start(self):
+        self._monitor = threading.Thread(target=self._watch, name="adaptive-concurrency", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+
+    def _watch(self):
+        cpu = _CpuSampler()
+        while not self._stop.wait(self.interval):
+            cpu_used = cpu.sample()
+            memory_used = memory_usage_fraction()
+
+            with self._condition:
+                previous = self.limit
+                if memory_used is not None and memory_used > self.memory_high:
+                    self.limit = max(self.minimum, self.limit - 1)
+                elif (
+                    cpu_used is not None and cpu_used < self.cpu_low
+                    and (memory_used is None or memory_used < self.memory_low)
+                    and self._running >= self.limit
+                ):
+                    self.limit = min(self.maximum, self.limit + 1)
+
+                if self.limit != previous:
+                    self._condition.notify_all()
+                    logger.info(
+                        f"⚖ Concorrência {previous} → {self.limit} "
+                        f"(cpu={_pct(cpu_used)} memória={_pct(memory_used)} em_execução={self._running})"
+                    )
+
+
+class _CpuSampler:
+    """Fração de CPU ocupada entre duas amostras (/proc/stat; fora do Linux, loadavg)."""
+
+    def __init__(self):
+        self._last = _read_proc_stat()
+
+    def sample(self) -> Optional[float]:
+        current = _read_proc_stat()
+        if current is None or self._last is None:
+            try:
+                return os.getloadavg()[0] / (os.cpu_count() or 1)
+            except OSError:
+                return None
+
+        busy = current[0] - self._last[0]
+        total = current[1] - self._last[1]
+        self._last = current
+        return busy / total if total else None
+
+
+def _read_proc_stat():
+    try:
+        with open("/proc/stat") as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    total = sum(values)
+    return total - idle, total
+
+
+def memory_usage_fraction() -> Optional[float]:
+    """
+    Uso de memória / limite do container (cgroup v2 ou v1). Sem cgroup,
+    usa o RSS do processo contra MEMORY_LIMIT_MB, se definido.
+    """
+    for usage_path, limit_path in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.max"),
+        ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+    ):
+        try:
+            with open(usage_path) as f:
+                usage = int(f.read())
+            with open(limit_path) as f:
+                limit = f.read().strip()
+        except (OSError, ValueError):
+            continue
+        # "max" (v2) ou valor gigante (v1) = sem limite
+        if limit.isdigit() and int(limit) < 1 << 60:
+            return usage / int(limit)
+
+    limit_mb = os.getenv("MEMORY_LIMIT_MB")
+    if limit_mb:
+        return current_rss_bytes() / (float(limit_mb) * 1024 * 1024)
+    return None
+
+
+def _pct(value: Optional[float]) -> str:
+    return "n/d" if value is None else f"{value:.0%}"
+
+
+def timed(fn, *args, **kwargs):
+    """Executa fn e devolve (resultado, segundos)."""
+    start = time.monotonic()
+    result = fn(*args, **kwargs)
+    return result, time.monotonic() - start
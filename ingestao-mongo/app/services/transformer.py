@@ -1,10 +1,11 @@
 import json
 import logging
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from decimal import Decimal
 from typing import Any
 
 import pandas as pd
+import pyarrow as pa
 from bson import Decimal128, ObjectId
 
 logger = logging.getLogger("mongo_to_gcs.transformer")
@@ -31,6 +32,368 @@ def normalize_documents(documents):
     return df
 
 
+def normalize_documents_arrow(documents) -> pa.Table:
+    """
+    Versão colunar de normalize_documents: monta os arrays Arrow (string)
+    direto do batch, convertendo uma coluna por vez em vez de célula a célula
+    via pandas.
+
+    Reproduz a saída de normalize_documents (inclusive a inferência de tipos
+    do pandas: 'nan', 'None', 'NaT', inteiros promovidos a float, etc.).
+    """
+    if not documents:
+        return pa.table({})
+
+    keys = dict.fromkeys(key for doc in documents for key in doc)
+
+    names = []
+    arrays = []
+    for key in keys:
+        values = [doc.get(key, _MISSING) for doc in documents]
+        name = _sanitize_column_name(key)
+
+        if name == "deletedAt":
+            strings = _deleted_at_to_str(values)
+        else:
+            strings = _column_to_str(values)
+
+        names.append(name)
+        arrays.append(pa.array(strings, type=pa.string()))
+
+    logger.info(f"Normalização concluída — linhas={len(documents)} colunas={len(names)}")
+
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+class _Missing:
+    """Marca campo ausente no documento (NaN no DataFrame do pandas)."""
+
+
+_MISSING = _Missing()
+
+_INT64_MIN = -(2 ** 63)
+_UINT64_MAX = 2 ** 64 - 1
+
+# Limites de datetime64[ns]; fora disso o pandas mantém a coluna como object
+_NS_MIN = datetime(1677, 9, 22)
+_NS_MAX = datetime(2262, 4, 11)
+
+# Mesmo resultado de json.dumps(..., ensure_ascii=False, default=str), sem
+# recriar o encoder a cada célula
+_JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+# Conversão direta para colunas homogêneas sem campos ausentes
+_STR_CONVERTERS = {
+    str: lambda v: v,
+    bool: str,
+    ObjectId: str,
+    Decimal128: lambda v: str(v.to_decimal()),
+    Decimal: str,
+    dict: _JSON_ENCODE,
+    list: _JSON_ENCODE,
+    # astype(str) do pandas decodifica bytes (inclusive bson.Binary) como UTF-8
+    bytes: bytes.decode,
+}
+
+
+def _value_types(values: list) -> set:
+    """
+    Tipos da coluna como o pandas enxerga: subclasses de int (ex.:
+    bson.int64.Int64, que o pymongo devolve para int64), float e bytes
+    (bson.Binary) contam como o tipo base; bool segue à parte.
+    """
+    types = set()
+    for t in set(map(type, values)):
+        if t is not bool and issubclass(t, int):
+            t = int
+        elif issubclass(t, float):
+            t = float
+        elif issubclass(t, bytes):
+            t = bytes
+        types.add(t)
+    return types
+
+
+def _column_to_str(values: list) -> list:
+    """
+    Converte uma coluna inteira para string, escolhendo o caminho pelo
+    conjunto de tipos presentes (mesma inferência do pd.DataFrame).
+    """
+    types = _value_types(values)
+    has_missing = _Missing in types
+    has_none = type(None) in types
+    types.discard(_Missing)
+    types.discard(type(None))
+
+    if not types:
+        # só None -> object; None + ausente -> float64 (tudo NaN)
+        return ["nan" if has_missing else "None"] * len(values)
+
+    if types <= {int, float} and _ints_fit_numeric(values, types):
+        if float in types or has_missing or has_none:
+            return [
+                str(float(v)) if v is not None and v is not _MISSING else "nan"
+                for v in values
+            ]
+        return list(map(str, values))
+
+    if types - {float} == {datetime} and _is_datetime64_column(values):
+        return [v.isoformat() if type(v) is datetime else "NaT" for v in values]
+
+    if len(types) == 1 and not (has_missing or has_none):
+        converter = _STR_CONVERTERS.get(next(iter(types)))
+        if converter is not None:
+            return list(map(converter, values))
+
+    return [_object_to_str(v) for v in values]
+
+
+def _object_to_str(value: Any) -> str:
+    if value is _MISSING:
+        return "nan"
+    if isinstance(value, bytes):
+        return value.decode()
+    return str(_normalize_scalar_for_parquet(value))
+
+
+def _ints_fit_numeric(values: list, types: set) -> bool:
+    """Inteiros fora de int64/uint64 deixam a coluna como object no pandas."""
+    if int not in types:
+        return True
+
+    ints = [v for v in values if isinstance(v, int) and type(v) is not bool]
+    lo, hi = min(ints), max(ints)
+    if lo < _INT64_MIN or hi > _UINT64_MAX:
+        return False
+    # uint64 só existe sem negativos
+    return hi < 2 ** 63 or lo >= 0
+
+
+def _is_datetime64_column(values: list) -> bool:
+    """
+    datetime64 exige datas dentro do range [ns] e o mesmo tz em todas;
+    floats só são aceitos como NaN (viram NaT).
+    """
+    if any(v == v for v in values if type(v) is float):
+        return False
+
+    dts = [v for v in values if type(v) is datetime]
+    tzinfos = {v.tzinfo for v in dts}
+    if len(tzinfos) > 1:
+        return False
+    if tzinfos != {None}:
+        dts = [v.replace(tzinfo=None) for v in dts]
+    return _NS_MIN <= min(dts) and max(dts) < _NS_MAX
+
+
+def _deleted_at_to_str(values: list) -> list:
+    """Mesmo tratamento de _normalize_deleted_at, aplicado só à coluna."""
+    types = _value_types(values)
+    has_nulls = _Missing in types or type(None) in types
+    types.discard(_Missing)
+    types.discard(type(None))
+
+    if types and types <= {int, float} and _ints_fit_numeric(values, types):
+        series = pd.Series(
+            [v if v is not None and v is not _MISSING else float("nan") for v in values],
+            dtype="float64" if float in types or has_nulls else "int64",
+        )
+    else:
+        series = pd.Series(
+            [float("nan") if v is _MISSING else v for v in values],
+            dtype=object,
+        )
+
+    converted = pd.to_datetime(series, errors="coerce", utc=True)
+    return [v.isoformat() for v in converted]
+
+
+def normalize_documents_typed(documents, types: dict, on_error: str = "coerce"):
+    """
+    Saída tipada: colunas do mapa types (CollectionConfig.types) viram tipos
+    Arrow reais; as demais seguem como string, igual a normalize_documents_arrow.
+
+    Tipos lógicos: str, int, float, bool, timestamp (ou date/datetime, em UTC),
+    decimal / decimal(p,s) e json (objetos/listas serializados).
+
+    Todas as colunas tipadas aparecem em todo batch (null se ausentes), então o
+    schema é o mesmo entre chunks. Valores que não convertem:
+    - on_error='coerce': viram null
+    - on_error='quarantine': a linha sai da tabela e vai para a tabela de
+      quarentena (formato string de hoje)
+
+    Retorna (tabela, quarentena ou None).
+    """
+    if not documents:
+        return pa.table({}), None
+
+    typed = {_sanitize_column_name(k): _parse_logical_type(v) for k, v in types.items()}
+
+    keys = dict.fromkeys(key for doc in documents for key in doc)
+
+    columns = {}
+    bad_rows = set()
+    bad_counts = {}
+    for key in keys:
+        values = [doc.get(key, _MISSING) for doc in documents]
+        name = _sanitize_column_name(key)
+
+        if name in typed:
+            array, bad = _typed_column(values, typed[name])
+            if bad:
+                bad_rows.update(bad)
+                bad_counts[name] = len(bad)
+        elif name == "deletedAt":
+            array = pa.array(_deleted_at_to_str(values), type=pa.string())
+        else:
+            array = pa.array(_column_to_str(values), type=pa.string())
+
+        columns[name] = array
+
+    for name, (arrow_type, _) in typed.items():
+        if name not in columns:
+            columns[name] = pa.nulls(len(documents), type=arrow_type)
+
+    table = pa.Table.from_arrays(list(columns.values()), names=list(columns.keys()))
+
+    if bad_counts:
+        logger.warning(f"Valores fora do tipo declarado ({on_error}): {bad_counts}")
+
+    if on_error != "quarantine" or not bad_rows:
+        return table, None
+
+    keep = [i not in bad_rows for i in range(len(documents))]
+    quarantine = normalize_documents_arrow([documents[i] for i in sorted(bad_rows)])
+    return table.filter(pa.array(keep)), quarantine
+
+
+_TIMESTAMP_TYPE = pa.timestamp("us", tz="UTC")
+
+
+def _parse_logical_type(logical: str):
+    """Tipo lógico do catálogo -> (tipo Arrow, conversor de valor)."""
+    name = logical.strip().lower()
+
+    if name.startswith("decimal"):
+        precision, scale = 38, 9
+        if "(" in name:
+            precision, scale = (int(p) for p in name[name.index("(") + 1:name.rindex(")")].split(","))
+        return pa.decimal128(precision, scale), _decimal_converter(precision, scale)
+
+    if name not in _LOGICAL_TYPES:
+        raise ValueError(f"Tipo lógico inválido: {logical}")
+    return _LOGICAL_TYPES[name]
+
+
+def _typed_column(values: list, logical_type):
+    """Converte a coluna para o tipo lógico. Retorna (array, índices inválidos)."""
+    arrow_type, converter = logical_type
+
+    converted = []
+    bad = []
+    for i, value in enumerate(values):
+        if value is None or value is _MISSING:
+            converted.append(None)
+            continue
+        try:
+            converted.append(converter(value))
+        except (ValueError, TypeError, ArithmeticError):
+            converted.append(None)
+            bad.append(i)
+
+    return pa.array(converted, type=arrow_type), bad
+
+
+def _to_str(value):
+    return str(_normalize_scalar_for_parquet(value))
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, (float, Decimal)):
+        if value != int(value):
+            raise ValueError(f"valor não inteiro: {value}")
+        value = int(value)
+    result = int(value)
+    if not _INT64_MIN <= result < 2 ** 63:
+        raise OverflowError(f"fora de int64: {value}")
+    return result
+
+
+def _to_float(value):
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return float(value)
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "1"):
+            return True
+        if lowered in ("false", "0"):
+            return False
+        raise ValueError(f"bool inválido: {value}")
+    if value in (0, 1):
+        return bool(value)
+    raise ValueError(f"bool inválido: {value}")
+
+
+def _to_timestamp(value):
+    if isinstance(value, datetime):
+        # pymongo devolve datetimes ingênuos em UTC
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        v = value.strip()
+        if v.endswith("Z"):
+            v = v[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(v)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    raise TypeError(f"timestamp inválido: {value!r}")
+
+
+def _decimal_converter(precision: int, scale: int):
+    quantum = Decimal(1).scaleb(-scale)
+    max_digits = precision
+
+    def convert(value):
+        if isinstance(value, Decimal128):
+            value = value.to_decimal()
+        elif isinstance(value, float):
+            value = Decimal(repr(value))
+        elif not isinstance(value, Decimal):
+            value = Decimal(str(value))
+
+        result = value.quantize(quantum)
+        if len(result.as_tuple().digits) > max_digits:
+            raise OverflowError(f"decimal excede precisão {precision}: {value}")
+        return result
+
+    return convert
+
+
+_LOGICAL_TYPES = {
+    "str": (pa.string(), _to_str),
+    "string": (pa.string(), _to_str),
+    "int": (pa.int64(), _to_int),
+    "int64": (pa.int64(), _to_int),
+    "float": (pa.float64(), _to_float),
+    "double": (pa.float64(), _to_float),
+    "bool": (pa.bool_(), _to_bool),
+    "boolean": (pa.bool_(), _to_bool),
+    "date": (_TIMESTAMP_TYPE, _to_timestamp),
+    "datetime": (_TIMESTAMP_TYPE, _to_timestamp),
+    "timestamp": (_TIMESTAMP_TYPE, _to_timestamp),
+    # json: string com serialização JSON (também para escalares)
+    "json": (pa.string(), _JSON_ENCODE),
+}
+
+
 def _normalize_scalar_for_parquet(value: Any):
     if isinstance(value, ObjectId):
         return str(value)
@@ -67,15 +430,14 @@ def _sanitize_column_names(df: pd.DataFrame) -> pd.DataFrame:
     Remove caracteres problemáticos (., $, espaços) dos nomes das colunas para
     compatibilidade com BigQuery e Parquet.
     """
-    safe_columns = []
-    for col in df.columns:
-        safe = col.replace(".", "_").replace("$", "_").replace(" ", "_")
-        safe_columns.append(safe)
-
-    df.columns = safe_columns
+    df.columns = [_sanitize_column_name(col) for col in df.columns]
     return df
 
 
+def _sanitize_column_name(col: str) -> str:
+    return col.replace(".", "_").replace("$", "_").replace(" ", "_")
+
+
 def _normalize_deleted_at(df):
     if "deletedAt" in df.columns:
         df["deletedAt"] = (
@@ -0,0 +1,99 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.api_core import exceptions as gexc
+
+from .writer import get_storage_client
+
+logger = logging.getLogger("mongo_to_gcs.watermark")
+
+
+class WatermarkStore:
+    """
+    Watermarks das coleções em um único manifesto JSON no GCS:
+
+        {"<dataset>.<tabela>": {"watermark": "<iso>", "run_id": "...", "updated_at": "<iso>"}}
+
+    O manifesto é lido uma vez no início do job (load) e cada coleção
+    concluída grava o seu valor com read-modify-write condicionado à
+    generation do objeto, então execuções concorrentes não se sobrescrevem.
+    """
+
+    max_commit_attempts = 5
+
+    def __init__(self, bucket_name: str, blob_path: str):
+        self.bucket_name = bucket_name
+        self.blob_path = blob_path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """Lê o manifesto inteiro. Erros sobem: melhor falhar do que reextrair tudo."""
+        entries, _ = self._read()
+        with self._lock:
+            self._entries = entries
+        logger.info(f"Watermarks carregados de gs://{self.bucket_name}/{self.blob_path} — coleções={len(entries)}")
+        return entries
+
+    def get(self, key: str) -> Optional[datetime]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry:
+            return None
+        return _as_utc(datetime.fromisoformat(entry["watermark"]))
+
+    def commit(self, key: str, watermark: datetime, run_id: str):
+        """Grava o watermark da coleção (nunca retrocede um valor existente)."""
+        watermark = _as_utc(watermark)
+
+        with self._lock:
+            for attempt in range(1, self.max_commit_attempts + 1):
+                entries, generation = self._read()
+
+                current = entries.get(key)
+                if current and _as_utc(datetime.fromisoformat(current["watermark"])) >= watermark:
+                    self._entries = entries
+                    return
+
+                entries[key] = {
+                    "watermark": watermark.isoformat(),
+                    "run_id": run_id,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                }
+
+                try:
+                    self._write(entries, generation)
+                except gexc.PreconditionFailed:
+                    logger.warning(f"Manifesto de watermarks alterado por outra execução (tentativa {attempt}), relendo")
+                    continue
+
+                self._entries = entries
+                logger.info(f"Watermark atualizado: {key}={watermark.isoformat()}")
+                return
+
+        raise RuntimeError(f"Não foi possível gravar o watermark de {key} após {self.max_commit_attempts} tentativas")
+
+    def _read(self):
+        blob = get_storage_client().bucket(self.bucket_name).get_blob(self.blob_path)
+        if blob is None:
+            return {}, 0
+        text = blob.download_as_text(encoding="utf-8", if_generation_match=blob.generation)
+        return json.loads(text), blob.generation
+
+    def _write(self, entries: dict, generation: int):
+        blob = get_storage_client().bucket(self.bucket_name).blob(self.blob_path)
+        blob.upload_from_string(
+            json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True),
+            content_type="application/json",
+            if_generation_match=generation,
+        )
+
+
+def _as_utc(value: datetime) -> datetime:
+    # run_ts do job é ingênuo (Cloud Run roda em UTC)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
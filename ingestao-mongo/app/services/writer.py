@@ -1,4 +1,6 @@
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional, Tuple
 import os
 from io import BytesIO
 import pytz
@@ -7,6 +9,7 @@ import pyarrow as pa
 import pyarrow.parquet as pq
 from google.cloud import storage
 import logging
+import threading
 from google.api_core.retry import Retry
 import time
 import random
@@ -14,13 +17,88 @@ import requests
 from google.api_core import exceptions as gexc
 from google.auth.exceptions import TransportError
 
+from .metrics import record_retry, record_stage
+
 
 logger = logging.getLogger("mongo_to_gcs.writer")
 
-_storage_client = storage.Client()
+_storage_client = None
+_storage_lock = threading.Lock()
+
 
 def get_storage_client():
-    return _storage_client
+    """
+    Client GCS único do processo, criado no primeiro uso: os workers do
+    NORMALIZE_MODE=process importam este módulo só para codificar Parquet e
+    não precisam de credenciais.
+    """
+    global _storage_client
+    with _storage_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+        return _storage_client
+
+
+@dataclass(frozen=True)
+class ParquetLayout:
+    """
+    Layout físico dos Parquet de landing, para o BigQuery (tabela externa)
+    conseguir pular row groups pelos filtros:
+
+    - sort_by: colunas de ordenação das linhas de cada arquivo (ex.:
+      ("updatedAt", "_id")); colunas ausentes no batch são ignoradas. No
+      writer em stream e na compactação a ordenação vale por row group
+    - row_group_rows: linhas por row group (padrão do pyarrow: 1Mi)
+    - write_statistics: min/max por coluna em cada row group
+    - page_index: column/offset index, para pular páginas dentro do row group
+
+    Sem sort_by e com os padrões, a saída é a mesma de antes do layout.
+    """
+    sort_by: Tuple[str, ...] = ()
+    row_group_rows: Optional[int] = None
+    write_statistics: bool = True
+    page_index: bool = False
+
+    @classmethod
+    def from_env(cls, sort_by=None) -> "ParquetLayout":
+        """
+        PARQUET_SORT_BY (lista separada por vírgula, sobrescrita por sort_by
+        do catálogo), PARQUET_ROW_GROUP_ROWS, PARQUET_STATISTICS e
+        PARQUET_PAGE_INDEX.
+        """
+        if not sort_by:
+            sort_by = [c.strip() for c in os.getenv("PARQUET_SORT_BY", "").split(",") if c.strip()]
+        row_group_rows = os.getenv("PARQUET_ROW_GROUP_ROWS")
+        return cls(
+            sort_by=tuple(sort_by),
+            row_group_rows=int(row_group_rows) if row_group_rows else None,
+            write_statistics=os.getenv("PARQUET_STATISTICS", "true").lower() == "true",
+            page_index=os.getenv("PARQUET_PAGE_INDEX", "false").lower() == "true",
+        )
+
+    def sort(self, table: pa.Table) -> pa.Table:
+        keys = self._sort_keys(table.schema)
+        if not keys or table.num_rows < 2:
+            return table
+        return table.sort_by(keys)
+
+    def writer_options(self, schema: pa.Schema) -> dict:
+        """Argumentos de layout para pq.write_table / pq.ParquetWriter."""
+        options = {
+            "write_statistics": self.write_statistics,
+            "write_page_index": self.page_index,
+        }
+        keys = self._sort_keys(schema)
+        if keys:
+            # registra a ordenação no metadado de cada row group
+            options["sorting_columns"] = pq.SortingColumn.from_ordering(schema, keys)
+        return options
+
+    def _sort_keys(self, schema: pa.Schema) -> list:
+        return [(column, "ascending") for column in self.sort_by if column in schema.names]
+
+
+_DEFAULT_LAYOUT = ParquetLayout()
 
 def dataframe_to_parquet_gcs(
     df: pd.DataFrame,
@@ -28,44 +106,359 @@ def dataframe_to_parquet_gcs(
     prefix: str,
     file_prefix: str,
     ingest_ts,
-    run_id: str
+    run_id: str,
+    partition_date=None,
+    layout: ParquetLayout = None
 ):
-    client = get_storage_client()
-    bucket = client.bucket(bucket_name)
-
     # file_suffix = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
 
-    partition = ingest_ts.date().isoformat()
+    table = _dataframe_to_table(df, ingest_ts, run_id)
+
+    return _upload_table(table, bucket_name, prefix, file_prefix, ingest_ts, run_id, partition_date, layout)
+
+
+def arrow_table_to_parquet_gcs(
+    table: pa.Table,
+    bucket_name: str,
+    prefix: str,
+    file_prefix: str,
+    ingest_ts,
+    run_id: str,
+    partition_date=None,
+    layout: ParquetLayout = None
+):
+    """
+    Equivalente a dataframe_to_parquet_gcs para tabelas já em Arrow
+    (saída de normalize_documents_arrow), sem passar pelo pandas.
+    """
+    table = _arrow_to_table(table, ingest_ts, run_id)
+
+    return _upload_table(table, bucket_name, prefix, file_prefix, ingest_ts, run_id, partition_date, layout)
+
+
+def dataframe_to_parquet_bytes(df: pd.DataFrame, ingest_ts, run_id: str, layout: ParquetLayout = None) -> bytes:
+    """Serializa o DataFrame em Parquet (com colunas técnicas) sem enviar ao GCS."""
+    return _table_to_parquet_bytes(_dataframe_to_table(df, ingest_ts, run_id), layout)
+
+
+def arrow_table_to_parquet_bytes(table: pa.Table, ingest_ts, run_id: str, layout: ParquetLayout = None) -> bytes:
+    """Serializa a tabela Arrow em Parquet (com colunas técnicas) sem enviar ao GCS."""
+    return _table_to_parquet_bytes(_arrow_to_table(table, ingest_ts, run_id), layout)
+
+
+def parquet_bytes_to_gcs(
+    data: bytes,
+    bucket_name: str,
+    prefix: str,
+    file_prefix: str,
+    ingest_ts,
+    run_id: str,
+    partition_date=None
+):
+    """Envia um Parquet já serializado (ex.: por um processo do pool)."""
+    return _upload_bytes(data, bucket_name, prefix, file_prefix, ingest_ts, run_id, partition_date)
+
+
+class StreamingParquetWriter:
+    """
+    Writer Parquet por coleção: mantém um ParquetWriter aberto, grava cada
+    batch como row group e envia os bytes direto para um upload resumable no
+    GCS (sem BytesIO intermediário). Ao atingir target_file_bytes, finaliza o
+    objeto atual e abre o próximo ({file_prefix}_00000.parquet, _00001, ...).
+
+    Se um batch trouxer colunas fora do schema do arquivo aberto, o arquivo
+    é fechado e o próximo nasce com o schema novo; colunas ausentes no batch
+    são preenchidas com null.
+
+    blob_dir troca o destino {prefix}/dt=/run_id/ por um diretório fixo e
+    row_group_rows limita as linhas por row group (padrão: um por batch).
+    first_file_index define o número do primeiro arquivo (retomada de
+    checkpoint) e on_file_closed(índice, blob, linhas, marker) é chamado a
+    cada arquivo finalizado, com o marker do último batch gravado nele.
+    partition_date (em todos os writers) troca a data do dt=, que por padrão
+    é a de ingest_ts, e layout (também em todos) define ordenação,
+    estatísticas e page index; row_group_rows tem precedência sobre o do
+    layout.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str,
+        file_prefix: str,
+        ingest_ts,
+        run_id: str,
+        target_file_bytes: int = 512 * 1024 * 1024,
+        upload_chunk_bytes: int = 16 * 1024 * 1024,
+        blob_dir: str = None,
+        row_group_rows: int = None,
+        partition_date=None,
+        layout: ParquetLayout = None,
+        first_file_index: int = 0,
+        on_file_closed=None,
+    ):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.file_prefix = file_prefix
+        self.ingest_ts = ingest_ts
+        self.run_id = run_id
+        self.target_file_bytes = target_file_bytes
+        self.upload_chunk_bytes = upload_chunk_bytes
+        self.blob_dir = blob_dir
+        self.layout = layout or _DEFAULT_LAYOUT
+        self.row_group_rows = row_group_rows or self.layout.row_group_rows
+        self.partition_date = partition_date
+        self.on_file_closed = on_file_closed
+
+        self.blob_paths = []
+        self._file_index = first_file_index
+        self._marker = None
+        self._blob_path = None
+        self._sink = None
+        self._writer = None
+        self._rows_in_file = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write_dataframe(self, df: pd.DataFrame, marker=None):
+        self._write(_dataframe_to_table(df, self.ingest_ts, self.run_id), marker)
+
+    def write_table(self, table: pa.Table, marker=None):
+        """marker: valor do batch (ex.: último _id) repassado a on_file_closed."""
+        self._write(_arrow_to_table(table, self.ingest_ts, self.run_id), marker)
+
+    def close(self) -> list:
+        """Finaliza o arquivo aberto e retorna os blobs gravados."""
+        self._close_file()
+        return self.blob_paths
+
+    def abort(self):
+        """
+        Descarta o arquivo em andamento sem finalizar o upload resumable
+        (o objeto parcial nunca fica visível no bucket).
+
+        Soltar as referências não basta: no garbage collection o
+        ParquetWriter grava o footer e o BlobWriter chama close(), que envia
+        o último chunk e finaliza o objeto (um Parquet truncado, mas válido).
+        """
+        if self._writer is not None:
+            logger.warning(f"Upload abortado, descartando gs://{self.bucket_name}/{self._blob_path}")
+            # sem close(): o footer não é gravado
+            self._writer.is_open = False
+            _cancel_blob_writer(self._sink)
+        self._writer = None
+        self._sink = None
+        self._blob_path = None
+
+    def _write(self, table: pa.Table, marker=None):
+        if self._writer is not None and not set(table.column_names) <= set(self._writer.schema.names):
+            logger.info(f"Novas colunas no batch, iniciando novo arquivo após {self._blob_path}")
+            self._close_file()
+
+        if self._writer is None:
+            self._open_file(table.schema)
+
+        start = time.perf_counter()
+        table = self.layout.sort(_conform_to_schema(table, self._writer.schema))
+        # inclui o envio dos chunks do upload resumable que ficarem cheios
+        self._writer.write_table(table, row_group_size=self.row_group_rows)
+        record_stage("parquet_encode", time.perf_counter() - start, table.num_rows)
+        self._rows_in_file += table.num_rows
+        self._marker = marker
 
+        if self._sink.tell() >= self.target_file_bytes:
+            self._close_file()
+
+    def _open_file(self, schema: pa.Schema):
+        bucket = get_storage_client().bucket(self.bucket_name)
+
+        file_name = f"{self.file_prefix}_{self._file_index:05d}.parquet"
+        blob_dir = self.blob_dir or run_blob_dir(self.prefix, self.ingest_ts, self.run_id, self.partition_date)
+        self._blob_path = f"{blob_dir}/{file_name}"
+
+        # if_generation_match=0 torna o upload idempotente e habilita o
+        # retry por chunk da biblioteca
+        self._sink = bucket.blob(self._blob_path).open(
+            "wb",
+            chunk_size=self.upload_chunk_bytes,
+            ignore_flush=True,
+            content_type="application/octet-stream",
+            if_generation_match=0,
+            timeout=1200,
+        )
+        schema = schema.remove_metadata()
+        self._writer = pq.ParquetWriter(
+            self._sink,
+            schema,
+            compression="snappy",
+            coerce_timestamps="us",
+            **self.layout.writer_options(schema),
+        )
+        self._rows_in_file = 0
+        self._file_index += 1
+
+    def _close_file(self):
+        if self._writer is None:
+            return
+
+        start = time.perf_counter()
+        self._writer.close()
+        size = self._sink.tell()
+        self._sink.close()
+        record_stage("gcs_upload", time.perf_counter() - start, self._rows_in_file, size)
+
+        logger.info(
+            f"Parquet salvo em: gs://{self.bucket_name}/{self._blob_path} "
+            f"(linhas={self._rows_in_file} bytes={size})"
+        )
+        self.blob_paths.append(self._blob_path)
+        if self.on_file_closed is not None:
+            self.on_file_closed(self._file_index - 1, self._blob_path, self._rows_in_file, self._marker)
+
+        self._writer = None
+        self._sink = None
+        self._blob_path = None
+
+
+def _cancel_blob_writer(sink):
+    """
+    Encerra um BlobWriter sem finalizar o objeto: fecha só o buffer local
+    (close() e __del__ deixam de enviar o último chunk e novas escritas
+    falham) e, se a sessão resumable já foi aberta, cancela a sessão no GCS
+    (DELETE na URL da sessão; os chunks enviados são descartados).
+    """
+    sink._buffer.close()
+    if not sink._upload_and_transport:
+        return
+
+    upload, transport = sink._upload_and_transport
+    try:
+        response = transport.request("DELETE", upload.resumable_url, timeout=60)
+        # 499 é a resposta do GCS para sessão cancelada
+        if response.status_code not in (204, 499):
+            logger.warning(f"Cancelamento do upload resumable retornou status={response.status_code}")
+    except Exception as e:
+        # sessão não finalizada expira sozinha (o objeto nunca é criado)
+        logger.warning(f"Falha ao cancelar upload resumable: {e}")
+
+
+def _dataframe_to_table(df: pd.DataFrame, ingest_ts, run_id: str) -> pa.Table:
+    start = time.perf_counter()
     df["dt_ingestao"] = ingest_ts
     df['dt_ingestao'] = pd.to_datetime(df['dt_ingestao']).dt.tz_localize(None).astype("datetime64[ns]")
     df["id_execucao"] = run_id
 
+    schema = _build_schema(df.columns)
+
+    # Cria tabela Arrow respeitando schema fixo
+    table = pa.Table.from_pandas(
+        df,
+        schema=schema,
+        preserve_index=False
+    )
+    record_stage("arrow_build", time.perf_counter() - start, table.num_rows)
+    return table
+
+
+def _arrow_to_table(table: pa.Table, ingest_ts, run_id: str) -> pa.Table:
+    start = time.perf_counter()
+    table = _with_technical_columns(table, ingest_ts, run_id)
+    table = table.select(_build_schema(table.column_names).names)
+    record_stage("arrow_build", time.perf_counter() - start, table.num_rows)
+    return table
+
+
+def _conform_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Completa com null as colunas do schema ausentes no batch e reordena."""
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            columns.append(table.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(table.num_rows, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _build_schema(columns) -> pa.Schema:
     # Construção do schema fixo (todos string + técnicos)
-    fields = [pa.field(col, pa.string()) for col in sorted(df.columns)
+    fields = [pa.field(col, pa.string()) for col in sorted(columns)
               if col not in ["dt_ingestao", "id_execucao"]]
 
     fields.append(pa.field("dt_ingestao", pa.timestamp("ns")))
     fields.append(pa.field("id_execucao", pa.string()))
 
-    schema = pa.schema(fields)
+    return pa.schema(fields)
 
-    # Cria tabela Arrow respeitando schema fixo
-    table = pa.Table.from_pandas(
-        df,
-        schema=schema,
-        preserve_index=False
+
+def _with_technical_columns(table: pa.Table, ingest_ts, run_id: str) -> pa.Table:
+    for col in ("dt_ingestao", "id_execucao"):
+        if col in table.column_names:
+            table = table.drop_columns([col])
+
+    n = table.num_rows
+    dt_ingestao = pa.scalar(ingest_ts.replace(tzinfo=None), type=pa.timestamp("ns"))
+    table = table.append_column("dt_ingestao", pa.repeat(dt_ingestao, n))
+    table = table.append_column("id_execucao", pa.repeat(pa.scalar(run_id, type=pa.string()), n))
+    return table
+
+
+def _table_to_parquet_bytes(table: pa.Table, layout: ParquetLayout = None) -> bytes:
+    layout = layout or _DEFAULT_LAYOUT
+    start = time.perf_counter()
+    table = layout.sort(table)
+    buffer = BytesIO()
+    # df.to_parquet(buffer, index=False, compression="snappy")
+    pq.write_table(
+        table,
+        buffer,
+        compression="snappy",
+        coerce_timestamps='us',
+        row_group_size=layout.row_group_rows,
+        **layout.writer_options(table.schema),
     )
+    data = buffer.getvalue()
+    record_stage("parquet_encode", time.perf_counter() - start, table.num_rows, len(data))
+    return data
+
+
+def _upload_table(table: pa.Table, bucket_name: str, prefix: str, file_prefix: str, ingest_ts, run_id: str,
+                  partition_date=None, layout: ParquetLayout = None):
+    # Serialização em Parquet
+    return _upload_bytes(
+        _table_to_parquet_bytes(table, layout), bucket_name, prefix, file_prefix, ingest_ts, run_id, partition_date
+    )
+
+
+def _partition(ingest_ts, partition_date=None) -> str:
+    # dt= é a data da ingestão, salvo quando o chamador fixa outra (backfill)
+    return (partition_date or ingest_ts.date()).isoformat()
+
+
+def run_blob_dir(prefix: str, ingest_ts, run_id: str, partition_date=None) -> str:
+    """Diretório dos arquivos de uma execução: {prefix}/dt=/run_id."""
+    return f"{prefix}/dt={_partition(ingest_ts, partition_date)}/{run_id}"
+
+
+def _upload_bytes(data: bytes, bucket_name: str, prefix: str, file_prefix: str, ingest_ts, run_id: str,
+                  partition_date=None):
+    client = get_storage_client()
+    bucket = client.bucket(bucket_name)
 
     # Caminho final no GCS
     file_name = f"{file_prefix}.parquet"
-    blob_path = f"{prefix}/dt={partition}/{run_id}/{file_name}"
+    blob_path = f"{run_blob_dir(prefix, ingest_ts, run_id, partition_date)}/{file_name}"
     blob = bucket.blob(blob_path)
 
-    # Serialização em Parquet
-    buffer = BytesIO()
-    # df.to_parquet(buffer, index=False, compression="snappy")
-    pq.write_table(table, buffer, compression="snappy", coerce_timestamps='us')
+    buffer = BytesIO(data)
+    start = time.perf_counter()
     # 🔒 Retry manual robusto
     max_attempts = 5
     last_exception = None
@@ -80,6 +473,7 @@ def dataframe_to_parquet_gcs(
             )
 
             logger.info(f"Parquet salvo em: gs://{bucket_name}/{blob_path}")
+            record_stage("gcs_upload", time.perf_counter() - start, 0, len(data))
             return blob_path
 
         except (
@@ -92,6 +486,7 @@ def dataframe_to_parquet_gcs(
         ) as e:
 
             last_exception = e
+            record_retry("gcs_upload")
 
             sleep_time = min(60, 2 ** attempt) + random.random()
             logger.warning(
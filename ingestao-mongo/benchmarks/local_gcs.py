@@ -0,0 +1,134 @@
+"""
+Substituto de google.cloud.storage.Client que grava em disco, para os
+benchmarks rodarem o caminho de escrita real (writer, checkpoints,
+compactação) sem GCS. gs://<bucket>/<path> vira <LOCAL_GCS_ROOT>/<bucket>/<path>.
+
+Cobre só os métodos usados pelo job.
+"""
+import fnmatch
+import os
+import shutil
+import tempfile
+
+from google.api_core.exceptions import PreconditionFailed
+
+
+class LocalStorageClient:
+    def __init__(self, *args, **kwargs):
+        self.root = os.getenv("LOCAL_GCS_ROOT") or os.path.join(tempfile.gettempdir(), "local_gcs")
+
+    def bucket(self, name: str) -> "LocalBucket":
+        return LocalBucket(os.path.join(self.root, name))
+
+
+class LocalBucket:
+    def __init__(self, root: str):
+        self.root = root
+
+    def blob(self, name: str) -> "LocalBlob":
+        return LocalBlob(self, name)
+
+    def get_blob(self, name: str):
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix: str = "", match_glob: str = None):
+        if not os.path.isdir(self.root):
+            return []
+        names = []
+        for directory, _, files in os.walk(self.root):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(directory, file_name), self.root).replace(os.sep, "/")
+                if name.startswith(prefix) and (match_glob is None or fnmatch.fnmatchcase(name, match_glob)):
+                    names.append(name)
+        return [self.blob(name) for name in sorted(names)]
+
+    def copy_blob(self, blob: "LocalBlob", destination_bucket: "LocalBucket", new_name: str):
+        target = destination_bucket.blob(new_name)
+        os.makedirs(os.path.dirname(target.path), exist_ok=True)
+        shutil.copyfile(blob.path, target.path)
+        return target
+
+
+class LocalBlob:
+    def __init__(self, bucket: LocalBucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def generation(self) -> int:
+        return os.stat(self.path).st_mtime_ns if self.exists() else 0
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def delete(self):
+        os.remove(self.path)
+
+    def open(self, mode: str = "rb", if_generation_match: int = None, **kwargs):
+        if "w" not in mode:
+            return open(self.path, mode)
+        if if_generation_match == 0 and self.exists():
+            raise PreconditionFailed(f"gs://{self.name} já existe (if_generation_match=0)")
+        return LocalBlobWriter(self)
+
+    def upload_from_file(self, file_obj, **kwargs):
+        with self.open("wb") as f:
+            shutil.copyfileobj(file_obj, f)
+
+    def upload_from_string(self, data, **kwargs):
+        with self.open("wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def download_as_text(self, encoding: str = "utf-8", **kwargs) -> str:
+        return self.download_as_bytes().decode(encoding)
+
+
+class LocalBlobWriter:
+    """
+    Escrita de LocalBlob.open("wb") com a semântica do BlobWriter do upload
+    resumable: o objeto só aparece no close(). Os atributos _buffer e
+    _upload_and_transport são os que writer._cancel_blob_writer usa para
+    descartar o upload (sem sessão aberta, só fecha o buffer).
+    """
+
+    _upload_and_transport = None
+
+    def __init__(self, blob: LocalBlob):
+        self._blob = blob
+        # fora do diretório do bucket, para não aparecer em list_blobs
+        upload_dir = os.path.join(os.path.dirname(blob.bucket.root), ".uploads")
+        os.makedirs(upload_dir, exist_ok=True)
+        self._buffer = tempfile.NamedTemporaryFile(dir=upload_dir, delete=False)
+
+    @property
+    def closed(self) -> bool:
+        return self._buffer.closed
+
+    def write(self, data) -> int:
+        return self._buffer.write(data)
+
+    def tell(self) -> int:
+        return self._buffer.tell()
+
+    def flush(self):
+        self._buffer.flush()
+
+    def close(self):
+        if self._buffer.closed:
+            return
+        self._buffer.close()
+        os.makedirs(os.path.dirname(self._blob.path), exist_ok=True)
+        os.replace(self._buffer.name, self._blob.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,290 @@
+"""
+Benchmark local do caminho completo de _process_collection (cursor -> chunk ->
+normalize -> Parquet -> sink) com uma coleção sintética e o sink em disco
+(benchmarks.local_gcs), sem tocar GCS, BigQuery nem Secret Manager.
+
+Fonte dos documentos (--source):
+- memory (padrão): stand-in em memória com a interface do MongoRepository;
+  guarda BSON e decodifica na leitura, como o cursor do pymongo
+- mongomock: coleção mongomock (pip install mongomock)
+- mongod: mongod local (--mongo-uri); a coleção é recriada no banco `bench`
+
+Cada batch size roda em um processo novo, para o pico de RSS de uma rodada
+não contaminar a próxima. As variáveis do job (TRANSFORM_ENGINE,
+WRITER_MODE, STAGED_PIPELINE, NORMALIZE_MODE, CHUNK_MAX_MB, ...) valem como
+na execução normal.
+
+Uso (a partir de ingestao-mongo/):
+    python -m benchmarks.pipeline_benchmark --docs 200000 --depth 2 --width 4 --batch-sizes 5000,20000,50000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from benchmarks.local_gcs import LocalStorageClient
+from benchmarks.transformer_benchmark import generate_documents
+
+COLLECTION = "bench_collection"
+BUCKET = "bench"
+
+
+def generate_nested_documents(n: int, depth: int = 2, width: int = 4, seed: int = 42) -> list:
+    """
+    Documentos de generate_documents com um subdocumento `payload` de
+    `depth` níveis e `width` campos por nível, mais uma lista de itens.
+    """
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1)
+
+    def leaf(i):
+        kind = i % 4
+        if kind == 0:
+            return f"v{rnd.randint(0, 10**6)}"
+        if kind == 1:
+            return rnd.randint(0, 10**6)
+        if kind == 2:
+            return rnd.random()
+        return base + timedelta(seconds=rnd.randint(0, 10**7))
+
+    def nested(level):
+        if level == 0:
+            return {f"f{i}": leaf(i) for i in range(width)}
+        return {f"n{i}": nested(level - 1) for i in range(width)}
+
+    docs = generate_documents(n, seed)
+    for doc in docs:
+        if depth > 0:
+            doc["payload"] = nested(depth - 1)
+            doc["items"] = [nested(0) for _ in range(rnd.randint(0, width))]
+    return docs
+
+
+class _BsonCursor:
+    """Cursor em memória: guarda BSON e decodifica a cada documento lido."""
+
+    def __init__(self, raw_documents: list, raw: bool):
+        self._raw_documents = raw_documents
+        self._raw = raw
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def allow_disk_use(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        for data in self._raw_documents:
+            yield RawBSONDocument(data) if self._raw else bson.decode(data)
+
+
+class InMemoryRepository:
+    """Stand-in do MongoRepository para a fonte memory."""
+
+    def __init__(self, documents: list):
+        self._raw_documents = [bson.encode(doc) for doc in documents]
+
+    def find(self, query, projection, raw: bool = False, **kwargs):
+        return _BsonCursor(self._raw_documents, raw)
+
+    def aggregate(self, pipeline: list, raw: bool = False, **kwargs):
+        return _BsonCursor(self._raw_documents, raw)
+
+    def collection_stats(self) -> dict:
+        return {"count": len(self._raw_documents), "size": sum(len(d) for d in self._raw_documents)}
+
+    def explain_find(self, query, projection=None):
+        return {}
+
+
+class CollectionRepository:
+    """Stand-in do MongoRepository sobre uma coleção mongomock ou pymongo."""
+
+    def __init__(self, collection, native_raw: bool):
+        self._collection = collection
+        self._native_raw = native_raw
+
+    def find(self, query, projection, raw: bool = False, **kwargs):
+        if self._native_raw:
+            from bson.codec_options import CodecOptions
+
+            collection = self._collection
+            if raw:
+                collection = collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+            return collection.find(query, projection, **kwargs)
+
+        # mongomock não tem RawBSONDocument nem as opções de cursor do pymongo
+        cursor = self._collection.find(query or {}, projection)
+        if not raw:
+            return cursor
+        return _BsonCursor([bson.encode(doc) for doc in cursor], raw=True)
+
+    def aggregate(self, pipeline: list, raw: bool = False, **kwargs):
+        return self.find(None, None, raw=raw)
+
+    def collection_stats(self) -> dict:
+        return {"count": self._collection.estimated_document_count(), "size": None}
+
+    def explain_find(self, query, projection=None):
+        return {}
+
+
+class _CatalogRow(dict):
+    """Linha do catálogo com a mesma interface do bigquery.Row usada pelo job."""
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+def _repository(options: dict, documents):
+    if options["source"] == "memory":
+        return InMemoryRepository(documents)
+
+    if options["source"] == "mongomock":
+        import mongomock
+
+        collection = mongomock.MongoClient()["bench"][COLLECTION]
+        collection.insert_many(documents)
+        return CollectionRepository(collection, native_raw=False)
+
+    from pymongo import MongoClient
+
+    collection = MongoClient(options["mongo_uri"])["bench"][COLLECTION]
+    return CollectionRepository(collection, native_raw=True)
+
+
+def _run_once(options: dict, batch_size: int) -> dict:
+    """Executado no processo da rodada: um _process_collection completo."""
+    os.environ["LOCAL_GCS_ROOT"] = options["sink"]
+    os.environ["BUCKET_NAME"] = BUCKET
+    os.environ["METRICS_TRACK_RSS"] = "true"
+    os.environ.setdefault("EXPLAIN_QUERY", "false")
+
+    # o client de storage é criado no primeiro uso (writer.get_storage_client),
+    # então o patch vale para a rodada inteira; os workers do
+    # NORMALIZE_MODE=process só codificam Parquet e não usam o client
+    with mock.patch("google.cloud.storage.Client", LocalStorageClient):
+        return _run_patched(options, batch_size)
+
+
+def _run_patched(options: dict, batch_size: int) -> dict:
+    from app import main
+    from app.services.metrics import RunMetrics
+    from app.services.offload import shutdown_process_pool
+
+    documents = None
+    if options["source"] != "mongod":
+        documents = generate_nested_documents(options["docs"], options["depth"], options["width"])
+    repository = _repository(options, documents)
+    del documents
+
+    main.MongoRepository = lambda mongo_secret, collection_name: repository
+    main.load_mongo_secret = lambda name: {"connections": [{"database_name": "bench"}]}
+    main._get_bigquery_client = lambda: None
+
+    row = _CatalogRow(
+        SOURCE_TABLE_NAME=COLLECTION,
+        PIPELINE_TYPE="STANDARD",
+        TARGET_DATASET="bench",
+        TARGET_TABLE_NAME=COLLECTION,
+    )
+    run_metrics = RunMetrics(run_id=f"bench_{batch_size}")
+    run_ts = datetime.now()
+
+    try:
+        docs, seconds, _ = main._run_task(
+            None, run_metrics, row, "bench", run_ts, run_metrics.run_id, "bench",
+            "2000-01-01", None, batch_size, None, None, None,
+        )
+    finally:
+        # NORMALIZE_MODE=process: como no fim do run()
+        shutdown_process_pool()
+
+    sink_bytes = sum(
+        os.path.getsize(os.path.join(directory, f))
+        for directory, _, files in os.walk(options["sink"]) for f in files
+    )
+    return {
+        "batch_size": batch_size,
+        "docs": docs,
+        "seconds": seconds,
+        "sink_bytes": sink_bytes,
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "stages": run_metrics.records[0]["stages"],
+    }
+
+
+def _seed_mongod(options: dict):
+    from pymongo import MongoClient
+
+    collection = MongoClient(options["mongo_uri"])["bench"][COLLECTION]
+    collection.drop()
+    for start in range(0, options["docs"], 50_000):
+        n = min(50_000, options["docs"] - start)
+        collection.insert_many(generate_nested_documents(n, options["depth"], options["width"], seed=start))
+
+
+def _print_result(result: dict):
+    mb = 1024 * 1024
+    docs_per_second = result["docs"] / result["seconds"] if result["seconds"] else 0.0
+    print(
+        f"\nbatch_size={result['batch_size']:,}  docs={result['docs']:,}  wall={result['seconds']:.2f}s  "
+        f"docs/s={docs_per_second:,.0f}  saída={result['sink_bytes'] / mb:,.1f}MB "
+        f"({result['sink_bytes'] / mb / result['seconds'] if result['seconds'] else 0:,.1f}MB/s)  "
+        f"pico_rss={result['max_rss'] / mb:,.0f}MB"
+    )
+    print(f"  {'estágio':<20}{'segundos':>10}{'docs/s':>14}{'MB/s':>10}{'pico_rss':>12}")
+    for stage, values in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        seconds = values["seconds"]
+        rate = f"{values['docs'] / seconds:,.0f}" if seconds and values["docs"] else "-"
+        throughput = f"{values['bytes'] / mb / seconds:,.1f}" if seconds and values["bytes"] else "-"
+        peak = f"{values['peak_rss'] / mb:,.0f}MB" if values.get("peak_rss") else "-"
+        print(f"  {stage:<20}{seconds:>10.2f}{rate:>14}{throughput:>10}{peak:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=2, help="níveis do subdocumento payload (0 = sem)")
+    parser.add_argument("--width", type=int, default=4, help="campos por nível do payload")
+    parser.add_argument("--batch-sizes", default="5000,20000,50000")
+    parser.add_argument("--source", choices=["memory", "mongomock", "mongod"], default="memory")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--sink", default=None, help="diretório do sink local (padrão: temporário)")
+    args = parser.parse_args()
+
+    options = {
+        "docs": args.docs,
+        "depth": args.depth,
+        "width": args.width,
+        "source": args.source,
+        "mongo_uri": args.mongo_uri,
+        "sink": args.sink or tempfile.mkdtemp(prefix="bench_sink_"),
+    }
+    if args.source == "mongod":
+        _seed_mongod(options)
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",") if size.strip()]
+    context = multiprocessing.get_context("spawn")
+
+    for batch_size in batch_sizes:
+        shutil.rmtree(options["sink"], ignore_errors=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(_run_once, options, batch_size).result()
+        _print_result(result)
+
+    if not args.sink:
+        shutil.rmtree(options["sink"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
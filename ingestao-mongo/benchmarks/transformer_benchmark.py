@@ -0,0 +1,84 @@
+"""
+Benchmark local do transformer: compara docs/s de normalize_documents (pandas)
+com normalize_documents_arrow em documentos sintéticos.
+
+Uso (a partir de ingestao-mongo/):
+    python -m benchmarks.transformer_benchmark --docs 100000 --batch-size 20000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import Binary, Decimal128, ObjectId
+from bson.int64 import Int64
+
+from app.services.transformer import normalize_documents, normalize_documents_arrow
+
+
+def generate_documents(n: int, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    docs = []
+    for i in range(n):
+        doc = {
+            "_id": ObjectId(),
+            "document": f"{rnd.randint(0, 10**11):011d}",
+            "name": f"cliente {i}",
+            "amount": Decimal128(f"{rnd.random() * 1000:.2f}"),
+            "quantity": rnd.randint(0, 500),
+            # o pymongo decodifica int64 como bson.int64.Int64
+            "version": Int64(rnd.randint(0, 2**40)),
+            "checksum": Binary(f"{rnd.getrandbits(32):08x}".encode()),
+            "active": rnd.random() > 0.1,
+            "createdAt": base + timedelta(seconds=rnd.randint(0, 10**7)),
+            "updatedAt": base + timedelta(seconds=rnd.randint(0, 10**7)),
+            "address": {"city": "São Paulo", "zip": f"{rnd.randint(0, 99999):05d}"},
+            "tags": [f"t{rnd.randint(0, 9)}" for _ in range(rnd.randint(0, 4))],
+            "deleted": False,
+        }
+        # campos esparsos, como em coleções reais
+        if rnd.random() < 0.3:
+            doc["deletedAt"] = base + timedelta(days=rnd.randint(0, 300))
+        if rnd.random() < 0.5:
+            doc["score"] = rnd.random()
+        if rnd.random() < 0.5:
+            doc["sequence"] = Int64(i)
+        docs.append(doc)
+    return docs
+
+
+def _measure(fn, batches) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        fn(batch)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = generate_documents(args.docs)
+    batches = [docs[i:i + args.batch_size] for i in range(0, len(docs), args.batch_size)]
+
+    engines = {
+        "pandas": normalize_documents,
+        "arrow": normalize_documents_arrow,
+    }
+
+    results = {}
+    for name, fn in engines.items():
+        # melhor de N para reduzir ruído
+        elapsed = min(_measure(fn, batches) for _ in range(args.repeat))
+        results[name] = args.docs / elapsed
+        print(f"{name:<8} {elapsed:8.3f}s  {results[name]:12,.0f} docs/s")
+
+    print(f"speedup arrow/pandas: {results['arrow'] / results['pandas']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
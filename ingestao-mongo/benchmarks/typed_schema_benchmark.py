@@ -0,0 +1,98 @@
+"""
+Benchmark local da saída tipada: compara tamanho do Parquet e custo de scan
+estimado entre a saída atual (tudo string) e normalize_documents_typed.
+
+O custo de scan considera as colunas de uma consulta típica de
+incremental (filtro em updatedAt + soma de amount/quantity) e usa os tamanhos
+lógicos do BigQuery: STRING = 2 + bytes UTF-8, INT64/FLOAT64/TIMESTAMP = 8,
+BOOL = 1, NUMERIC = 16.
+
+Uso (a partir de ingestao-mongo/):
+    python -m benchmarks.typed_schema_benchmark --docs 100000
+"""
+import argparse
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.services.transformer import normalize_documents_arrow, normalize_documents_typed
+from benchmarks.transformer_benchmark import generate_documents
+
+TYPES = {
+    "amount": "decimal(18,2)",
+    "quantity": "int",
+    "active": "bool",
+    "createdAt": "timestamp",
+    "updatedAt": "timestamp",
+    "deletedAt": "timestamp",
+    "score": "float",
+    "address": "json",
+    "tags": "json",
+}
+
+QUERY_COLUMNS = ["updatedAt", "amount", "quantity"]
+
+
+def _parquet_bytes(table: pa.Table) -> bytes:
+    buffer = BytesIO()
+    pq.write_table(table, buffer, compression="snappy")
+    return buffer.getvalue()
+
+
+def _compressed_bytes(data: bytes, columns) -> int:
+    metadata = pq.ParquetFile(BytesIO(data)).metadata
+    total = 0
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for c in range(row_group.num_columns):
+            chunk = row_group.column(c)
+            if chunk.path_in_schema in columns:
+                total += chunk.total_compressed_size
+    return total
+
+
+def _bigquery_logical_bytes(table: pa.Table, columns) -> int:
+    total = 0
+    for name in columns:
+        column = table.column(name)
+        non_null = len(column) - column.null_count
+        if pa.types.is_string(column.type):
+            total += sum(2 + len(v.as_py().encode("utf-8")) for v in column if v.is_valid)
+        elif pa.types.is_decimal(column.type):
+            total += 16 * non_null
+        elif pa.types.is_boolean(column.type):
+            total += non_null
+        else:
+            total += 8 * non_null
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100_000)
+    args = parser.parse_args()
+
+    docs = generate_documents(args.docs)
+
+    string_table = normalize_documents_arrow(docs)
+    typed_table, _ = normalize_documents_typed(docs, TYPES)
+
+    results = {}
+    for name, table in (("string", string_table), ("typed", typed_table)):
+        data = _parquet_bytes(table)
+        results[name] = (
+            len(data),
+            _compressed_bytes(data, QUERY_COLUMNS),
+            _bigquery_logical_bytes(table, QUERY_COLUMNS),
+        )
+        size, scan, logical = results[name]
+        print(f"{name:<7} arquivo={size / 1e6:8.2f}MB  scan_parquet={scan / 1e6:8.2f}MB  scan_bq_logico={logical / 1e6:8.2f}MB")
+
+    for label, idx in (("arquivo", 0), ("scan_parquet", 1), ("scan_bq_logico", 2)):
+        reduction = 1 - results["typed"][idx] / results["string"][idx]
+        print(f"redução {label}: {reduction:.1%}")
+
+
+if __name__ == "__main__":
+    main()
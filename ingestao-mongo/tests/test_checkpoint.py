@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.services import checkpoint as checkpoint_module
+from app.services.checkpoint import CollectionCheckpoint, IdSplitPlan
+from app.services.partitioning import build_id_ranges
+from benchmarks.local_gcs import LocalStorageClient
+
+BUCKET = "bucket"
+WINDOW = {"start": "2024-01-01", "end": None}
+RUN_TS = datetime(2024, 1, 2)
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setenv("LOCAL_GCS_ROOT", str(tmp_path))
+    client = LocalStorageClient()
+    monkeypatch.setattr(checkpoint_module, "get_storage_client", lambda: client)
+    return client.bucket(BUCKET)
+
+
+def _ranges(*boundaries):
+    return build_id_ranges([ObjectId(b) for b in boundaries])
+
+
+def _checkpoint():
+    return CollectionCheckpoint(BUCKET, "mongo/_state/checkpoints/db/colecao_r001.json")
+
+
+def _write_part(storage, cp, index, last_id):
+    path = f"mongo/db/colecao/dt=2024-01-02/run/colecao_r001_part_{index:05d}.parquet"
+    storage.blob(path).upload_from_string(b"parquet")
+    cp.mark_part(index, path, last_id, 10)
+    return path
+
+
+def test_resume_with_same_range_keeps_progress(storage):
+    id_range = _ranges("65a000000000000000000000", "65b000000000000000000000")[1]
+    cp = _checkpoint()
+    cp.open("run", RUN_TS, WINDOW, id_range.bounds)
+    _write_part(storage, cp, 0, ObjectId("65a000000000000000000001"))
+
+    resumed = _checkpoint()
+    assert resumed.open("run", RUN_TS, WINDOW, id_range.bounds)
+    assert resumed.next_index == 1
+    assert resumed.last_id == ObjectId("65a000000000000000000001")
+
+
+def test_resume_with_different_range_discards_progress(storage):
+    old = _ranges("65a000000000000000000000", "65b000000000000000000000")[1]
+    new = _ranges("65a800000000000000000000", "65c000000000000000000000")[1]
+    cp = _checkpoint()
+    cp.open("run", RUN_TS, WINDOW, old.bounds)
+    path = _write_part(storage, cp, 0, ObjectId("65a000000000000000000001"))
+
+    resumed = _checkpoint()
+    assert not resumed.open("run", RUN_TS, WINDOW, new.bounds)
+    assert resumed.next_index == 0
+    assert resumed.last_id is None
+    assert not storage.blob(path).exists()
+
+
+def test_done_range_with_different_bounds_is_not_skipped(storage):
+    old = _ranges("65a000000000000000000000")[1]
+    new = _ranges("65b000000000000000000000")[1]
+    cp = _checkpoint()
+    cp.open("run", RUN_TS, WINDOW, old.bounds)
+    cp.finish(docs=10)
+
+    resumed = _checkpoint()
+    assert not resumed.open("run", RUN_TS, WINDOW, new.bounds)
+    assert not resumed.done
+
+
+def test_split_plan_is_reused_only_by_the_same_run(storage):
+    plan = IdSplitPlan(BUCKET, "mongo/_state/checkpoints/db/colecao_split.json")
+    boundaries = [ObjectId("65a000000000000000000000"), ObjectId("65b000000000000000000000")]
+    plan.save("run", 3, "sample", boundaries)
+
+    assert plan.load("run", 3, "sample") == boundaries
+    assert plan.load("outro_run", 3, "sample") is None
+    assert plan.load("run", 4, "sample") is None
+
+
+def test_plan_id_ranges_reuses_boundaries_on_rerun(storage, monkeypatch):
+    from app import main
+
+    samples = iter([
+        [ObjectId("65a000000000000000000000")],
+        [ObjectId("65b000000000000000000000")],
+    ])
+    monkeypatch.setenv("CHECKPOINTS", "true")
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(main, "load_mongo_secret", lambda name: {"connections": [{"database_name": "db"}]})
+    monkeypatch.setattr(main, "MongoRepository", lambda mongo_secret, collection_name: None)
+    monkeypatch.setattr(main, "compute_id_boundaries", lambda repo, n, strategy, query=None: next(samples))
+
+    row = {"SOURCE_TABLE_NAME": "colecao", "SPLIT_PARTITIONS": 2, "PIPELINE_TYPE": "STANDARD"}
+    row = type("Row", (dict,), {"__getattr__": dict.get})(row)
+
+    first = main._plan_id_ranges(row, "project", "secret", "run")
+    rerun = main._plan_id_ranges(row, "project", "secret", "run")
+    other_run = main._plan_id_ranges(row, "project", "secret", "outro_run")
+
+    assert [r.bounds for r in rerun] == [r.bounds for r in first]
+    assert [r.bounds for r in other_run] != [r.bounds for r in first]
+
+
+def test_non_resumable_checkpoint_restarts_in_the_same_run(storage):
+    cp = _checkpoint()
+    cp.open("run", RUN_TS, {"start": "2024-01-01", "end": "2024-01-02"})
+    path = _write_part(storage, cp, 0, ObjectId("65a000000000000000000001"))
+
+    restarted = _checkpoint()
+    window = {"start": "2024-01-01", "end": "2024-01-02"}
+    assert not restarted.open("outro_run", datetime(2024, 1, 3), window, resumable=False)
+    assert restarted.next_index == 0
+    assert (restarted.run_id, restarted.ingest_ts) == ("run", RUN_TS)
+    assert not storage.blob(path).exists()
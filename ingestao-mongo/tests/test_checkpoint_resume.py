@@ -0,0 +1,174 @@
+import glob
+import os
+import random
+import string
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+from bson import ObjectId
+
+from app import main
+from app.services import writer
+from benchmarks.local_gcs import LocalStorageClient
+
+BUCKET = "bucket"
+RUN_TS = datetime(2024, 1, 2)
+N_DOCS = 1200
+
+
+class _Row(dict):
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+ROW = _Row(SOURCE_TABLE_NAME="colecao", PIPELINE_TYPE="STANDARD", TARGET_DATASET="ds", TARGET_TABLE_NAME="t")
+
+
+class _Cursor:
+    def __init__(self, documents, fail_after):
+        self._documents = documents
+        self._fail_after = fail_after
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def allow_disk_use(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        for n, doc in enumerate(self._documents):
+            if n == self._fail_after:
+                raise ConnectionError("cursor perdido")
+            yield doc
+
+
+class _Repository:
+    """Coleção em memória que aplica o filtro de retomada ({"_id": {"$gt": ...}})."""
+
+    def __init__(self, documents, fail_after=None):
+        self._documents = documents
+        self.fail_after = fail_after
+
+    def find(self, query, projection, **kwargs):
+        documents = self._documents
+        if query:
+            last_id = query["_id"]["$gt"]
+            documents = [d for d in documents if d["_id"] > last_id]
+        return _Cursor([dict(d) for d in documents], self.fail_after)
+
+
+def _documents():
+    rnd = random.Random(0)
+    # ~3KB aleatórios por documento: o writer em stream rola a cada ~1MB
+    return [
+        {"_id": ObjectId(f"65a{i:021x}"), "v": "".join(rnd.choices(string.ascii_letters, k=3000))}
+        for i in range(N_DOCS)
+    ]
+
+
+@pytest.fixture
+def sink(monkeypatch, tmp_path):
+    monkeypatch.setenv("LOCAL_GCS_ROOT", str(tmp_path))
+    monkeypatch.setenv("BUCKET_NAME", BUCKET)
+    monkeypatch.setenv("CHECKPOINTS", "true")
+    monkeypatch.setenv("WRITER_MODE", "stream")
+    monkeypatch.setenv("PARQUET_TARGET_FILE_MB", "1")
+    monkeypatch.setenv("EXPLAIN_QUERY", "false")
+    client = LocalStorageClient()
+    monkeypatch.setattr(writer, "get_storage_client", lambda: client)
+    monkeypatch.setattr("app.services.checkpoint.get_storage_client", lambda: client)
+    monkeypatch.setattr(main, "load_mongo_secret", lambda name: {"connections": [{"database_name": "db"}]})
+    monkeypatch.setattr(main, "_get_bigquery_client", lambda: None)
+    return tmp_path
+
+
+def _process(monkeypatch, repository, run_id):
+    monkeypatch.setattr(main, "MongoRepository", lambda mongo_secret, collection_name: repository)
+    return main._process_collection(ROW, "project", RUN_TS, run_id, "secret", "2024-01-01", "2024-01-02", batch_size=50)
+
+
+def _output_ids(sink):
+    files = sorted(glob.glob(os.path.join(sink, BUCKET, "mongo/db/colecao/dt=*/*/*.parquet")))
+    return files, [i for f in files for i in pq.read_table(f, columns=["_id"]).column("_id").to_pylist()]
+
+
+def test_stream_crash_resumes_without_duplicates(sink, monkeypatch):
+    repository = _Repository(_documents(), fail_after=900)
+
+    with pytest.raises(ConnectionError):
+        _process(monkeypatch, repository, "run")
+    files, _ = _output_ids(sink)
+    assert len(files) >= 2  # arquivos rolados antes da queda
+
+    repository.fail_after = None
+    docs = _process(monkeypatch, repository, "run")
+
+    files, ids = _output_ids(sink)
+    assert docs == N_DOCS
+    assert sorted(ids) == [str(d["_id"]) for d in _documents()]
+    assert {os.path.basename(os.path.dirname(f)) for f in files} == {"run"}
+
+
+def test_rerun_of_closed_window_with_new_run_id_reuses_output(sink, monkeypatch):
+    repository = _Repository(_documents(), fail_after=900)
+    with pytest.raises(ConnectionError):
+        _process(monkeypatch, repository, "run")
+
+    repository.fail_after = None
+    docs = _process(monkeypatch, repository, "outro_run")
+
+    files, ids = _output_ids(sink)
+    assert docs == N_DOCS
+    assert len(ids) == len(set(ids)) == N_DOCS
+    assert {os.path.basename(os.path.dirname(f)) for f in files} == {"run"}
+
+
+def test_untracked_file_from_crash_is_discarded(sink, monkeypatch):
+    repository = _Repository(_documents(), fail_after=900)
+    with pytest.raises(ConnectionError):
+        _process(monkeypatch, repository, "run")
+
+    # arquivo finalizado na queda, antes de entrar no checkpoint
+    files, _ = _output_ids(sink)
+    untracked = files[-1].replace(files[-1][-13:], f"{len(files):05d}.parquet")
+    with open(files[-1], "rb") as src, open(untracked, "wb") as dst:
+        dst.write(src.read())
+
+    repository.fail_after = None
+    docs = _process(monkeypatch, repository, "run")
+
+    _, ids = _output_ids(sink)
+    assert docs == N_DOCS
+    assert len(ids) == len(set(ids)) == N_DOCS
+
+
+@pytest.mark.parametrize("writer_mode", ["part", "stream"])
+def test_dedupe_crash_restarts_from_scratch(sink, monkeypatch, writer_mode):
+    monkeypatch.setenv("WRITER_MODE", writer_mode)
+    row = _Row(ROW, DEDUPE_KEYS='["k"]', SORT_FIELD="n")
+    # cada chave aparece duas vezes; a versão com maior n vence
+    documents = [dict(d, k=i % (N_DOCS // 2), n=i) for i, d in enumerate(_documents())]
+    repository = _Repository(documents)
+    monkeypatch.setattr(main, "MongoRepository", lambda mongo_secret, collection_name: repository)
+
+    normalize = main.normalize_documents
+    calls = []
+
+    def failing_normalize(batch, *args, **kwargs):
+        calls.append(len(batch))
+        if len(calls) == 8:
+            raise RuntimeError("falha no normalize")
+        return normalize(batch, *args, **kwargs)
+
+    monkeypatch.setattr(main, "normalize_documents", failing_normalize)
+    with pytest.raises(RuntimeError):
+        main._process_collection(row, "project", RUN_TS, "run", "secret", "2024-01-01", "2024-01-02", batch_size=50)
+    assert _output_ids(sink)[0]  # parts gravados antes da queda
+
+    monkeypatch.setattr(main, "normalize_documents", normalize)
+    docs = main._process_collection(row, "project", RUN_TS, "run", "secret", "2024-01-01", "2024-01-02", batch_size=50)
+
+    _, ids = _output_ids(sink)
+    assert docs == N_DOCS // 2
+    assert sorted(ids) == sorted(str(d["_id"]) for d in documents[N_DOCS // 2:])
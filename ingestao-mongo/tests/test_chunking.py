@@ -0,0 +1,34 @@
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from app.services.chunking import ChunkStats, bson_size, chunked_cursor_by_bytes
+
+
+def _documents():
+    # rajada de documentos grandes entre documentos pequenos
+    small = [{"i": i, "v": "x"} for i in range(150)]
+    large = [{"i": i, "v": "x" * 100_000} for i in range(30)]
+    return small[:50] + large + small[50:]
+
+
+def test_chunks_respect_byte_budget_for_every_document():
+    max_bytes = 256 * 1024
+    docs = _documents()
+    stats = ChunkStats()
+
+    chunks = list(chunked_cursor_by_bytes(iter(docs), max_bytes=max_bytes, stats=stats))
+
+    assert sum(len(c) for c in chunks) == len(docs)
+    for chunk in chunks:
+        sizes = [len(bson.encode(d)) for d in chunk]
+        # o chunk só passa do orçamento pelo último documento
+        assert sum(sizes[:-1]) < max_bytes
+    assert stats.bson_bytes == sum(len(bson.encode(d)) for d in docs)
+
+
+def test_raw_documents_use_their_own_size():
+    doc = RawBSONDocument(bson.encode({"a": "x" * 1000}))
+    assert bson_size(doc) == len(doc.raw)
+
+    chunks = list(chunked_cursor_by_bytes(iter([doc] * 10), max_bytes=len(doc.raw) * 3))
+    assert [len(c) for c in chunks] == [3, 3, 3, 1]
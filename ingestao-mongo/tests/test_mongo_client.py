@@ -0,0 +1,28 @@
+from unittest import mock
+
+import pytest
+
+from app import mongo_client
+
+SECRET = {
+    "database_hostname": "host", "database_port": 27017, "database_username": "user",
+    "database_password": "senha", "database_name": "db",
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_client(monkeypatch):
+    monkeypatch.setattr(mongo_client, "MongoClient", mock.MagicMock())
+    yield
+    mongo_client.close_mongo_clients()
+
+
+def test_connection_is_logged_once_per_client(caplog):
+    caplog.set_level("INFO", logger="mongo_to_gcs.mongo_client")
+
+    repos = [mongo_client.MongoRepository(SECRET, name) for name in ("a", "b", "c")]
+
+    assert len({id(r._client) for r in repos}) == 1
+    assert [r.getMessage() for r in caplog.records if "Conectado" in r.getMessage()] == [
+        "Conectado ao MongoDB host:27017 DB=db (MongoClient novo)"
+    ]
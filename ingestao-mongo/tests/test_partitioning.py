@@ -0,0 +1,135 @@
+import random
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from app import main
+from app.services.extractor import build_mongo_query
+from app.services.partitioning import apply_id_range, build_id_ranges, compute_id_boundaries
+
+N_DOCS = 10_000
+# um ObjectId e um updatedAt (epoch_s) por dia; a janela pega os 10% finais
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DAY = 86_400
+
+
+def _matches(doc, query) -> bool:
+    """Subconjunto do filtro do Mongo usado pelas queries do job."""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(doc, q) for q in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(doc, q) for q in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, bound in condition.items():
+            if op == "$gte" and not value >= bound:
+                return False
+            if op == "$lt" and not value < bound:
+                return False
+            if op == "$type" and not isinstance(value, ObjectId):
+                return False
+            if op == "$not" and _matches(doc, {key: bound}):
+                return False
+    return True
+
+
+class _Repository:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = self.documents
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [d for d in docs if _matches(d, stage["$match"])]
+            elif "$sample" in stage:
+                docs = random.Random(0).sample(docs, min(stage["$sample"]["size"], len(docs)))
+            elif "$project" in stage:
+                docs = [{"_id": d["_id"]} for d in docs]
+        return iter(docs)
+
+
+def _documents():
+    start = int(START.timestamp())
+    return [
+        {"_id": ObjectId(f"{start + i * 60:08x}{i:016x}"), "updatedAt": start + i * DAY // 10, "deleted": False}
+        for i in range(N_DOCS)
+    ]
+
+
+def _window_query():
+    since = datetime.fromtimestamp(int(START.timestamp()) + int(N_DOCS * 0.9) * DAY // 10, tz=timezone.utc)
+    return build_mongo_query("updatedAt", since, None, "epoch_s")
+
+
+def _docs_per_range(documents, query, boundaries):
+    ranges = build_id_ranges(boundaries)
+    return [sum(_matches(d, apply_id_range(query, r)) for d in documents) for r in ranges]
+
+
+def test_boundaries_follow_the_incremental_window():
+    documents = _documents()
+    query = _window_query()
+    window = sum(_matches(d, query) for d in documents)
+
+    boundaries = compute_id_boundaries(_Repository(documents), 4, query=query)
+    counts = _docs_per_range(documents, query, boundaries)
+
+    assert sum(counts) == window
+    # cada faixa fica com ~1/4 da janela (a amostra corta por quantis)
+    assert all(window * 0.15 < c < window * 0.35 for c in counts)
+
+
+def test_boundaries_without_query_split_the_whole_collection():
+    documents = _documents()
+    query = _window_query()
+
+    boundaries = compute_id_boundaries(_Repository(documents), 4)
+
+    # sobre o histórico, a janela cai quase toda na última faixa
+    assert _docs_per_range(documents, query, boundaries)[-1] == sum(_matches(d, query) for d in documents)
+
+
+def test_bucket_auto_applies_the_query():
+    seen = []
+
+    class Repository:
+        def aggregate(self, pipeline, **kwargs):
+            seen.append(pipeline)
+            return iter([])
+
+    query = _window_query()
+    compute_id_boundaries(Repository(), 4, strategy="bucketAuto", query=query)
+
+    assert seen[0][0] == {"$match": {"$and": [query, {"_id": {"$type": "objectId"}}]}}
+
+
+def test_plan_id_ranges_uses_the_run_window(monkeypatch):
+    queries = []
+
+    def boundaries(repo, n, strategy, query=None):
+        queries.append(query)
+        return [ObjectId("65a000000000000000000000")]
+
+    monkeypatch.delenv("CHECKPOINTS", raising=False)
+    monkeypatch.setattr(main, "load_mongo_secret", lambda name: {"connections": [{"database_name": "db"}]})
+    monkeypatch.setattr(main, "MongoRepository", lambda mongo_secret, collection_name: None)
+    monkeypatch.setattr(main, "compute_id_boundaries", boundaries)
+
+    row = {
+        "SOURCE_TABLE_NAME": "colecao", "SPLIT_PARTITIONS": 2, "PIPELINE_TYPE": "STANDARD",
+        "FILTER_COLUMN": "updatedAt", "FILTER_TYPE": "epoch_s",
+    }
+    row = type("Row", (dict,), {"__getattr__": dict.get})(row)
+
+    main._plan_id_ranges(row, "project", "secret", "run", "2024-03-01", "2024-03-02")
+
+    assert queries == [build_mongo_query("updatedAt", "2024-03-01", "2024-03-02", "epoch_s")]
@@ -0,0 +1,76 @@
+import pytest
+
+from app import main
+from app.models import CollectionConfig
+from app.services.extractor import projection_match_ratio
+
+
+class _Row(dict):
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+ROW = _Row(
+    SOURCE_TABLE_NAME="colecao", PIPELINE_TYPE="STANDARD", TARGET_DATASET="ds", TARGET_TABLE_NAME="t",
+    FILTER_COLUMN="updatedAt",
+)
+
+
+class _Repository:
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = []
+
+    def find(self, query, projection, **kwargs):
+        self.calls.append((query, projection, kwargs))
+        return iter(self.documents[:kwargs.get("limit") or None])
+
+
+def _derive(monkeypatch, columns, documents):
+    monkeypatch.setattr(main, "get_table_columns", lambda bq, project_id, table_id: columns)
+    config = CollectionConfig.from_catalog_row(ROW, "db")
+    repo = _Repository(documents)
+    return main._derive_projection(None, repo, ROW, "project", config, {"deleted": False}), repo
+
+
+def test_projection_from_matching_columns(monkeypatch):
+    documents = [{"_id": 1, "name": "a", "status": "x", "updatedAt": 1}]
+
+    projection, repo = _derive(monkeypatch, ["_id", "name", "status", "dt_ingestao"], documents)
+
+    assert projection == {"_id": 1, "name": 1, "status": 1, "updatedAt": 1}
+    assert repo.calls == [({"deleted": False}, None, {"limit": 20})]
+
+
+def test_renamed_columns_fall_back_to_full_document(monkeypatch, caplog):
+    # tabela de destino com colunas renomeadas: só o _id e o filtro existem no Mongo
+    documents = [{"_id": 1, "nome": "a", "situacao": "x", "updatedAt": 1}]
+
+    projection, _ = _derive(monkeypatch, ["_id", "name", "status", "created"], documents)
+
+    assert projection is None
+    assert "extraindo documento inteiro" in caplog.text
+
+
+def test_empty_sample_keeps_projection(monkeypatch):
+    projection, _ = _derive(monkeypatch, ["_id", "name"], [])
+
+    assert projection == {"_id": 1, "name": 1, "updatedAt": 1}
+
+
+def test_sample_disabled(monkeypatch):
+    monkeypatch.setenv("AUTO_PROJECTION_SAMPLE", "0")
+
+    projection, repo = _derive(monkeypatch, ["_id", "name"], [{"_id": 1, "outro": 2}])
+
+    assert projection == {"_id": 1, "name": 1, "updatedAt": 1}
+    assert repo.calls == []
+
+
+@pytest.mark.parametrize("fields, documents, expected", [
+    (["a", "b"], [{"a": 1}, {"b": 2}], 1.0),
+    (["a", "b", "c", "d"], [{"a": 1}], 0.25),
+    (["a"], [], 1.0),
+])
+def test_projection_match_ratio(fields, documents, expected):
+    assert projection_match_ratio(fields, documents) == expected
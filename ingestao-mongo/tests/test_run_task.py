@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+from app import main
+from app.services.metrics import RunMetrics, current_metrics
+
+
+class _Row(dict):
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+ROW = _Row(SOURCE_TABLE_NAME="colecao", PIPELINE_TYPE="STANDARD", TARGET_DATASET="ds", TARGET_TABLE_NAME="t")
+
+
+def _run(monkeypatch, process):
+    monkeypatch.setattr(main, "_process_collection", process)
+    run_metrics = RunMetrics("run")
+    result = main._run_task(
+        None, run_metrics, ROW, "project", datetime(2024, 1, 1), "run", "secret",
+        None, None, 1000, None, None, None,
+    )
+    return result, run_metrics.records[0]
+
+
+def test_complete_run_is_not_marked_resumed(monkeypatch):
+    (docs, seconds, resumed), record = _run(monkeypatch, lambda *args: 10)
+
+    assert docs == 10
+    assert seconds >= 0
+    assert not resumed
+    assert record["resumed"] is False
+
+
+def test_checkpoint_resume_is_reported(monkeypatch):
+    def process(*args):
+        current_metrics().resumed = True
+        return 5
+
+    (docs, _, resumed), record = _run(monkeypatch, process)
+
+    assert docs == 5
+    assert resumed
+    assert record["resumed"] is True
+
+
+def test_failed_task_records_failure(monkeypatch):
+    def process(*args):
+        raise RuntimeError("falha")
+
+    monkeypatch.setattr(main, "_process_collection", process)
+    run_metrics = RunMetrics("run")
+    with pytest.raises(RuntimeError):
+        main._run_task(
+            None, run_metrics, ROW, "project", datetime(2024, 1, 1), "run", "secret",
+            None, None, 1000, None, None, None,
+        )
+    assert run_metrics.records[0]["status"] == "failed"
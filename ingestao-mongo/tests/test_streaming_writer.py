@@ -0,0 +1,144 @@
+import gc
+import io
+import random
+import string
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from google.cloud.storage.fileio import BlobWriter
+
+from app.services import writer
+
+CHUNK = 256 * 1024
+
+
+class FakeUpload:
+    """Sessão resumable: cada chunk menor que chunk_size finaliza o objeto."""
+
+    resumable_url = "https://storage.example/upload/session"
+
+    def __init__(self, store, name, stream, chunk_size):
+        self.store = store
+        self.name = name
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.received = bytearray()
+
+    def transmit_next_chunk(self, transport, timeout=None):
+        data = self.stream.read(self.chunk_size)
+        self.received += data
+        if len(data) < self.chunk_size:
+            self.store[self.name] = bytes(self.received)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        return type("Response", (), {"status_code": 499})()
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = None
+
+    def open(self, mode, chunk_size=None, ignore_flush=False, **kwargs):
+        return BlobWriter(self, chunk_size=chunk_size, ignore_flush=ignore_flush, **kwargs)
+
+    def _initiate_resumable_upload(self, client, stream, content_type, size, num_retries, chunk_size=None, **kwargs):
+        upload = FakeUpload(self.bucket.client.store, self.name, stream, chunk_size)
+        self.bucket.client.uploads.append(upload)
+        return upload, self.bucket.client.transport
+
+
+class FakeBucket:
+    def __init__(self, client):
+        self.client = client
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+class FakeClient:
+    def __init__(self):
+        self.store = {}
+        self.uploads = []
+        self.transport = FakeTransport()
+
+    def bucket(self, name):
+        return FakeBucket(self)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(writer, "get_storage_client", lambda: fake)
+    return fake
+
+
+def _table(rows: int) -> pa.Table:
+    rnd = random.Random(0)
+    values = ["".join(rnd.choices(string.ascii_letters, k=64)) for _ in range(rows)]
+    return pa.table({"value": pa.array(values, type=pa.string())})
+
+
+def _writer() -> writer.StreamingParquetWriter:
+    return writer.StreamingParquetWriter(
+        "bucket", "landing", "colecao", datetime(2024, 1, 1), "run", upload_chunk_bytes=CHUNK,
+    )
+
+
+def _abort_and_collect(w: writer.StreamingParquetWriter) -> str:
+    blob_path = w._blob_path
+    w.abort()
+    del w
+    gc.collect()
+    return blob_path
+
+
+def test_abort_after_chunks_sent_cancels_upload(client):
+    w = _writer()
+    w.write_table(_table(20_000))
+    assert client.uploads and client.uploads[0].received  # sessão aberta, chunks enviados
+
+    blob_path = _abort_and_collect(w)
+
+    assert blob_path not in client.store
+    assert client.transport.requests == [("DELETE", FakeUpload.resumable_url)]
+
+
+def test_abort_before_first_chunk_uploads_nothing(client):
+    w = _writer()
+    w.write_table(_table(10))
+
+    blob_path = _abort_and_collect(w)
+
+    assert blob_path not in client.store
+    assert client.uploads == []
+    assert client.transport.requests == []
+
+
+def test_exception_inside_context_discards_file(client):
+    with pytest.raises(RuntimeError):
+        with _writer() as w:
+            w.write_table(_table(20_000))
+            raise RuntimeError("falha no batch")
+    del w
+    gc.collect()
+
+    assert client.store == {}
+
+
+def test_close_finalizes_readable_file(client):
+    w = _writer()
+    w.write_table(_table(20_000))
+    (blob_path,) = w.close()
+
+    table = pq.read_table(io.BytesIO(client.store[blob_path]))
+    assert table.num_rows == 20_000
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+from bson import Binary, Decimal128, ObjectId
+from bson.int64 import Int64
+
+from app.services.transformer import normalize_documents, normalize_documents_arrow
+from benchmarks.transformer_benchmark import generate_documents
+
+# valores que o pymongo devolve e que o pandas classifica por subclasse
+VALUES = [
+    Int64(5),
+    Int64(-3),
+    Int64(2**62),
+    1,
+    2.5,
+    True,
+    None,
+    "s",
+    b"bytes",
+    Binary(b"ab", 0),
+    Binary(b"x", 4),
+    Decimal128("1.10"),
+    ObjectId("65a000000000000000000000"),
+    datetime(2024, 1, 1),
+    {"k": b"v", "n": Int64(1)},
+    [Int64(1), 2],
+]
+
+
+def _normalize(fn, documents):
+    try:
+        return fn(documents)
+    except Exception as e:  # noqa: BLE001 - os dois caminhos precisam falhar igual
+        return type(e)
+
+
+def _assert_same(documents):
+    expected = _normalize(normalize_documents, documents)
+    actual = _normalize(normalize_documents_arrow, documents)
+    if isinstance(expected, type):
+        assert actual is expected
+        return
+    assert actual.to_pydict() == expected.to_dict("list")
+
+
+@pytest.mark.parametrize("field", ["a", "deletedAt"])
+@pytest.mark.parametrize("first", VALUES, ids=repr)
+@pytest.mark.parametrize("second", VALUES, ids=repr)
+def test_arrow_matches_pandas_for_mixed_columns(field, first, second):
+    _assert_same([{field: first}, {field: second}])
+    # campo ausente em parte do batch (NaN no pandas)
+    _assert_same([{field: first}, {field: second}, {"b": 1}])
+
+
+def test_int64_column_with_missing_is_float_like_pandas():
+    table = normalize_documents_arrow([{"a": Int64(5)}, {"b": 1}])
+    assert table.column("a").to_pylist() == ["5.0", "nan"]
+
+
+def test_bytes_are_decoded_like_pandas():
+    table = normalize_documents_arrow([{"a": b"bytes"}, {"a": Binary(b"ab")}])
+    assert table.column("a").to_pylist() == ["bytes", "ab"]
+
+
+def test_invalid_utf8_bytes_fail_like_pandas():
+    _assert_same([{"a": b"\xff\xfe"}])
+
+
+def test_arrow_matches_pandas_on_benchmark_documents():
+    _assert_same(generate_documents(500))
@@ -1,12 +1,29 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
+import ijson
 import requests
 
 from .auth import AuthToken
 
 
+class RateLimitedError(RuntimeError):
+    """429 da API (após os retries da sessão, quando houver)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
 def _headers(subscription_key: str, token: Optional[AuthToken] = None) -> Dict[str, str]:
     h = {"Ocp-Apim-Subscription-Key": subscription_key}
     if token is not None:
@@ -62,6 +79,8 @@ def fetch_fact_by_cycle(
         params={"updatedSince": updated_since, "periodInDays": period_in_days},
         timeout=timeout,
     )
+    if resp.status_code == 429:
+        raise RateLimitedError(f"Fact export rate limited ({fact}, cycle={cycle_id})", _retry_after(resp))
     if resp.status_code != 200:
         raise RuntimeError(
             f"Fact export failed ({fact}, cycle={cycle_id}): status={resp.status_code}, body={resp.text[:2000]}"
@@ -102,3 +121,146 @@ def fetch_deletions(
     if not isinstance(payload, list):
         raise RuntimeError(f"Unexpected payload type for deletions: {type(payload)}")
     return payload
+
+
+# ---- streaming: o corpo é lido de resp.raw e o array payload é percorrido
+# elemento a elemento, sem carregar a resposta inteira em memória ----
+
+
+class _HeadRecorder:
+    """
+    Leitor sobre resp.raw que guarda os bytes lidos até stop(): o início do
+    corpo, onde está o tipo do payload.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.head: Optional[bytearray] = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        if self.head is not None:
+            self.head += data
+        return data
+
+    def stop(self) -> bytes:
+        head, self.head = bytes(self.head or b""), None
+        return head
+
+
+def _check_payload(head: bytes, name: str) -> None:
+    """
+    Mesma validação do fetch_*: payload, quando presente, precisa ser lista
+    (ou null); sem o campo, o export está vazio.
+    """
+    try:
+        for prefix, event, value in ijson.parse(head, use_float=True):
+            if prefix != "payload":
+                continue
+            if event in ("start_array", "null"):
+                return
+            payload_type = dict if event == "start_map" else type(value)
+            raise RuntimeError(f"Unexpected payload type for {name}: {payload_type}")
+    except ijson.IncompleteJSONError:
+        # o head termina no meio do corpo, depois do início do payload
+        pass
+
+
+def _iter_payload(resp: requests.Response, name: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    # resp.raw não descomprime gzip sozinho
+    resp.raw.decode_content = True
+    stream = _HeadRecorder(resp.raw)
+    checked = False
+    batch: List[Dict[str, Any]] = []
+    # use_float: números com casas decimais como float (igual ao resp.json()), não Decimal
+    for record in ijson.items(stream, "payload.item", use_float=True):
+        if not checked:
+            # antes do primeiro lote: o início do payload já foi lido
+            _check_payload(stream.stop(), name)
+            checked = True
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if not checked:
+        _check_payload(stream.stop(), name)
+    if batch:
+        yield batch
+
+
+def iter_dimension_export(
+    session: requests.Session,
+    base_url: str,
+    subscription_key: str,
+    token: AuthToken,
+    dimension: str,
+    updated_since: str,
+    timeout: int,
+    batch_size: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """fetch_dimension_export em lotes de até batch_size registros."""
+    url = f"{base_url.rstrip('/')}/data/dimensions/{dimension}/export"
+    with session.get(
+        url,
+        headers=_headers(subscription_key, token),
+        params={"updatedSince": updated_since},
+        timeout=timeout,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Dimension export failed ({dimension}): status={resp.status_code}, body={resp.text[:2000]}")
+        yield from _iter_payload(resp, dimension, batch_size)
+
+
+def iter_fact_by_cycle(
+    session: requests.Session,
+    base_url: str,
+    subscription_key: str,
+    token: AuthToken,
+    fact: str,
+    cycle_id: str,
+    updated_since: str,
+    period_in_days: int,
+    timeout: int,
+    batch_size: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """fetch_fact_by_cycle em lotes de até batch_size registros."""
+    url = f"{base_url.rstrip('/')}/data/facts/{fact}/{cycle_id}/export"
+    with session.get(
+        url,
+        headers=_headers(subscription_key, token),
+        params={"updatedSince": updated_since, "periodInDays": period_in_days},
+        timeout=timeout,
+        stream=True,
+    ) as resp:
+        if resp.status_code == 429:
+            raise RateLimitedError(f"Fact export rate limited ({fact}, cycle={cycle_id})", _retry_after(resp))
+        if resp.status_code != 200:
+            raise RuntimeError(
+                f"Fact export failed ({fact}, cycle={cycle_id}): status={resp.status_code}, body={resp.text[:2000]}"
+            )
+        yield from _iter_payload(resp, fact, batch_size)
+
+
+def iter_deletions(
+    session: requests.Session,
+    base_url: str,
+    subscription_key: str,
+    token: AuthToken,
+    updated_since: str,
+    period_in_days: int,
+    timeout: int,
+    batch_size: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    """fetch_deletions em lotes de até batch_size registros."""
+    url = f"{base_url.rstrip('/')}/data/facts/evaluation/deleted/export"
+    with session.get(
+        url,
+        headers=_headers(subscription_key, token),
+        params={"updatedSince": updated_since, "periodInDays": period_in_days},
+        timeout=timeout,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Deletions export failed: status={resp.status_code}, body={resp.text[:2000]}")
+        yield from _iter_payload(resp, "deletions", batch_size)
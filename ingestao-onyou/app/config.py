@@ -36,16 +36,26 @@ class Settings:
     onyou_subscription_key: str
     onyou_refresh_token: str
     onyou_timeout_seconds: int
+    onyou_stream_batch_size: int  # > 0: lê o payload em streaming, em lotes (0 = resp.json())
 
-    # ---- Dimensions (igual ao seu código: datas fixas) ----
+    # ---- Dimensions (igual ao seu código: datas fixas; usadas no full refresh) ----
     dim_cycle_updated_since: str
     dim_structure_updated_since: str
     dim_form_updated_since: str
     dim_dept_updated_since: str
 
+    # ---- Dimensions incrementais (watermark no GCS) ----
+    dim_incremental: bool
+    dim_full_refresh_days: int           # full refresh periódico (0 = nunca)
+    dim_force_full_refresh: bool
+    dim_watermark_overlap_minutes: int
+
     # ---- Facts ----
     facts_updated_since_offset_days: int  # hoje - 2
     facts_period_in_days: int            # 7
+    facts_fetch_concurrency: int         # requisições (fact, ciclo) em paralelo
+    onyou_max_requests_per_second: float  # rate limit compartilhado (0 = sem limite)
+    onyou_max_429_retries: int
 
     # ---- Cycles selection ----
     cycles_enddate_keep_days: int        # 45
@@ -58,6 +68,9 @@ class Settings:
     # ---- Parquet ----
     parquet_compression: str
     max_records_per_file: int
+    parquet_row_group_records: int
+    schema_registry: bool                # schema por entity no GCS (conversão sem inferência)
+    upload_workers: int
 
     # ---- Runtime ----
     source_system: str
@@ -72,6 +85,7 @@ class Settings:
             onyou_subscription_key=_env("ONYOU_SUBSCRIPTION_KEY", required=True),
             onyou_refresh_token=_env("ONYOU_REFRESH_TOKEN", required=True),
             onyou_timeout_seconds=int(_env("ONYOU_TIMEOUT_SECONDS", "60")),
+            onyou_stream_batch_size=int(_env("ONYOU_STREAM_BATCH_SIZE", "5000")),
 
             # defaults iguais ao “espírito” do seu script
             dim_cycle_updated_since=_env("DIM_CYCLE_UPDATED_SINCE", "2020-12-09T16:09:53+00:00"),
@@ -79,8 +93,16 @@ class Settings:
             dim_form_updated_since=_env("DIM_FORM_UPDATED_SINCE", "2020-02-01T00:00:00.52Z"),
             dim_dept_updated_since=_env("DIM_DEPT_UPDATED_SINCE", "2020-02-01T00:00:00.52Z"),
 
+            dim_incremental=_env("DIM_INCREMENTAL", "true").lower() == "true",
+            dim_full_refresh_days=int(_env("DIM_FULL_REFRESH_DAYS", "7")),
+            dim_force_full_refresh=_env("DIM_FULL_REFRESH", "false").lower() == "true",
+            dim_watermark_overlap_minutes=int(_env("DIM_WATERMARK_OVERLAP_MINUTES", "60")),
+
             facts_updated_since_offset_days=int(_env("FACTS_UPDATED_SINCE_OFFSET_DAYS", "2")),
             facts_period_in_days=int(_env("FACTS_PERIOD_IN_DAYS", "7")),
+            facts_fetch_concurrency=max(1, int(_env("FACTS_FETCH_CONCURRENCY", "8"))),
+            onyou_max_requests_per_second=float(_env("ONYOU_MAX_REQUESTS_PER_SECOND", "10")),
+            onyou_max_429_retries=int(_env("ONYOU_MAX_429_RETRIES", "5")),
 
             cycles_enddate_keep_days=int(_env("CYCLES_ENDDATE_KEEP_DAYS", "45")),
             max_cycles_per_run=int(_env("MAX_CYCLES_PER_RUN", "5000")),
@@ -90,6 +112,9 @@ class Settings:
 
             parquet_compression=_env("PARQUET_COMPRESSION", "snappy"),
             max_records_per_file=int(_env("MAX_RECORDS_PER_FILE", "200000")),
+            parquet_row_group_records=int(_env("PARQUET_ROW_GROUP_RECORDS", "50000")),
+            schema_registry=_env("SCHEMA_REGISTRY", "true").lower() == "true",
+            upload_workers=max(1, int(_env("UPLOAD_WORKERS", "2"))),
 
             source_system=_env("SOURCE_SYSTEM", "onyou"),
             dt=_utc_date(),
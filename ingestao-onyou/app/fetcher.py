@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from .api import RateLimitedError, fetch_fact_by_cycle, iter_fact_by_cycle
+from .auth import AuthToken
+from .http_client import build_session
+
+logger = logging.getLogger("onyou_ingest")
+
+
+class RateLimiter:
+    """
+    Limite de requisições por segundo compartilhado entre as threads.
+
+    Cada acquire() reserva o próximo horário livre (intervalo fixo de
+    1/rate). Um 429 pausa todas as threads até o Retry-After (ou um backoff
+    exponencial, se a API não mandar o header).
+    """
+
+    def __init__(self, rate_per_second: float, backoff_seconds: float = 2.0, max_backoff_seconds: float = 60.0):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._consecutive_429 = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle(self, retry_after: Optional[float] = None) -> float:
+        """Registra um 429 e retorna a pausa aplicada (segundos)."""
+        with self._lock:
+            self._consecutive_429 += 1
+            if retry_after is None:
+                retry_after = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (self._consecutive_429 - 1))
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after
+
+    def success(self) -> None:
+        with self._lock:
+            self._consecutive_429 = 0
+
+
+class SessionPool:
+    """Uma requests.Session por thread em uso (Session não é thread-safe)."""
+
+    def __init__(self, size: int):
+        self._sessions: "queue.Queue[requests.Session]" = queue.Queue()
+        for _ in range(size):
+            self._sessions.put(build_session(retry_429=False, pool_maxsize=1))
+
+    @contextmanager
+    def session(self) -> Iterator[requests.Session]:
+        s = self._sessions.get()
+        try:
+            yield s
+        finally:
+            self._sessions.put(s)
+
+    def close(self) -> None:
+        while not self._sessions.empty():
+            self._sessions.get_nowait().close()
+
+
+def fetch_facts_by_cycle(
+    facts: Sequence[Tuple[str, str]],
+    cycle_ids: Sequence[str],
+    consume: Callable[[str, List[Dict[str, Any]]], None],
+    base_url: str,
+    subscription_key: str,
+    token: AuthToken,
+    updated_since: str,
+    period_in_days: int,
+    timeout: int,
+    concurrency: int,
+    rate_limiter: RateLimiter,
+    max_429_retries: int = 5,
+    stream_batch_size: int = 0,
+) -> Dict[str, int]:
+    """
+    Busca todos os pares (fact, ciclo) com até `concurrency` requisições em
+    paralelo. facts é uma lista de (entity, fact), ex.:
+    [("answers", "evaluation/answer"), ("ratings", "evaluation/rating")].
+
+    consume(entity, registros) recebe o payload de cada par, chamado das
+    threads de busca (precisa ser thread-safe). Com stream_batch_size > 0 a
+    resposta é lida em streaming e consume recebe lotes desse tamanho.
+    Retorna o total de registros por entity. Uma falha interrompe a busca
+    (como no loop serial).
+    """
+    pool = SessionPool(concurrency)
+
+    def fetch_batches(session: requests.Session, fact: str, cycle_id: str) -> Iterable[List[Dict[str, Any]]]:
+        kwargs = dict(
+            session=session,
+            base_url=base_url,
+            subscription_key=subscription_key,
+            token=token,
+            fact=fact,
+            cycle_id=cycle_id,
+            updated_since=updated_since,
+            period_in_days=period_in_days,
+            timeout=timeout,
+        )
+        if stream_batch_size > 0:
+            return iter_fact_by_cycle(batch_size=stream_batch_size, **kwargs)
+        return [fetch_fact_by_cycle(**kwargs)]
+
+    def fetch(entity: str, fact: str, cycle_id: str) -> int:
+        attempt = 0
+        while True:
+            rate_limiter.acquire()
+            records = 0
+            try:
+                with pool.session() as session:
+                    for batch in fetch_batches(session, fact, cycle_id):
+                        consume(entity, batch)
+                        records += len(batch)
+            except RateLimitedError as e:
+                # o 429 chega antes do corpo: nada foi consumido ainda
+                attempt += 1
+                if attempt > max_429_retries:
+                    raise
+                pause = rate_limiter.throttle(e.retry_after)
+                logger.warning(
+                    "Rate limited, pausing requests",
+                    extra={"entity": fact, "cycle_id": cycle_id, "status_code": 429, "retry_after": pause},
+                )
+                continue
+
+            rate_limiter.success()
+            return records
+
+    # não submete tudo de uma vez: com milhares de ciclos, só 2x concurrency
+    # tarefas ficam no executor (uma falha não deixa milhares para cancelar)
+    tasks = iter([(entity, fact, cid) for entity, fact in facts for cid in cycle_ids])
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="onyou-fetch")
+    in_flight: Dict[Future, str] = {}
+    totals: Dict[str, int] = {entity: 0 for entity, _ in facts}
+
+    def submit_next() -> bool:
+        task = next(tasks, None)
+        if task is None:
+            return False
+        entity, fact, cid = task
+        in_flight[executor.submit(fetch, entity, fact, cid)] = entity
+        return True
+
+    try:
+        for _ in range(concurrency * 2):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                entity = in_flight.pop(future)
+                totals[entity] += future.result()
+                submit_next()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=True)
+        pool.close()
+
+    return totals
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from typing import Optional
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
 
 from google.cloud import storage
 
+logger = logging.getLogger("onyou_ingest")
+
 
 def get_client() -> storage.Client:
     return storage.Client()
@@ -30,3 +36,42 @@ def upload_file(bucket: str, blob_path: str, local_path: str, content_type: str
     b = client.bucket(bucket)
     blob = b.blob(blob_path)
     blob.upload_from_filename(local_path, content_type=content_type)
+
+
+class BackgroundUploader:
+    """
+    Envia arquivos locais ao GCS em threads enquanto a extração continua.
+    Cada arquivo é apagado após o upload (o /tmp do Cloud Run ocupa memória)
+    e no máximo 2x max_workers ficam na fila: submit() bloqueia se o upload
+    ficar para trás. close() espera tudo e propaga o primeiro erro.
+    """
+
+    def __init__(self, bucket: str, max_workers: int = 2):
+        self.bucket = bucket
+        self._client = get_client()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gcs-upload")
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._futures: List[Future] = []
+
+    def submit(self, local_path: str, blob_path: str, entity: str = "") -> None:
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._upload, local_path, blob_path, entity)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def close(self) -> None:
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _upload(self, local_path: str, blob_path: str, entity: str) -> None:
+        blob = self._client.bucket(self.bucket).blob(blob_path)
+        blob.upload_from_filename(local_path, content_type="application/octet-stream")
+        os.remove(local_path)
+        logger.info("Uploaded parquet", extra={"entity": entity, "gcs_path": f"gs://{self.bucket}/{blob_path}"})
@@ -5,20 +5,28 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 
-def build_session() -> requests.Session:
+def build_session(retry_429: bool = True, pool_maxsize: int = 10) -> requests.Session:
+    """
+    retry_429=False devolve o 429 ao chamador em vez de repetir dentro da
+    sessão: o fetcher concorrente trata o 429 no rate limiter compartilhado,
+    para todas as threads recuarem juntas.
+    """
     session = requests.Session()
 
+    status_forcelist = (429, 500, 502, 503, 504) if retry_429 else (500, 502, 503, 504)
     retry = Retry(
         total=6,
         connect=6,
         read=6,
         backoff_factor=0.8,
-        status_forcelist=(429, 500, 502, 503, 504),
+        status_forcelist=status_forcelist,
         allowed_methods=("GET", "PUT"),
         raise_on_status=False,
+        # o urllib3 repete 429 com Retry-After mesmo fora do status_forcelist
+        respect_retry_after_header=retry_429,
     )
 
-    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=10)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
 
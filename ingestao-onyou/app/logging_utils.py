@@ -19,7 +19,8 @@ class JsonFormatter(logging.Formatter):
             payload["exc_info"] = self.formatException(record.exc_info)
 
         # extras (if provided)
-        for k in ("entity", "url", "status_code", "records", "gcs_path", "process_id"):
+        for k in ("entity", "url", "status_code", "records", "gcs_path", "process_id", "cycle_id", "retry_after",
+                  "updated_since", "full_refresh", "schema_version", "fields"):
             if hasattr(record, k):
                 payload[k] = getattr(record, k)
 
@@ -2,8 +2,8 @@ from __future__ import annotations
 
 import os
 import uuid
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 from .config import Settings
 from .logging_utils import setup_logging
@@ -11,33 +11,20 @@ from .http_client import build_session
 from .auth import refresh_token
 from .api import (
     fetch_dimension_export,
-    fetch_fact_by_cycle,
     fetch_deletions,
+    iter_dimension_export,
+    iter_deletions,
 )
-from .parquet_writer import write_parquet_files
-from .gcs import upload_file
+from .fetcher import RateLimiter, fetch_facts_by_cycle
+from .parquet_writer import ParquetSink
+from .gcs import BackgroundUploader
+from .state import DimensionState, parse_iso_dt
+from .schema_registry import SchemaRegistry
 
 
 def _gcs_entity_prefix(s: Settings, entity: str) -> str:
     return f"{s.gcs_prefix}/{entity}/dt={s.dt}/{s.dt_ingestao}/{s.id_execucao}"
 
-def _parse_iso_dt(value: str) -> Optional[datetime]:
-    """
-    Parse best-effort timestamps from API.
-    Aceita formatos com Z e com offset +00:00.
-    """
-    if not value:
-        return None
-    v = value.strip()
-    try:
-        if v.endswith("Z"):
-            v = v[:-1] + "+00:00"
-        # datetime.fromisoformat não aceita bem frações com 'Z' mas aceita com +00:00
-        return datetime.fromisoformat(v)
-    except Exception:
-        return None
-
-
 def _facts_updated_since(settings: Settings) -> str:
     """
     Igual ao seu código:
@@ -50,19 +37,23 @@ def _facts_updated_since(settings: Settings) -> str:
     return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+def _cycles_min_end_date(settings: Settings) -> date:
+    """data_min = hoje - 45 dias (onde hoje já é date(now)-2)"""
+    hoje = datetime.now(timezone.utc).date() - timedelta(days=settings.facts_updated_since_offset_days)
+    return hoje - timedelta(days=settings.cycles_enddate_keep_days)
+
+
 def _cycles_ids_to_process(cycles: List[Dict[str, Any]], settings: Settings) -> List[str]:
     """
-    data_min = hoje - 45 dias (onde hoje já é date(now)-2)
     filtra por cycleEndDate >= data_min
     """
-    hoje = datetime.now(timezone.utc).date() - timedelta(days=settings.facts_updated_since_offset_days)
-    data_min = hoje - timedelta(days=settings.cycles_enddate_keep_days)
+    data_min = _cycles_min_end_date(settings)
 
     ids: List[str] = []
     for c in cycles:
         cid = c.get("id")
         end_raw = c.get("cycleEndDate")
-        end_dt = _parse_iso_dt(str(end_raw)) if end_raw is not None else None
+        end_dt = parse_iso_dt(str(end_raw)) if end_raw is not None else None
         if cid and end_dt is not None and end_dt.date() >= data_min:
             ids.append(str(cid))
 
@@ -80,35 +71,49 @@ def _cycles_ids_to_process(cycles: List[Dict[str, Any]], settings: Settings) ->
     return unique_ids
 
 
-def _upload_records_as_parquet(
+def _open_sink(
     settings: Settings,
-    logger,
+    uploader: BackgroundUploader,
     entity: str,
-    records: List[Dict[str, Any]],
-) -> None:
-    tmp_dir = f"/tmp/onyou/{entity}"
-    local_files = write_parquet_files(
-        records=records,
+    schemas: Optional[SchemaRegistry] = None,
+) -> ParquetSink:
+    """Sink da entity: cada arquivo fechado segue em background para o GCS."""
+    gcs_prefix = _gcs_entity_prefix(settings, entity)
+    return ParquetSink(
         entity=entity,
         id_execucao=settings.id_execucao,
         dt_ingestao=settings.dt_ingestao,
-        out_dir=tmp_dir,
+        out_dir=f"/tmp/onyou/{entity}",
         compression=settings.parquet_compression,
         max_records_per_file=settings.max_records_per_file,
+        row_group_records=settings.parquet_row_group_records,
+        on_file_closed=lambda path: uploader.submit(path, f"{gcs_prefix}/{os.path.basename(path)}", entity),
+        schema_registry=schemas,
     )
 
-    gcs_prefix = _gcs_entity_prefix(settings, entity)
-    for lf in local_files:
-        blob_path = f"{gcs_prefix}/{os.path.basename(lf)}"
-        upload_file(settings.gcs_bucket, blob_path, lf, content_type="application/octet-stream")
-        logger.info(
-            "Uploaded parquet",
-            extra={
-                "entity": entity,
-                "gcs_path": f"gs://{settings.gcs_bucket}/{blob_path}",
-                "id_execucao": settings.id_execucao,
-            },
+
+def _upload_records_as_parquet(
+    settings: Settings,
+    uploader: BackgroundUploader,
+    entity: str,
+    batches: Iterable[List[Dict[str, Any]]],
+    schemas: Optional[SchemaRegistry] = None,
+) -> int:
+    """Grava os lotes da entity (um só, sem streaming) e retorna o total de registros."""
+    sink = _open_sink(settings, uploader, entity, schemas)
+    for records in batches:
+        sink.write(records)
+    sink.close()
+    return sink.records
+
+
+def _collect_cycles(batches: Iterable[List[Dict[str, Any]]], out: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """Repassa os lotes da dimensão cycle guardando só o que a seleção de ciclos usa."""
+    for records in batches:
+        out.extend(
+            {"id": c.get("id"), "cycleEndDate": c.get("cycleEndDate")} for c in records if isinstance(c, dict)
         )
+        yield records
 
 
 def run() -> None:
@@ -119,7 +124,39 @@ def run() -> None:
     logger.info("Starting onyou ingest job", extra={"id_execucao": settings.id_execucao})
 
     session = build_session()
+    uploader = BackgroundUploader(settings.gcs_bucket, max_workers=settings.upload_workers)
+
+    state = None
+    if settings.dim_incremental:
+        state = DimensionState(settings.gcs_bucket, f"{settings.gcs_prefix}/_state/dimensions.json").load()
+
+    schemas = None
+    if settings.schema_registry:
+        schemas = SchemaRegistry(settings.gcs_bucket, f"{settings.gcs_prefix}/_state/schemas", settings.id_execucao)
 
+    try:
+        _run(settings, logger, session, uploader, state, schemas)
+    finally:
+        # espera os uploads pendentes (e propaga falha de upload)
+        uploader.close()
+
+    # watermarks e schemas só avançam depois de todos os arquivos no GCS
+    if state is not None:
+        state.save()
+    if schemas is not None:
+        schemas.save()
+
+    logger.info("Job completed successfully", extra={"id_execucao": settings.id_execucao})
+
+
+def _run(
+    settings: Settings,
+    logger,
+    session,
+    uploader: BackgroundUploader,
+    state: Optional[DimensionState],
+    schemas: Optional[SchemaRegistry],
+) -> None:
     # ----- auth -----
     logger.info("Refreshing auth token", extra={"id_execucao": settings.id_execucao})
     token = refresh_token(
@@ -130,7 +167,7 @@ def run() -> None:
         timeout=settings.onyou_timeout_seconds,
     )
 
-    # ----- dimensions (updatedSince fixo, igual ao seu script) -----
+    # ----- dimensions (delta desde o watermark; full refresh com as datas fixas) -----
     dims_cfg = [
         ("cycle", "cycle", settings.dim_cycle_updated_since),
         ("structure", "structure", settings.dim_structure_updated_since),
@@ -139,24 +176,60 @@ def run() -> None:
     ]
 
     cycles_records: List[Dict[str, Any]] = []
+    overlap = timedelta(minutes=settings.dim_watermark_overlap_minutes)
+
+    for entity, dim_name, default_updated_since in dims_cfg:
+        plan = {"updated_since": default_updated_since, "full": True}
+        if state is not None:
+            plan = state.plan(
+                dim_name,
+                default_updated_since,
+                full_refresh_days=settings.dim_full_refresh_days,
+                force_full_refresh=settings.dim_force_full_refresh,
+                now=datetime.now(timezone.utc),
+            )
 
-    for entity, dim_name, updated_since in dims_cfg:
-        logger.info("Fetching dimension", extra={"entity": entity, "id_execucao": settings.id_execucao})
-        records = fetch_dimension_export(
+        logger.info(
+            "Fetching dimension",
+            extra={
+                "entity": entity,
+                "updated_since": plan["updated_since"],
+                "full_refresh": plan["full"],
+                "id_execucao": settings.id_execucao,
+            },
+        )
+        requested_at = datetime.now(timezone.utc)
+        kwargs = dict(
             session=session,
             base_url=settings.onyou_base_url,
             subscription_key=settings.onyou_subscription_key,
             token=token,
             dimension=dim_name,
-            updated_since=updated_since,
+            updated_since=plan["updated_since"],
             timeout=settings.onyou_timeout_seconds,
         )
-        logger.info("Fetched dimension", extra={"entity": entity, "records": len(records), "id_execucao": settings.id_execucao})
+        if settings.onyou_stream_batch_size > 0:
+            batches = iter_dimension_export(batch_size=settings.onyou_stream_batch_size, **kwargs)
+        else:
+            batches = [fetch_dimension_export(**kwargs)]
 
+        dim_cycles: List[Dict[str, Any]] = []
         if dim_name == "cycle":
-            cycles_records = records
+            batches = _collect_cycles(batches, dim_cycles)
 
-        _upload_records_as_parquet(settings, logger, entity, records)
+        records = _upload_records_as_parquet(settings, uploader, entity, batches, schemas)
+        logger.info("Fetched dimension", extra={"entity": entity, "records": records, "id_execucao": settings.id_execucao})
+
+        if dim_name == "cycle":
+            cycles_records = dim_cycles
+            if state is not None:
+                # o delta não traz ciclos ativos sem alteração: usa o cache
+                state.merge_cycles(dim_cycles, full=plan["full"])
+                state.prune_cycles(_cycles_min_end_date(settings))
+                cycles_records = state.cycle_records()
+
+        if state is not None:
+            state.mark(dim_name, requested_at, overlap, full=plan["full"], id_execucao=settings.id_execucao)
 
     # ----- facts (igual ao seu script: hoje-2 + periodInDays=7) -----
     updated_since_facts = _facts_updated_since(settings)
@@ -165,46 +238,31 @@ def run() -> None:
     cycle_ids = _cycles_ids_to_process(cycles_records, settings)
     logger.info("Cycles to process for facts", extra={"entity": "facts", "records": len(cycle_ids), "id_execucao": settings.id_execucao})
 
-    # Answers
-    all_answers: List[Dict[str, Any]] = []
-    for cid in cycle_ids:
-        recs = fetch_fact_by_cycle(
-            session=session,
-            base_url=settings.onyou_base_url,
-            subscription_key=settings.onyou_subscription_key,
-            token=token,
-            fact="evaluation/answer",
-            cycle_id=cid,
-            updated_since=updated_since_facts,
-            period_in_days=period,
-            timeout=settings.onyou_timeout_seconds,
-        )
-        all_answers.extend(recs)
-
-    logger.info("Fetched answers", extra={"entity": "answers", "records": len(all_answers), "id_execucao": settings.id_execucao})
-    _upload_records_as_parquet(settings, logger, "answers", all_answers)
-
-    # Ratings
-    all_ratings: List[Dict[str, Any]] = []
-    for cid in cycle_ids:
-        recs = fetch_fact_by_cycle(
-            session=session,
-            base_url=settings.onyou_base_url,
-            subscription_key=settings.onyou_subscription_key,
-            token=token,
-            fact="evaluation/rating",
-            cycle_id=cid,
-            updated_since=updated_since_facts,
-            period_in_days=period,
-            timeout=settings.onyou_timeout_seconds,
-        )
-        all_ratings.extend(recs)
+    # Answers + Ratings: pares (fact, ciclo) em paralelo; cada payload (ou
+    # lote, em streaming) vai direto para o sink da entity
+    sinks = {entity: _open_sink(settings, uploader, entity, schemas) for entity in ("answers", "ratings")}
+    fetch_facts_by_cycle(
+        [("answers", "evaluation/answer"), ("ratings", "evaluation/rating")],
+        cycle_ids,
+        consume=lambda entity, records: sinks[entity].write(records),
+        base_url=settings.onyou_base_url,
+        subscription_key=settings.onyou_subscription_key,
+        token=token,
+        updated_since=updated_since_facts,
+        period_in_days=period,
+        timeout=settings.onyou_timeout_seconds,
+        concurrency=settings.facts_fetch_concurrency,
+        rate_limiter=RateLimiter(settings.onyou_max_requests_per_second),
+        max_429_retries=settings.onyou_max_429_retries,
+        stream_batch_size=settings.onyou_stream_batch_size,
+    )
 
-    logger.info("Fetched ratings", extra={"entity": "ratings", "records": len(all_ratings), "id_execucao": settings.id_execucao})
-    _upload_records_as_parquet(settings, logger, "ratings", all_ratings)
+    for entity, sink in sinks.items():
+        sink.close()
+        logger.info(f"Fetched {entity}", extra={"entity": entity, "records": sink.records, "id_execucao": settings.id_execucao})
 
     # Deletions
-    deletions = fetch_deletions(
+    kwargs = dict(
         session=session,
         base_url=settings.onyou_base_url,
         subscription_key=settings.onyou_subscription_key,
@@ -213,11 +271,13 @@ def run() -> None:
         period_in_days=period,
         timeout=settings.onyou_timeout_seconds,
     )
+    if settings.onyou_stream_batch_size > 0:
+        batches = iter_deletions(batch_size=settings.onyou_stream_batch_size, **kwargs)
+    else:
+        batches = [fetch_deletions(**kwargs)]
 
-    logger.info("Fetched deletions", extra={"entity": "deletions", "records": len(deletions), "id_execucao": settings.id_execucao})
-    _upload_records_as_parquet(settings, logger, "deletions", deletions)
-
-    logger.info("Job completed successfully", extra={"id_execucao": settings.id_execucao})
+    deletions = _upload_records_as_parquet(settings, uploader, "deletions", batches, schemas)
+    logger.info("Fetched deletions", extra={"entity": "deletions", "records": deletions, "id_execucao": settings.id_execucao})
 
 
 if __name__ == "__main__":
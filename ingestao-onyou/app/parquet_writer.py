@@ -1,24 +1,18 @@
 from __future__ import annotations
 
+import logging
 import os
+import threading
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, List, Tuple
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
 
 import pyarrow as pa
 import pyarrow.parquet as pq
 
+from .schema_registry import SchemaRegistry
 
-def _now_utc_iso() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
-
-
-def _chunk_records(records: List[Dict[str, Any]], max_records: int) -> Iterable[Tuple[int, List[Dict[str, Any]]]]:
-    if max_records <= 0:
-        yield 0, records
-        return
-    for i in range(0, len(records), max_records):
-        yield i // max_records, records[i : i + max_records]
+logger = logging.getLogger("onyou_ingest")
 
 
 def write_parquet_files(
@@ -34,36 +28,186 @@ def write_parquet_files(
     Gera 1..N arquivos parquet em out_dir e retorna a lista de paths locais.
     Mantém nested structures (dict/list) sem flatten.
     """
-    os.makedirs(out_dir, exist_ok=True)
-    ingestion_ts = _now_utc_iso()
-
-    local_paths: List[str] = []
-
-    for part_idx, chunk in _chunk_records(records, max_records_per_file):
-        # adiciona auditoria SEM alterar campos originais
-        enriched: List[Dict[str, Any]] = []
-        for r in chunk:
-            if not isinstance(r, dict):
-                # fallback: guarda bruto
-                r = {"_raw": r}
-            rr = dict(r)
-            rr["dt_ingestao"] = dt_ingestao
-            rr["id_execucao"] = id_execucao
-            enriched.append(rr)
-
-        table = pa.Table.from_pylist(enriched)
-
-        filename = f"{entity}_part={part_idx:05d}_{uuid.uuid4().hex}.parquet"
-        local_path = os.path.join(out_dir, filename)
-
-        pq.write_table(
-            table,
-            local_path,
-            compression=compression,
+    sink = ParquetSink(
+        entity=entity,
+        id_execucao=id_execucao,
+        dt_ingestao=dt_ingestao,
+        out_dir=out_dir,
+        compression=compression,
+        max_records_per_file=max_records_per_file,
+    )
+    sink.write(records)
+    return sink.close()
+
+
+class ParquetSink:
+    """
+    Sink Parquet em streaming por entity: recebe os payloads conforme chegam
+    (ex.: um por ciclo), converte cada um em Arrow e grava em um ParquetWriter
+    aberto, rolando para o próximo arquivo a cada max_records_per_file
+    registros. Cada arquivo fechado vai para on_file_closed (ex.: o
+    BackgroundUploader); sem callback, os paths ficam no retorno de close().
+
+    Payloads pequenos são acumulados até row_group_records antes de virar um
+    row group. Se um payload trouxer campos novos ou tipos incompatíveis com
+    o arquivo aberto, o arquivo é fechado e o próximo nasce com o schema novo.
+    Com schema_registry, a conversão usa o schema registrado da entity (sem
+    inferência a cada payload) e os arquivos só mudam de schema quando o
+    registro evolui. write() e close() podem ser chamados de várias threads.
+    """
+
+    def __init__(
+        self,
+        entity: str,
+        id_execucao: str,
+        dt_ingestao: Any,
+        out_dir: str,
+        compression: str,
+        max_records_per_file: int,
+        row_group_records: int = 50_000,
+        on_file_closed: Optional[Callable[[str], None]] = None,
+        schema_registry: Optional[SchemaRegistry] = None,
+    ):
+        self.entity = entity
+        self.id_execucao = id_execucao
+        self.dt_ingestao = dt_ingestao
+        self.out_dir = out_dir
+        self.compression = compression
+        self.max_records_per_file = max_records_per_file
+        self.row_group_records = row_group_records
+        if max_records_per_file > 0:
+            self.row_group_records = min(row_group_records, max_records_per_file)
+        self.on_file_closed = on_file_closed
+        self.schema_registry = schema_registry
+
+        self.records = 0
+        self.local_paths: List[str] = []
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._path: Optional[str] = None
+        self._rows_in_file = 0
+        self._part_idx = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write(self, records: List[Any]) -> None:
+        if not records:
+            return
+        table = self._to_table(records)
+        with self._lock:
+            self._pending.append(table)
+            self._pending_rows += len(records)
+            self.records += len(records)
+            if self._pending_rows >= self.row_group_records:
+                self._flush()
+
+    def close(self) -> List[str]:
+        """Grava o que estiver pendente, fecha o arquivo aberto e retorna os paths gerados."""
+        with self._lock:
+            self._flush()
+            self._close_file()
+        return self.local_paths
+
+    def _to_table(self, records: List[Any]) -> pa.Table:
+        # auditoria como colunas Arrow: os dicts originais não são copiados
+        rows = [r if isinstance(r, dict) else {"_raw": r} for r in records]
+        if self.schema_registry is not None:
+            table = self.schema_registry.to_table(self.entity, rows)
+        else:
+            table = pa.Table.from_pylist(rows)
+        for col in ("dt_ingestao", "id_execucao"):
+            if col in table.column_names:
+                table = table.drop_columns([col])
+        n = table.num_rows
+        table = table.append_column("dt_ingestao", pa.array([self.dt_ingestao] * n))
+        return table.append_column("id_execucao", pa.array([self.id_execucao] * n, type=pa.string()))
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_rows = self._pending, [], 0
+        try:
+            tables = [pa.concat_tables(pending, promote_options="permissive")]
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # structs com campos diferentes não se unificam: um a um
+            tables = pending
+        for table in tables:
+            self._write_table(table)
+
+    def _write_table(self, table: pa.Table) -> None:
+        if self._writer is not None:
+            conformed = _conform(table, self._writer.schema)
+            if conformed is None:
+                logger.info("Schema changed, starting new parquet file", extra={"entity": self.entity})
+                self._close_file()
+            else:
+                table = conformed
+
+        offset = 0
+        while offset < table.num_rows:
+            if self._writer is None:
+                self._open_file(table.schema)
+            length = table.num_rows - offset
+            if self.max_records_per_file > 0:
+                length = min(length, self.max_records_per_file - self._rows_in_file)
+            self._writer.write_table(table.slice(offset, length))
+            self._rows_in_file += length
+            offset += length
+            if self.max_records_per_file > 0 and self._rows_in_file >= self.max_records_per_file:
+                self._close_file()
+
+    def _open_file(self, schema: pa.Schema) -> None:
+        filename = f"{self.entity}_part={self._part_idx:05d}_{uuid.uuid4().hex}.parquet"
+        self._path = os.path.join(self.out_dir, filename)
+        self._writer = pq.ParquetWriter(
+            self._path,
+            schema,
+            compression=self.compression,
             use_dictionary=True,
             write_statistics=True,
         )
+        self._rows_in_file = 0
+        self._part_idx += 1
+
+    def _close_file(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        path = self._path
+        self._writer, self._path = None, None
+        self.local_paths.append(path)
+        if self.on_file_closed is not None:
+            self.on_file_closed(path)
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> Optional[pa.Table]:
+    """
+    Ajusta a tabela ao schema do arquivo aberto (colunas ausentes viram null).
+    Retorna None se houver coluna nova ou tipo que não converte.
+    """
+    if table.schema.equals(schema):
+        return table
+    if not set(table.column_names) <= set(schema.names):
+        return None
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(table.num_rows, type=field.type))
+            continue
+        column = table.column(field.name)
+        if column.type != field.type:
+            if not pa.types.is_null(column.type) and not _is_safe_widening(column.type, field.type):
+                return None
+            try:
+                column = column.cast(field.type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                return None
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
 
-        local_paths.append(local_path)
 
-    return local_paths
+def _is_safe_widening(source: pa.DataType, target: pa.DataType) -> bool:
+    # int -> double é a divergência comum entre payloads (ex.: 1 vs 1.5)
+    return pa.types.is_integer(source) and pa.types.is_floating(target)
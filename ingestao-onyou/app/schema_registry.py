@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import pyarrow as pa
+
+from .gcs import download_text, upload_bytes
+
+logger = logging.getLogger("onyou_ingest")
+
+_CONVERSION_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError)
+
+
+class SchemaRegistry:
+    """
+    Schema Arrow por entity (answers, ratings, cycle, ...), um JSON por
+    entity no GCS ({prefix}/{entity}.json) com o schema serializado (IPC).
+
+    to_table() converte os registros com o schema registrado, sem inferência
+    (from_pylist com schema explícito), e todos os arquivos da entity saem
+    com os mesmos tipos e a mesma ordem de colunas. Quando um lote não cabe
+    no schema (campo novo, double em coluna inteira ou valor que a conversão
+    rejeita), o schema do lote é inferido e unificado com o registrado:
+
+    - coluna só com null assume o tipo que chegar
+    - int + double vira double
+    - campos novos entram no fim (nullable), também dentro de structs
+    - qualquer outro conflito (ex.: int vs string, struct vs lista) vira
+      string; os valores dessa coluna passam a ser gravados como JSON
+
+    A verificação antes da conversão só olha o primeiro nível (chaves de
+    cada registro e floats nas colunas inteiras): percorrer structs e listas
+    em Python custa mais do que a inferência que o registro evita. Campos
+    novos e doubles dentro de structs só entram quando algum lote evolui o
+    schema por outro motivo; até lá, são descartados/truncados.
+
+    O schema nunca perde colunas. As alterações só são gravadas em save(),
+    no fim de uma execução sem erro. to_table() pode ser chamado de várias
+    threads.
+    """
+
+    def __init__(self, bucket: str, prefix: str, id_execucao: str = ""):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.id_execucao = id_execucao
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._changed: set = set()
+        self._lock = threading.Lock()
+
+    def schema(self, entity: str) -> Optional[pa.Schema]:
+        return self._entry(entity)["schema"]
+
+    def to_table(self, entity: str, rows: List[Dict[str, Any]]) -> pa.Table:
+        entry = self._entry(entity)
+        if entry["schema"] is not None and _fits(rows, entry["names"], entry["int_columns"]):
+            try:
+                return _from_rows(rows, entry["schema"])
+            except _CONVERSION_ERRORS:
+                pass
+        return _from_rows(rows, self._evolve(entity, rows))
+
+    def save(self) -> None:
+        with self._lock:
+            changed, self._changed = sorted(self._changed), set()
+        for entity in changed:
+            entry = self._entries[entity]
+            schema: pa.Schema = entry["schema"]
+            data = {
+                "entity": entity,
+                "version": entry["version"],
+                "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "id_execucao": self.id_execucao,
+                "fields": schema.to_string(show_schema_metadata=False).splitlines(),
+                "schema": base64.b64encode(schema.serialize().to_pybytes()).decode("ascii"),
+            }
+            upload_bytes(
+                self.bucket,
+                self._blob_path(entity),
+                json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"),
+                content_type="application/json",
+            )
+            logger.info(
+                "Saved entity schema",
+                extra={
+                    "entity": entity,
+                    "records": len(schema),
+                    "schema_version": entry["version"],
+                    "gcs_path": f"gs://{self.bucket}/{self._blob_path(entity)}",
+                },
+            )
+
+    def _blob_path(self, entity: str) -> str:
+        return f"{self.prefix}/{entity}.json"
+
+    def _entry(self, entity: str) -> Dict[str, Any]:
+        entry = self._entries.get(entity)
+        if entry is not None:
+            return entry
+        with self._lock:
+            if entity not in self._entries:
+                self._entries[entity] = self._load(entity)
+            return self._entries[entity]
+
+    def _load(self, entity: str) -> Dict[str, Any]:
+        schema, version = None, 0
+        text = download_text(self.bucket, self._blob_path(entity))
+        if text:
+            data = json.loads(text)
+            schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(data["schema"])))
+            version = int(data.get("version", 0))
+        logger.info(
+            "Loaded entity schema",
+            extra={
+                "entity": entity,
+                "records": len(schema) if schema is not None else 0,
+                "schema_version": version,
+                "gcs_path": f"gs://{self.bucket}/{self._blob_path(entity)}",
+            },
+        )
+        return _make_entry(schema, version)
+
+    def _evolve(self, entity: str, rows: List[Dict[str, Any]]) -> pa.Schema:
+        inferred = pa.Table.from_pylist(rows).schema
+        with self._lock:
+            entry = self._entries[entity]
+            current: Optional[pa.Schema] = entry["schema"]
+            unified = inferred if current is None else _unify(current, inferred)
+            if current is not None and unified.equals(current):
+                # o lote não falhou por schema: a conversão propaga o erro
+                return current
+
+            self._entries[entity] = _make_entry(unified, entry["version"] + 1)
+            self._changed.add(entity)
+
+        known = set(current.names) if current is not None else set()
+        logger.info(
+            "Schema evolved",
+            extra={
+                "entity": entity,
+                "records": len(rows),
+                "schema_version": entry["version"] + 1,
+                "fields": [f.name for f in unified if f.name not in known or not f.equals(current.field(f.name))],
+            },
+        )
+        return unified
+
+
+def _make_entry(schema: Optional[pa.Schema], version: int) -> Dict[str, Any]:
+    fields = list(schema) if schema is not None else []
+    return {
+        "schema": schema,
+        "version": version,
+        "names": frozenset(f.name for f in fields),
+        "int_columns": [f.name for f in fields if pa.types.is_integer(f.type)],
+    }
+
+
+def _fits(rows: List[Dict[str, Any]], names: FrozenSet[str], int_columns: List[str]) -> bool:
+    """
+    O que a conversão com schema explícito não acusa, no primeiro nível:
+    chaves fora do schema (descartadas) e float em coluna inteira (truncado).
+    """
+    if not all(names.issuperset(row) for row in rows):
+        return False
+    for name in int_columns:
+        for row in rows:
+            if type(row.get(name)) is float:
+                return False
+    return True
+
+
+def _from_rows(rows: List[Dict[str, Any]], schema: pa.Schema) -> pa.Table:
+    try:
+        return pa.Table.from_pylist(rows, schema=schema)
+    except _CONVERSION_ERRORS:
+        # colunas que viraram string por conflito: o valor vai como JSON
+        strings = [f.name for f in schema if pa.types.is_string(f.type)]
+        if not strings:
+            raise
+        return pa.Table.from_pylist([_stringify(row, strings) for row in rows], schema=schema)
+
+
+def _stringify(row: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+    out = None
+    for name in names:
+        value = row.get(name)
+        if value is not None and not isinstance(value, str):
+            if out is None:
+                out = dict(row)
+            out[name] = json.dumps(value, ensure_ascii=False)
+    return row if out is None else out
+
+
+def _unify(current: pa.Schema, inferred: pa.Schema) -> pa.Schema:
+    try:
+        return pa.unify_schemas([current, inferred], promote_options="permissive")
+    except _CONVERSION_ERRORS:
+        pass
+
+    # conflito em alguma coluna: campo a campo, o que não unifica vira string
+    fields = []
+    for field in current:
+        if field.name in inferred.names:
+            field = _unify_field(field, inferred.field(field.name))
+        fields.append(field)
+    fields.extend(f for f in inferred if f.name not in current.names)
+    return pa.schema(fields, metadata=current.metadata)
+
+
+def _unify_field(current: pa.Field, other: pa.Field) -> pa.Field:
+    try:
+        return pa.unify_schemas([pa.schema([current]), pa.schema([other])], promote_options="permissive").field(0)
+    except _CONVERSION_ERRORS:
+        return pa.field(current.name, pa.string())
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from .gcs import download_text, upload_bytes
+
+logger = logging.getLogger("onyou_ingest")
+
+_TS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _format_ts(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime(_TS_FORMAT)
+
+
+class DimensionState:
+    """
+    Estado das exportações de dimensão entre execuções, em um JSON no GCS:
+
+        {
+          "dimensions": {"cycle": {"updated_since": "...", "last_full_refresh": "...", "id_execucao": "..."}},
+          "cycles": {"<id>": "<cycleEndDate>"}
+        }
+
+    - dimensions: último updatedSince bem-sucedido por dimensão (a execução
+      seguinte pede só o delta a partir dele) e a data do último full refresh
+    - cycles: ciclos conhecidos com a data de término. Com a dimensão cycle
+      incremental, o delta não traz ciclos ativos que não mudaram; a lista
+      de ciclos dos facts sai deste cache, atualizado com cada delta. Ciclos
+      sem término válido ficam fora: a seleção dos facts não os usa e, sem
+      data, o prune nunca os removeria
+
+    As alterações só são gravadas em save(), no fim de uma execução sem erro.
+    """
+
+    def __init__(self, bucket: str, blob_path: str):
+        self.bucket = bucket
+        self.blob_path = blob_path
+        self.dimensions: Dict[str, Dict[str, Any]] = {}
+        self.cycles: Dict[str, Any] = {}
+
+    def load(self) -> "DimensionState":
+        text = download_text(self.bucket, self.blob_path)
+        if text:
+            data = json.loads(text)
+            self.dimensions = data.get("dimensions", {})
+            self.cycles = data.get("cycles", {})
+        logger.info(
+            "Loaded dimension state",
+            extra={"entity": "dimensions", "records": len(self.dimensions), "gcs_path": f"gs://{self.bucket}/{self.blob_path}"},
+        )
+        return self
+
+    def plan(
+        self,
+        dimension: str,
+        default_updated_since: str,
+        full_refresh_days: int,
+        force_full_refresh: bool,
+        now: datetime,
+    ) -> Dict[str, Any]:
+        """
+        Decide o updatedSince da dimensão: o watermark salvo (incremental) ou
+        default_updated_since (full) quando não há watermark, quando o full
+        refresh é forçado ou quando o último passou de full_refresh_days.
+        """
+        entry = self.dimensions.get(dimension)
+        full = force_full_refresh or not entry or not entry.get("updated_since")
+        if not full and full_refresh_days > 0:
+            last_full = parse_iso_dt(entry.get("last_full_refresh") or "")
+            full = last_full is None or now - last_full >= timedelta(days=full_refresh_days)
+
+        if full:
+            return {"updated_since": default_updated_since, "full": True}
+        return {"updated_since": entry["updated_since"], "full": False}
+
+    def mark(self, dimension: str, requested_at: datetime, overlap: timedelta, full: bool, id_execucao: str) -> None:
+        """
+        Novo watermark: início da requisição menos `overlap` (registros
+        gravados na API durante a exportação entram na próxima).
+        """
+        entry = self.dimensions.setdefault(dimension, {})
+        entry["updated_since"] = _format_ts(requested_at - overlap)
+        entry["id_execucao"] = id_execucao
+        if full:
+            entry["last_full_refresh"] = _format_ts(requested_at)
+
+    def merge_cycles(self, records: List[Dict[str, Any]], full: bool) -> None:
+        """Atualiza o cache de ciclos; um full refresh substitui o cache inteiro."""
+        if full:
+            self.cycles = {}
+        for c in records:
+            cid = c.get("id")
+            if not cid:
+                continue
+            end = c.get("cycleEndDate")
+            if end is not None and parse_iso_dt(str(end)) is not None:
+                self.cycles[str(cid)] = end
+            else:
+                # término removido no delta: o ciclo sai do cache
+                self.cycles.pop(str(cid), None)
+
+    def cycle_records(self) -> List[Dict[str, Any]]:
+        """
+        Ciclos do cache do término mais recente para o mais antigo: com
+        MAX_CYCLES_PER_RUN, o corte descarta os ciclos mais antigos, não os
+        vistos por último.
+        """
+        def newest_first(item):
+            end = parse_iso_dt(str(item[1])) if item[1] is not None else None
+            return (end is not None, end or datetime.min.replace(tzinfo=timezone.utc))
+
+        items = sorted(self.cycles.items(), key=newest_first, reverse=True)
+        return [{"id": cid, "cycleEndDate": end} for cid, end in items]
+
+    def prune_cycles(self, min_end_date: date) -> None:
+        """
+        Descarta do cache ciclos encerrados antes de min_end_date (nunca mais
+        entram nos facts) e os sem término válido (estado de versões
+        anteriores).
+        """
+        keep = {}
+        for cid, end in self.cycles.items():
+            end_dt = parse_iso_dt(str(end)) if end is not None else None
+            if end_dt is not None and end_dt.date() >= min_end_date:
+                keep[cid] = end
+        self.cycles = keep
+
+    def save(self) -> None:
+        data = {"dimensions": self.dimensions, "cycles": self.cycles}
+        upload_bytes(
+            self.bucket,
+            self.blob_path,
+            json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8"),
+            content_type="application/json",
+        )
+        logger.info(
+            "Saved dimension state",
+            extra={"entity": "dimensions", "records": len(self.dimensions), "gcs_path": f"gs://{self.bucket}/{self.blob_path}"},
+        )
+
+
+def parse_iso_dt(value: str) -> Optional[datetime]:
+    """
+    Parse best-effort de timestamps da API e do estado.
+    Aceita formatos com Z e com offset +00:00; sem offset, assume UTC.
+    """
+    if not value:
+        return None
+    v = value.strip()
+    if v.endswith("Z"):
+        # datetime.fromisoformat não aceita bem frações com 'Z' mas aceita com +00:00
+        v = v[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(v)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+import requests
+
+from app import api
+from app.auth import AuthToken
+
+TOKEN = AuthToken("Bearer x")
+
+
+class _Session:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get(self, url, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.raw = io.BytesIO(self.body)
+        return resp
+
+
+def _fetch(body: bytes):
+    return api.fetch_deletions(_Session(body), "https://api", "key", TOKEN, "2024-01-01", 1, 30)
+
+
+def _stream(body: bytes, batch_size: int = 2):
+    batches = api.iter_deletions(_Session(body), "https://api", "key", TOKEN, "2024-01-01", 1, 30, batch_size)
+    return [record for batch in batches for record in batch]
+
+
+PATHS = [pytest.param(_fetch, id="fetch"), pytest.param(_stream, id="stream")]
+
+
+@pytest.mark.parametrize("read", PATHS)
+@pytest.mark.parametrize("body", [
+    {"payload": []},
+    {"payload": None},
+    {},
+    {"status": "ok", "message": "nothing to report"},
+])
+def test_empty_exports(read, body):
+    assert read(json.dumps(body).encode()) == []
+
+
+@pytest.mark.parametrize("read", PATHS)
+def test_records(read):
+    records = [{"id": i, "score": i + 0.5} for i in range(5)]
+    body = {"meta": {"payload": "ignorado"}, "payload": records, "total": 5}
+
+    assert read(json.dumps(body).encode()) == records
+
+
+@pytest.mark.parametrize("read", PATHS)
+@pytest.mark.parametrize("payload, payload_type", [
+    ({"id": 1}, dict),
+    ("erro", str),
+    (3, int),
+    (True, bool),
+])
+def test_unexpected_payload_type(read, payload, payload_type):
+    with pytest.raises(RuntimeError, match=f"Unexpected payload type for deletions: {payload_type}"):
+        read(json.dumps({"payload": payload}).encode())
+
+
+def test_stream_checks_type_before_first_batch():
+    # payload de objetos com lista dentro: o tipo é do payload, não do item
+    body = json.dumps({"payload": {"items": [{"id": 1}, {"id": 2}, {"id": 3}]}}).encode()
+
+    with pytest.raises(RuntimeError, match="Unexpected payload type for deletions"):
+        _stream(body, batch_size=1)
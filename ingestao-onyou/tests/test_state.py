@@ -0,0 +1,48 @@
+from datetime import date
+
+from app.state import DimensionState
+
+
+def _state(cycles=None):
+    state = DimensionState("bucket", "onyou/_state/dimensions.json")
+    state.cycles = dict(cycles or {})
+    return state
+
+
+def test_open_ended_cycles_are_not_cached():
+    state = _state()
+
+    state.merge_cycles(
+        [
+            {"id": "a", "cycleEndDate": "2024-03-01T00:00:00Z"},
+            {"id": "b", "cycleEndDate": None},
+            {"id": "c"},
+            {"id": "d", "cycleEndDate": "sem data"},
+        ],
+        full=True,
+    )
+
+    assert state.cycles == {"a": "2024-03-01T00:00:00Z"}
+
+
+def test_delta_without_end_date_drops_cached_cycle():
+    state = _state({"a": "2024-03-01T00:00:00Z", "b": "2024-04-01T00:00:00Z"})
+
+    state.merge_cycles([{"id": "a", "cycleEndDate": None}], full=False)
+
+    assert state.cycles == {"b": "2024-04-01T00:00:00Z"}
+
+
+def test_prune_drops_old_and_undated_cycles():
+    # estado gravado por versões que guardavam ciclos sem término
+    state = _state({"old": "2024-01-01", "new": "2024-06-01", "open": None, "bad": "x"})
+
+    state.prune_cycles(date(2024, 3, 1))
+
+    assert state.cycles == {"new": "2024-06-01"}
+
+
+def test_cycle_records_newest_first():
+    state = _state({"a": "2023-01-01T00:00:00Z", "b": None, "c": "2024-06-01T00:00:00Z", "d": "2024-01-01"})
+
+    assert [c["id"] for c in state.cycle_records()] == ["c", "d", "a", "b"]